@@ -8,114 +8,527 @@ Blender で街メッシュをブロック分割するスクリプト
   3. 先頭の BLOCK_SIZE_X, BLOCK_SIZE_Y を好みに変更（メートル単位・BlenderはZ-upなので地面はXY平面）
   4. スクリプトを実行（▶ または Alt+P）
   5. 同じコレクションに Block_0_0, Block_0_1, ... が作成されます
+     （MANIFEST_PATH にブロックごとの AABB・面数・高さ・隣接ブロックの一覧も書き出します）
 
 ※ 実行後、元のオブジェクトは削除されます（残したい場合は DELETE_ORIGINAL = False に変更）
+
+バッチ実行（GUI なし）:
+  blender -b city.blend -P split_city_blocks.py -- --lod 0.5 0.2 --save
+  "--" の後の引数で上の設定を上書きできる（python split_city_blocks.py ではなく Blender から実行する）。
+  バッチ実行で何も選択されていない場合は、シーン内のすべてのメッシュを分割する。
 """
 
+import argparse
+import json
+import os
+import sys
+
 import bpy
+import numpy as np
 
 # ========== ここを編集 ==========
 BLOCK_SIZE_X = 50.0   # X方向のブロック幅（メートル）
 BLOCK_SIZE_Y = 50.0   # Y方向のブロック幅（メートル・BlenderはZ-upなので地面はXY平面）
 DELETE_ORIGINAL = True  # 実行後に元オブジェクトを削除するか
+
+# 面の密度に応じたブロック分割（ADAPTIVE = True のとき）
+#   面数・頂点数が上限を超えるブロックは4分割を繰り返し（Block_ix_iy_q0 ... q3, q01 ...）、
+#   面数が少ないブロックは隣接する 2x2 ブロックと統合する（Block_ix_iy_s1 = 2x2, s2 = 4x4 ...）。
+#   名前の ix, iy は常に BLOCK_SIZE グリッド上の左下のセル。
+ADAPTIVE = False
+MAX_FACES_PER_BLOCK = 20000   # 1ブロックの面数の上限
+MAX_VERTS_PER_BLOCK = 30000   # 1ブロックの頂点数の上限
+MIN_FACES_PER_BLOCK = 500     # これ未満のブロックは隣と統合する
+MIN_BLOCK_SIZE = 6.25         # 分割の最小ブロック幅（メートル）
+MAX_MERGE_LEVEL = 2           # 統合の最大段数（2 なら 4x4 ブロックまで）
+
+# ブロック一覧（AABB・面数・高さ・隣接ブロック）の書き出し先。"//" は .blend ファイルのあるフォルダ
+# 空文字にすると書き出さない。座標はエクスポート後の glTF / three.js 座標（Y-up）
+MANIFEST_PATH = "//city_blocks.json"
+
+# LOD（詳細度を下げたメッシュ）。ブロックごとに Block_ix_iy_LOD1, LOD2, ... を作る
+# 値は元のブロックに対する面数の比率（Decimate モディファイアの ratio）。空なら作らない。例: (0.5, 0.2)
+LOD_RATIOS = ()
 # ================================
 
 
-def get_world_bounds(obj):
+def get_world_coords(obj, local_co=None):
+    """全頂点のワールド座標を (頂点数, 3) の NumPy 配列で返す（foreach_get で一括取得）"""
+    if local_co is None:
+        mesh = obj.data
+        local_co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", local_co)
+        local_co = local_co.reshape(-1, 3)
+    world = np.array(obj.matrix_world, dtype=np.float64)
+    return local_co.astype(np.float64) @ world[:3, :3].T + world[:3, 3]
+
+
+def get_world_bounds(obj, world_co=None):
     """オブジェクトのワールド空間でのAABBを (min_x, min_y, min_z, max_x, max_y, max_z) で返す"""
-    world = obj.matrix_world
-    mesh = obj.data
-    if not mesh.vertices:
+    if not obj.data.vertices:
         return None
-    vs = [world @ v.co for v in mesh.vertices]
-    xs = [v.x for v in vs]
-    ys = [v.y for v in vs]
-    zs = [v.z for v in vs]
-    return (min(xs), min(ys), min(zs), max(xs), max(ys), max(zs))
+    if world_co is None:
+        world_co = get_world_coords(obj)
+    mins = world_co.min(axis=0)
+    maxs = world_co.max(axis=0)
+    return (float(mins[0]), float(mins[1]), float(mins[2]), float(maxs[0]), float(maxs[1]), float(maxs[2]))
+
+
+def get_polygon_loops(mesh):
+    """
+    面ごとのループ情報を一括取得する。
+    返り値: (loop_start, loop_total, loop_vertex)  loop_vertex はループごとの頂点インデックス
+    """
+    n_polys = len(mesh.polygons)
+    loop_start = np.empty(n_polys, dtype=np.int64)
+    loop_total = np.empty(n_polys, dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", loop_start)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    loop_vertex = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", loop_vertex)
+    return loop_start, loop_total, loop_vertex
+
+
+def face_loop_indices(loop_start, loop_total, faces=None):
+    """指定した面（省略時は全ての面）のループインデックスを、面の順に連結して返す"""
+    if faces is not None:
+        loop_start = loop_start[faces]
+        loop_total = loop_total[faces]
+    ends = np.cumsum(loop_total)
+    n = int(ends[-1]) if len(ends) else 0
+    return np.repeat(loop_start - (ends - loop_total), loop_total) + np.arange(n)
+
+
+def polygon_world_centers(world_co, loop_start, loop_total, loop_vertex):
+    """全ての面のワールド空間での中心（頂点の平均）を (面数, 3) の配列で返す"""
+    n_polys = len(loop_start)
+    # 面ごとのループを面の順に並べたときの、各ループの面番号
+    poly_of_loop = np.repeat(np.arange(n_polys), loop_total)
+    verts = world_co[loop_vertex[face_loop_indices(loop_start, loop_total)]]
+    centers = np.empty((n_polys, 3), dtype=np.float64)
+    for axis in range(3):
+        centers[:, axis] = np.bincount(poly_of_loop, weights=verts[:, axis], minlength=n_polys)
+    return centers / loop_total[:, None]
 
 
-def face_world_center(obj, face):
-    """面のワールド空間での中心を返す"""
-    world = obj.matrix_world
+def _face_centers(obj, arrays=None):
+    """
+    面の中心（ワールド座標）とグリッドの原点（AABB の最小 X, Y）を求める。
+    返り値: (centers, min_x, min_y, (loop_start, loop_total, loop_vertex))
+    """
     mesh = obj.data
-    verts = mesh.vertices
-    n = len(face.vertices)
-    cx = cy = cz = 0.0
-    for vi in face.vertices:
-        v = world @ verts[vi].co
-        cx += v.x
-        cy += v.y
-        cz += v.z
-    return (cx / n, cy / n, cz / n)
+    if arrays is None:
+        world_co = get_world_coords(obj)
+        loops = get_polygon_loops(mesh)
+    else:
+        world_co = get_world_coords(obj, arrays["co"])
+        loops = (arrays["loop_start"], arrays["loop_total"], arrays["loop_vertex"])
+    min_x, min_y, _, _, _, _ = get_world_bounds(obj, world_co)
+    return polygon_world_centers(world_co, *loops), min_x, min_y, loops
+
+
+def _group_by_cell(centers, min_x, min_y, block_size_x, block_size_y):
+    """面の中心からセル番号を求め、dict[(ix, iy)] -> 面インデックスの配列 にまとめる"""
+    ix = ((centers[:, 0] - min_x) // block_size_x).astype(np.int64)
+    iy = ((centers[:, 1] - min_y) // block_size_y).astype(np.int64)
+
+    # セル番号でソートし、同じセルの面インデックスをまとめて切り出す
+    keys = ix * (int(iy.max()) + 1) + iy
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    cells = {}
+    for face_indices in np.split(order, starts[1:]):
+        fi = face_indices[0]
+        cells[(int(ix[fi]), int(iy[fi]))] = face_indices
+    return cells
 
 
-def split_mesh_into_blocks(obj, block_size_x, block_size_y):
+def split_mesh_into_blocks(obj, block_size_x, block_size_y, arrays=None):
     """
     メッシュをグリッドブロックごとにグループ化する。
     BlenderはZ-upなので地面はXY平面。X・Yでブロックを区切る。
-    返り値: dict[(ix, iy)] -> set of face indices
+    頂点座標・面中心・セル番号はすべて NumPy で一括計算する。
+    arrays に read_mesh_arrays の結果を渡すと、メッシュの読み込みを省く。
+    返り値: dict[(ix, iy)] -> 面インデックスの配列（昇順の np.ndarray）
     """
-    bounds = get_world_bounds(obj)
-    if bounds is None:
-        return {}
-    min_x, min_y, min_z, max_x, max_y, max_z = bounds
-    world = obj.matrix_world
     mesh = obj.data
-    cells = {}  # (ix, iy) -> set(face_index)
+    if not mesh.vertices or not mesh.polygons:
+        return {}
+    centers, min_x, min_y, _ = _face_centers(obj, arrays)
+    return _group_by_cell(centers, min_x, min_y, block_size_x, block_size_y)
 
-    for fi, face in enumerate(mesh.polygons):
-        cx, cy, cz = face_world_center(obj, face)
-        ix = int((cx - min_x) / block_size_x)
-        iy = int((cy - min_y) / block_size_y)
-        key = (ix, iy)
-        if key not in cells:
-            cells[key] = set()
-        cells[key].add(fi)
 
-    return cells
+def count_block_vertices(loops, faces):
+    """面の集合が使う頂点の数"""
+    loop_start, loop_total, loop_vertex = loops
+    return len(np.unique(loop_vertex[face_loop_indices(loop_start, loop_total, faces)]))
 
 
-def create_block_mesh(obj, face_indices):
+def split_mesh_adaptive(
+    obj,
+    block_size_x,
+    block_size_y,
+    arrays=None,
+    max_faces=MAX_FACES_PER_BLOCK,
+    max_verts=MAX_VERTS_PER_BLOCK,
+    min_faces=MIN_FACES_PER_BLOCK,
+    min_block_size=MIN_BLOCK_SIZE,
+    max_merge_level=MAX_MERGE_LEVEL
+):
     """
-    指定した面インデックスだけを含む新しいメッシュを作成する。
-    頂点はローカル座標のまま（オブジェクトの matrix_world で位置は保たれる）。
-    返り値: (verts_local, faces)  faces は新しい頂点インデックスのリストのリスト
+    面の密度に応じてブロックの大きさを変えてグループ化する。
+    1. BLOCK_SIZE のグリッドで分けた後、面数・頂点数が上限を超えるセルは4分割を繰り返す（四分木）
+    2. 面数が min_faces 未満のセルは、2x2 に揃った範囲ごとに統合する（上限を超えない範囲で max_merge_level 段まで）
+    返り値: dict[キー] -> 面インデックスの配列
+      キーは (ix, iy)、分割したものは (ix, iy, "q013")、統合したものは (ix, iy, "s1") など。
+      名前は block_name(キー) で作る。
     """
     mesh = obj.data
-    used_verts = set()
-    for fi in face_indices:
-        for vi in mesh.polygons[fi].vertices:
-            used_verts.add(vi)
+    if not mesh.vertices or not mesh.polygons:
+        return {}
+    centers, min_x, min_y, loops = _face_centers(obj, arrays)
+    cells = _group_by_cell(centers, min_x, min_y, block_size_x, block_size_y)
+
+    def over_budget(faces):
+        return len(faces) > max_faces or count_block_vertices(loops, faces) > max_verts
+
+    blocks = {}
+    sparse = {}  # 統合候補: (ix, iy) -> 面インデックス
+    dense = set()  # 統合できないセル
+    for (ix, iy), faces in cells.items():
+        if len(faces) < min_faces and not over_budget(faces):
+            sparse[(ix, iy)] = faces
+            continue
+        dense.add((ix, iy))
+        # 四分木で分割（x0, y0, w, h はセルのワールド範囲）
+        stack = [(faces, min_x + ix * block_size_x, min_y + iy * block_size_y, block_size_x, block_size_y, "")]
+        while stack:
+            faces, x0, y0, w, h, path = stack.pop()
+            if not over_budget(faces) or min(w, h) / 2 < min_block_size:
+                blocks[(ix, iy, f"q{path}") if path else (ix, iy)] = faces
+                continue
+            qx = centers[faces, 0] >= x0 + w / 2
+            qy = centers[faces, 1] >= y0 + h / 2
+            quadrant = qx.astype(np.int64) + 2 * qy.astype(np.int64)
+            for q in range(4):
+                sub = faces[quadrant == q]
+                if len(sub):
+                    stack.append((sub, x0 + (q & 1) * w / 2, y0 + (q >> 1) * h / 2, w / 2, h / 2, path + str(q)))
+
+    # 疎なセルを 2x2 単位で統合する。グループ: (gx, gy, 段数) -> (面インデックス, 元のセル一覧)
+    groups = {(ix, iy, 0): (faces, [(ix, iy)]) for (ix, iy), faces in sparse.items()}
+    for level in range(1, max_merge_level + 1):
+        parents = {}
+        for (gx, gy, lv) in groups:
+            if lv == level - 1:
+                parents.setdefault((gx >> 1, gy >> 1), []).append((gx, gy, lv))
+        blocked = {(ix >> level, iy >> level) for ix, iy in dense}
+        for (px, py), members in parents.items():
+            if (px, py) in blocked or any(len(groups[m][0]) >= min_faces for m in members):
+                continue
+            faces = np.sort(np.concatenate([groups[m][0] for m in members]))
+            if over_budget(faces):
+                continue
+            base_cells = [cell for m in members for cell in groups[m][1]]
+            for m in members:
+                del groups[m]
+            groups[(px, py, level)] = (faces, base_cells)
+        # 統合しなかった（できなかった）グループは上の段の統合を止める
+        for (gx, gy, lv), (faces, base_cells) in groups.items():
+            if lv == level - 1 or len(faces) >= min_faces:
+                dense.update(base_cells)
+
+    for (gx, gy, level), (faces, base_cells) in groups.items():
+        if len(base_cells) == 1:
+            blocks[base_cells[0]] = faces
+        else:
+            blocks[(gx << level, gy << level, f"s{level}")] = faces
+    return blocks
 
-    old_to_new = {}
-    verts_local = []
-    for i, vi in enumerate(sorted(used_verts)):
-        old_to_new[vi] = i
-        verts_local.append(mesh.vertices[vi].co.copy())
 
-    faces = []
-    for fi in face_indices:
-        poly = mesh.polygons[fi]
-        new_face = [old_to_new[vi] for vi in poly.vertices]
-        faces.append(new_face)
+def block_name(key):
+    """ブロックのキーからオブジェクト名を作る（(3, 4) -> Block_3_4、(3, 4, "q01") -> Block_3_4_q01）"""
+    return "Block_" + "_".join(str(k) for k in key)
 
-    return verts_local, faces
 
+def read_mesh_arrays(mesh):
+    """
+    ブロック分割に使うメッシュのデータを foreach_get で一括取得する。
+    返り値: dict
+      co            (頂点数, 3) ローカル座標
+      loop_start, loop_total  面ごとのループ範囲
+      loop_vertex   ループごとの頂点インデックス
+      material_index, use_smooth  面ごとの属性
+      uvs           UVレイヤー名 -> (ループ数, 2)
+      normals       カスタム分割法線 (ループ数, 3)。カスタム法線がなければ None
+    """
+    n_verts = len(mesh.vertices)
+    n_polys = len(mesh.polygons)
+    n_loops = len(mesh.loops)
+
+    co = np.empty(n_verts * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loop_start, loop_total, loop_vertex = get_polygon_loops(mesh)
+    material_index = np.empty(n_polys, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_index)
+    use_smooth = np.empty(n_polys, dtype=bool)
+    mesh.polygons.foreach_get("use_smooth", use_smooth)
 
-def create_mesh_from_verts_faces(verts_local, faces, name):
-    """頂点リストと面リストから Blender メッシュを作成"""
+    uvs = {}
+    for layer in mesh.uv_layers:
+        uv = np.empty(n_loops * 2, dtype=np.float32)
+        layer.data.foreach_get("uv", uv)
+        uvs[layer.name] = uv.reshape(-1, 2)
+
+    normals = None
+    if mesh.has_custom_normals:
+        normals = np.empty(n_loops * 3, dtype=np.float32)
+        if hasattr(mesh, "corner_normals"):
+            # Blender 4.1 以降
+            mesh.corner_normals.foreach_get("vector", normals)
+        else:
+            mesh.calc_normals_split()
+            mesh.loops.foreach_get("normal", normals)
+        normals = normals.reshape(-1, 3)
+
+    return {
+        "co": co.reshape(-1, 3),
+        "loop_start": loop_start,
+        "loop_total": loop_total,
+        "loop_vertex": loop_vertex,
+        "material_index": material_index,
+        "use_smooth": use_smooth,
+        "uvs": uvs,
+        "normals": normals,
+    }
+
+
+def iter_block_arrays(arrays, cells):
+    """
+    全ブロックのメッシュデータをまとめて切り出し、ブロックのキー, ブロックのデータ を順に返す。
+    面をブロック順に並べ替えてループを一括で取り出し、ブロックごとに
+    np.unique の逆引きで頂点インデックスを 0 始まりに振り直す。
+    ブロックのデータは read_mesh_arrays と同じキーを持つ（頂点・ループ・面がそのブロックの分だけ）。
+    """
+    keys = sorted(cells)
+    if not keys:
+        return
+    face_order = np.concatenate([cells[key] for key in keys])
+    face_bounds = np.cumsum([0] + [len(cells[key]) for key in keys])
+
+    # ブロック順に並べた面のループを、面の順に連結したインデックス
+    totals = arrays["loop_total"][face_order]
+    loop_index = face_loop_indices(arrays["loop_start"], arrays["loop_total"], face_order)
+    loop_bounds = np.r_[0, np.cumsum(totals)][face_bounds]
+
+    for i, key in enumerate(keys):
+        faces = face_order[face_bounds[i]:face_bounds[i + 1]]
+        loops = loop_index[loop_bounds[i]:loop_bounds[i + 1]]
+        block_totals = totals[face_bounds[i]:face_bounds[i + 1]]
+        used, remapped = np.unique(arrays["loop_vertex"][loops], return_inverse=True)
+        normals = arrays["normals"]
+        yield key, {
+            "co": arrays["co"][used],
+            "loop_start": np.cumsum(block_totals) - block_totals,
+            "loop_total": block_totals,
+            "loop_vertex": remapped.reshape(-1),
+            "material_index": arrays["material_index"][faces],
+            "use_smooth": arrays["use_smooth"][faces],
+            "uvs": {name: uv[loops] for name, uv in arrays["uvs"].items()},
+            "normals": normals[loops] if normals is not None else None,
+        }
+
+
+def create_block_mesh(name, block, materials=()):
+    """
+    ブロックのデータから Blender メッシュを作成する（foreach_set で一括設定）。
+    頂点はローカル座標のまま（オブジェクトの matrix_world で位置は保たれる）。
+    UV・マテリアル番号・スムーズ設定・カスタム分割法線も引き継ぐ。
+    """
     mesh = bpy.data.meshes.new(name=name)
-    mesh.from_pydata(verts_local, [], faces)
-    mesh.update()
+    for material in materials:
+        mesh.materials.append(material)
+
+    mesh.vertices.add(len(block["co"]))
+    mesh.vertices.foreach_set("co", block["co"].ravel())
+    mesh.loops.add(len(block["loop_vertex"]))
+    mesh.loops.foreach_set("vertex_index", block["loop_vertex"].astype(np.int32))
+    mesh.polygons.add(len(block["loop_start"]))
+    mesh.polygons.foreach_set("loop_start", block["loop_start"].astype(np.int32))
+    try:
+        mesh.polygons.foreach_set("loop_total", block["loop_total"].astype(np.int32))
+    except (AttributeError, TypeError, RuntimeError):
+        pass  # Blender 4.0 以降は loop_start から自動で決まる（読み取り専用）
+    mesh.polygons.foreach_set("material_index", block["material_index"])
+    mesh.polygons.foreach_set("use_smooth", block["use_smooth"])
+
+    for uv_name, uv in block["uvs"].items():
+        layer = mesh.uv_layers.new(name=uv_name)
+        layer.data.foreach_set("uv", uv.ravel())
+
+    mesh.update(calc_edges=True)
+
+    if block["normals"] is not None:
+        if hasattr(mesh, "use_auto_smooth"):
+            mesh.use_auto_smooth = True  # Blender 4.0 以前はカスタム法線に必要
+        mesh.normals_split_custom_set(block["normals"].tolist())
     return mesh
 
 
-def main():
-    if not bpy.context.selected_objects:
+# ===== ブロック一覧（マニフェスト） =====
+
+MANIFEST_VERSION = 1
+
+
+def block_grid_rect(key):
+    """
+    ブロックが占める範囲を BLOCK_SIZE グリッドのセル単位で返す: (x0, y0, x1, y1)
+    四分木で分割したブロックは小数、統合したブロックは複数セル分になる。
+    """
+    ix, iy = key[0], key[1]
+    x0, y0, size = float(ix), float(iy), 1.0
+    suffix = key[2] if len(key) > 2 else ""
+    if suffix.startswith("q"):
+        for q in suffix[1:]:
+            size /= 2
+            x0 += (int(q) & 1) * size
+            y0 += (int(q) >> 1) * size
+    elif suffix.startswith("s"):
+        size = float(1 << int(suffix[1:]))
+    return x0, y0, x0 + size, y0 + size
+
+
+def block_record(name, key, world_co, n_faces):
+    """
+    1ブロック分のマニフェストのレコードを作る。
+    Blender（Z-up）から glTF / three.js（Y-up）へは (x, y, z) → (x, z, -y) で変換して記録する。
+    """
+    lo = world_co.min(axis=0)
+    hi = world_co.max(axis=0)
+    heights = world_co[:, 2]
+    return {
+        "name": name,
+        "grid": list(block_grid_rect(key)),
+        "min": [round(float(v), 3) for v in (lo[0], lo[2], -hi[1])],
+        "max": [round(float(v), 3) for v in (hi[0], hi[2], -lo[1])],
+        "faces": int(n_faces),
+        "vertices": int(len(world_co)),
+        "heightMin": round(float(heights.min()), 3),
+        "heightMax": round(float(heights.max()), 3),
+        "heightMean": round(float(heights.mean()), 3),
+        "neighbors": [],
+    }
+
+
+def add_block_neighbors(records):
+    """グリッド上で辺または角が接しているブロックの名前を neighbors に入れる（名前順）"""
+    if not records:
+        return
+    rects = np.array([r["grid"] for r in records], dtype=np.float64)
+    x0, y0, x1, y1 = rects.T
+    eps = 1e-9
+    for i, record in enumerate(records):
+        touch = (
+            (x0 <= x1[i] + eps) & (x1 >= x0[i] - eps) &
+            (y0 <= y1[i] + eps) & (y1 >= y0[i] - eps)
+        )
+        touch[i] = False
+        record["neighbors"] = sorted(records[j]["name"] for j in np.flatnonzero(touch))
+
+
+def write_block_manifest(path, sources):
+    """
+    ブロック一覧を JSON で保存する。sources は {"object": 元オブジェクト名, "blocks": [レコード, ...]} のリスト。
+    差分が見やすいよう、ブロックは名前順・1ブロック1行で書き出し、タイムスタンプ等は含めない。
+    """
+    lines = [
+        "{",
+        f'  "version": {MANIFEST_VERSION},',
+        '  "coordinateSystem": "gltf-y-up",',
+        f'  "blockSize": [{BLOCK_SIZE_X}, {BLOCK_SIZE_Y}],',
+        f'  "adaptive": {json.dumps(ADAPTIVE)},',
+        '  "sources": [',
+    ]
+    for n, source in enumerate(sources):
+        blocks = sorted(source["blocks"], key=lambda r: r["name"])
+        lines.append("    {")
+        lines.append(f'      "object": {json.dumps(source["object"], ensure_ascii=False)},')
+        lines.append('      "blocks": [')
+        for i, record in enumerate(blocks):
+            comma = "," if i < len(blocks) - 1 else ""
+            lines.append("        " + json.dumps(record, ensure_ascii=False) + comma)
+        lines.append("      ]")
+        lines.append("    }" + ("," if n < len(sources) - 1 else ""))
+    lines += ["  ]", "}", ""]
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines))
+    os.replace(tmp_path, path)
+
+
+# ===== LOD =====
+
+def create_lod_objects(objects, ratios):
+    """
+    各ブロックに Decimate（Collapse）をかけたメッシュを LOD として作る。
+    LOD ごとに全ブロックへモディファイアを付けてから1回だけ評価し、結果をメッシュとして取り出す。
+    返り値: dict[ブロック名] -> [{"name", "ratio", "faces"}, ...]（LOD1 から順）
+    """
+    lods = {obj.name: [] for obj in objects}
+    for level, ratio in enumerate(ratios, start=1):
+        modifiers = []
+        for obj in objects:
+            modifier = obj.modifiers.new(name=f"LOD{level}", type="DECIMATE")
+            modifier.decimate_type = "COLLAPSE"
+            modifier.ratio = ratio
+            modifiers.append(modifier)
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for obj, modifier in zip(objects, modifiers):
+            lod_mesh = bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph))
+            lod_obj = bpy.data.objects.new(f"{obj.name}_LOD{level}", lod_mesh)
+            lod_mesh.name = lod_obj.name
+            lod_obj.matrix_world = obj.matrix_world
+            for collection in obj.users_collection:
+                collection.objects.link(lod_obj)
+            obj.modifiers.remove(modifier)
+            lods[obj.name].append({"name": lod_obj.name, "ratio": ratio, "faces": len(lod_mesh.polygons)})
+        print(f"LOD{level}（ratio {ratio}）: {len(objects)} ブロック")
+    return lods
+
+
+def target_objects(use_all=False):
+    """分割するオブジェクト。バッチ実行で何も選択されていなければシーン内のすべてのメッシュ"""
+    if use_all or (bpy.app.background and not bpy.context.selected_objects):
+        return [obj for obj in bpy.context.scene.objects if obj.type == "MESH"]
+    return list(bpy.context.selected_objects)
+
+
+def parse_args(argv):
+    """"--" の後の引数で設定を上書きする（blender -b -P 用）"""
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    parser = argparse.ArgumentParser(prog="blender -b <file.blend> -P split_city_blocks.py --")
+    parser.add_argument("--block-size", type=float, nargs=2, metavar=("X", "Y"), default=(BLOCK_SIZE_X, BLOCK_SIZE_Y))
+    parser.add_argument("--adaptive", action="store_true", default=ADAPTIVE, help="面の密度に応じてブロックの大きさを変える")
+    parser.add_argument("--lod", type=float, nargs="*", default=list(LOD_RATIOS), help="LOD の面数の比率（例: 0.5 0.2）")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="ブロック一覧の書き出し先（空文字で書き出さない）")
+    parser.add_argument("--keep-original", action="store_true", help="元のオブジェクトを残す")
+    parser.add_argument("--all", action="store_true", help="選択に関係なくシーン内のすべてのメッシュを分割する")
+    parser.add_argument("--save", action="store_true", help="分割後に .blend を上書き保存する")
+    parser.add_argument("--export", default="", help="分割後に GLB として書き出す先（例: //city.glb）")
+    return parser.parse_args(argv)
+
+
+def main(use_all=False):
+    targets = target_objects(use_all)
+    if not targets:
         print("エラー: オブジェクトを選択してください。")
         return
 
-    for obj in bpy.context.selected_objects:
+    manifest_sources = []
+    for obj in targets:
         if obj.type != "MESH":
             print(f"スキップ: {obj.name} はメッシュではありません。")
             continue
@@ -125,33 +538,61 @@ def main():
             print(f"スキップ: {obj.name} に面がありません。")
             continue
 
-        cells = split_mesh_into_blocks(obj, BLOCK_SIZE_X, BLOCK_SIZE_Y)
+        arrays = read_mesh_arrays(mesh)
+        if ADAPTIVE:
+            cells = split_mesh_adaptive(obj, BLOCK_SIZE_X, BLOCK_SIZE_Y, arrays)
+        else:
+            cells = split_mesh_into_blocks(obj, BLOCK_SIZE_X, BLOCK_SIZE_Y, arrays)
         if not cells:
             print(f"スキップ: {obj.name} からブロックを計算できませんでした。")
             continue
 
         collection = obj.users_collection[0] if obj.users_collection else bpy.context.scene.collection
         world_matrix = obj.matrix_world.copy()
+        materials = list(mesh.materials)
 
         created = []
-        for (ix, iy), face_indices in sorted(cells.items()):
-            verts_local, faces = create_block_mesh(obj, list(face_indices))
-            if not verts_local or not faces:
+        records = []
+        for key, block in iter_block_arrays(arrays, cells):
+            if not len(block["co"]) or not len(block["loop_start"]):
                 continue
-            block_name = f"Block_{ix}_{iy}"
-            new_mesh = create_mesh_from_verts_faces(verts_local, faces, block_name)
-            new_obj = bpy.data.objects.new(block_name, new_mesh)
+            name = block_name(key)
+            new_mesh = create_block_mesh(name, block, materials)
+            new_obj = bpy.data.objects.new(name, new_mesh)
             new_obj.matrix_world = world_matrix
             collection.objects.link(new_obj)
             created.append(new_obj)
+            records.append(block_record(new_obj.name, key, get_world_coords(obj, block["co"]), len(block["loop_start"])))
 
         print(f"{obj.name} → {len(created)} ブロックに分割しました。")
+        if LOD_RATIOS and created:
+            lods = create_lod_objects(created, LOD_RATIOS)
+            for record in records:
+                record["lods"] = lods[record["name"]]
+        add_block_neighbors(records)
+        manifest_sources.append({"object": obj.name, "blocks": records})
 
         if DELETE_ORIGINAL and created:
             bpy.data.objects.remove(obj, do_unlink=True)
 
+    if MANIFEST_PATH and manifest_sources:
+        manifest_path = bpy.path.abspath(MANIFEST_PATH)
+        write_block_manifest(manifest_path, manifest_sources)
+        print(f"ブロック一覧を保存しました: {manifest_path}")
+
     print("完了。")
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args(sys.argv)
+    BLOCK_SIZE_X, BLOCK_SIZE_Y = args.block_size
+    ADAPTIVE = args.adaptive
+    LOD_RATIOS = tuple(args.lod)
+    MANIFEST_PATH = args.manifest
+    DELETE_ORIGINAL = DELETE_ORIGINAL and not args.keep_original
+    main(use_all=args.all)
+    if args.export:
+        bpy.ops.export_scene.gltf(filepath=bpy.path.abspath(args.export), export_format="GLB")
+        print(f"GLB を書き出しました: {bpy.path.abspath(args.export)}")
+    if args.save:
+        bpy.ops.wm.save_mainfile()
@@ -0,0 +1,310 @@
+"""
+高さマップ（ハイトフィールド）の事前計算
+
+gltf/city.glb を直接読み、上から見た一番高い面の高さを一定間隔のグリッドに焼き込む。
+ゲーム側は getHeightAt のレイキャストの代わりに、配列を1回引くだけで地面の高さが分かる。
+あわせて food_spawns.json / equipment_spawns.json に各スポーン地点の高さ（groundY）を書き込む。
+
+ファイル形式（リトルエンディアン）:
+  ヘッダ（64 バイト）
+    magic "GHFD", version u16, 予約 u16, 幅 u32（X 方向のセル数）, 奥行き u32（Z 方向のセル数）,
+    原点 X f64, 原点 Z f64, セルの大きさ f64, 高さの最小 f32, 高さの最大 f32, 以降 0 埋め
+  高さ float32[奥行き][幅]（Z の行ごと。面がないセルは NaN）
+
+  セル (i, j) は X が 原点X + i*セル 〜 +(i+1)*セル、Z が 原点Z + j*セル 〜 +(j+1)*セル の範囲。
+  JS では new Float32Array(buffer, 64, 幅 * 奥行き) でそのまま読める。
+"""
+
+import json
+import math
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+from glb_reader import load_glb, load_world_triangles, bounds_of
+
+try:
+    import numpy as np
+except ImportError:  # 焼き込みには NumPy が必要（読み込みだけなら不要）
+    np = None
+
+MAGIC = b"GHFD"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<4sHHIIdddff")
+
+DEFAULT_CELL_SIZE = 1.0
+# 1回に判定する（三角形, セル）の組の数の上限。メモリ使用量の目安
+DEFAULT_BATCH_PAIRS = 4_000_000
+# スポーンの groundY に使う、面がないときの高さ（getHeightAt の初期値と同じ）
+DEFAULT_GROUND_Y = 0.0
+
+
+@dataclass
+class HeightField:
+    """高さマップ。heights は Z の行ごとに並んだ float32（NaN は面なし）"""
+    origin_x: float
+    origin_z: float
+    cell_size: float
+    width: int
+    depth: int
+    heights: Any  # array('f') または np.ndarray（長さ 幅*奥行き）
+
+    def cell_of(self, x: float, z: float) -> Optional[Tuple[int, int]]:
+        """座標を含むセル (i, j)。範囲外なら None"""
+        i = math.floor((x - self.origin_x) / self.cell_size)
+        j = math.floor((z - self.origin_z) / self.cell_size)
+        if 0 <= i < self.width and 0 <= j < self.depth:
+            return i, j
+        return None
+
+    def height_at(self, x: float, z: float, default: Optional[float] = None) -> Optional[float]:
+        """座標の高さ。範囲外・面がないセルは default"""
+        cell = self.cell_of(x, z)
+        if cell is None:
+            return default
+        h = float(self.heights[cell[1] * self.width + cell[0]])
+        return default if math.isnan(h) else h
+
+
+# ============================================================
+# 焼き込み
+# ============================================================
+
+def _grid_for(positions, cell_size: float) -> Tuple[float, float, int, int]:
+    """頂点を覆うグリッドの原点と大きさ（原点はセルの大きさの倍数に揃える）"""
+    min_x, _, min_z, max_x, _, max_z = bounds_of(positions)
+    origin_x = math.floor(min_x / cell_size) * cell_size
+    origin_z = math.floor(min_z / cell_size) * cell_size
+    width = max(1, math.floor((max_x - origin_x) / cell_size) + 1)
+    depth = max(1, math.floor((max_z - origin_z) / cell_size) + 1)
+    return origin_x, origin_z, width, depth
+
+
+def rasterize_top_heights(
+    positions,
+    triangles,
+    origin_x: float,
+    origin_z: float,
+    cell_size: float,
+    width: int,
+    depth: int,
+    batch_pairs: int = DEFAULT_BATCH_PAIRS
+):
+    """
+    三角形を XZ 平面に投影し、各セルの中心を覆う三角形の高さの最大値を求める。
+    セルより小さい三角形や真上から見て線になる壁も拾えるよう、頂点の高さもそのセルに入れる。
+    返り値: float32 の (奥行き * 幅) 配列（面がないセルは NaN）
+    """
+    grid = np.full(width * depth, -np.inf, dtype=np.float64)
+    if not len(triangles):
+        return np.full(width * depth, np.nan, dtype=np.float32)
+
+    # 三角形から使われている頂点の高さを、その頂点のセルに入れる
+    used = np.unique(triangles)
+    vi = np.floor((positions[used, 0] - origin_x) / cell_size).astype(np.int64)
+    vj = np.floor((positions[used, 2] - origin_z) / cell_size).astype(np.int64)
+    ok = (vi >= 0) & (vi < width) & (vj >= 0) & (vj < depth)
+    np.maximum.at(grid, vj[ok] * width + vi[ok], positions[used[ok], 1])
+
+    a = positions[triangles[:, 0]]
+    b = positions[triangles[:, 1]]
+    c = positions[triangles[:, 2]]
+    # XZ 平面での符号付き面積の2倍。0 に近いもの（壁など）は頂点だけで扱う
+    area = (b[:, 0] - a[:, 0]) * (c[:, 2] - a[:, 2]) - (c[:, 0] - a[:, 0]) * (b[:, 2] - a[:, 2])
+    keep = np.abs(area) > 1e-12
+    a, b, c, area = a[keep], b[keep], c[keep], area[keep]
+
+    # 三角形ごとに、中心が外接矩形に入るセルの範囲
+    xs = np.stack([a[:, 0], b[:, 0], c[:, 0]])
+    zs = np.stack([a[:, 2], b[:, 2], c[:, 2]])
+    i0 = np.maximum(np.ceil((xs.min(axis=0) - origin_x) / cell_size - 0.5), 0).astype(np.int64)
+    i1 = np.minimum(np.floor((xs.max(axis=0) - origin_x) / cell_size - 0.5), width - 1).astype(np.int64)
+    j0 = np.maximum(np.ceil((zs.min(axis=0) - origin_z) / cell_size - 0.5), 0).astype(np.int64)
+    j1 = np.minimum(np.floor((zs.max(axis=0) - origin_z) / cell_size - 0.5), depth - 1).astype(np.int64)
+    ni = np.maximum(i1 - i0 + 1, 0)
+    nj = np.maximum(j1 - j0 + 1, 0)
+    pairs = ni * nj
+
+    # （三角形, セル）の組が batch_pairs 程度になるよう三角形をまとめて処理する
+    ends = np.cumsum(pairs)
+    start = 0
+    while start < len(pairs):
+        stop = int(np.searchsorted(ends, (ends[start - 1] if start else 0) + batch_pairs, side="right"))
+        stop = max(stop, start + 1)
+        t = np.arange(start, stop)
+        counts = pairs[t]
+        total = int(counts.sum())
+        start = stop
+        if not total:
+            continue
+        tri = np.repeat(t, counts)
+        local = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        ci = i0[tri] + local % ni[tri]
+        cj = j0[tri] + local // ni[tri]
+        px = origin_x + (ci + 0.5) * cell_size
+        pz = origin_z + (cj + 0.5) * cell_size
+
+        # 重心座標（XZ 平面）
+        ta, tb, tc, tarea = a[tri], b[tri], c[tri], area[tri]
+        w1 = ((px - ta[:, 0]) * (tc[:, 2] - ta[:, 2]) - (tc[:, 0] - ta[:, 0]) * (pz - ta[:, 2])) / tarea
+        w2 = ((tb[:, 0] - ta[:, 0]) * (pz - ta[:, 2]) - (px - ta[:, 0]) * (tb[:, 2] - ta[:, 2])) / tarea
+        w0 = 1.0 - w1 - w2
+        eps = -1e-9
+        inside = (w0 >= eps) & (w1 >= eps) & (w2 >= eps)
+        h = w0 * ta[:, 1] + w1 * tb[:, 1] + w2 * tc[:, 1]
+        np.maximum.at(grid, (cj * width + ci)[inside], h[inside])
+
+    grid[np.isneginf(grid)] = np.nan
+    return grid.astype(np.float32)
+
+
+def bake_heightfield(glb_path: str, cell_size: float = DEFAULT_CELL_SIZE) -> HeightField:
+    """GLB から高さマップを作る"""
+    if np is None:
+        raise RuntimeError("高さマップの焼き込みには NumPy が必要です（pip install numpy）")
+    positions, triangles = load_world_triangles(load_glb(glb_path))
+    if not len(triangles):
+        raise ValueError(f"三角形がありません: {glb_path}")
+    origin_x, origin_z, width, depth = _grid_for(positions, cell_size)
+    heights = rasterize_top_heights(positions, triangles, origin_x, origin_z, cell_size, width, depth)
+    return HeightField(origin_x, origin_z, cell_size, width, depth, heights)
+
+
+# ============================================================
+# 保存・読み込み
+# ============================================================
+
+def height_stats(heights) -> Tuple[int, float, float]:
+    """
+    面のあるセル（NaN でない）の数と、その高さの最小・最大（面がなければ NaN）。
+    NumPy があればセルを Python で1つずつ見ずに一括で数える（array('f') もコピーせずに読む）。
+    """
+    if np is not None:
+        values = np.frombuffer(heights, dtype=np.float32) if isinstance(heights, array) else np.asarray(heights)
+        filled = int(np.count_nonzero(~np.isnan(values)))
+        if not filled:
+            return 0, math.nan, math.nan
+        return filled, float(np.nanmin(values)), float(np.nanmax(values))
+    valid = [h for h in heights if not math.isnan(h)]
+    if not valid:
+        return 0, math.nan, math.nan
+    return len(valid), min(valid), max(valid)
+
+
+def pack_heightfield(hf: HeightField) -> bytes:
+    """高さマップをバイナリに詰める"""
+    heights = array("f", hf.heights.tobytes()) if np is not None and isinstance(hf.heights, np.ndarray) \
+        else array("f", hf.heights)
+    _, min_height, max_height = height_stats(heights)
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, hf.width, hf.depth,
+        hf.origin_x, hf.origin_z, hf.cell_size,
+        min_height, max_height,
+    )
+    if sys.byteorder == "big":
+        heights.byteswap()
+    return header.ljust(HEADER_SIZE, b"\0") + heights.tobytes()
+
+
+def unpack_heightfield(data: bytes) -> HeightField:
+    """バイナリから高さマップを読み込む（NumPy 不要）"""
+    view = memoryview(data)
+    magic, version, _, width, depth, origin_x, origin_z, cell_size, _, _ = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("高さマップのバイナリ形式ではありません")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"未対応のバージョンです: {version}")
+    heights = array("f")
+    heights.frombytes(view[HEADER_SIZE:HEADER_SIZE + 4 * width * depth])
+    if sys.byteorder == "big":
+        heights.byteswap()
+    return HeightField(origin_x, origin_z, cell_size, width, depth, heights)
+
+
+def save_heightfield(hf: HeightField, path: str):
+    data = pack_heightfield(hf)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    print(f"保存完了: {path} ({hf.width} x {hf.depth} セル, {len(data):,} bytes)")
+
+
+def load_heightfield(path: str) -> HeightField:
+    with open(path, 'rb') as f:
+        return unpack_heightfield(f.read())
+
+
+# ============================================================
+# スポーンへの高さの書き込み
+# ============================================================
+
+def annotate_spawns(path: str, hf: HeightField, default: float = DEFAULT_GROUND_Y) -> Dict[str, int]:
+    """
+    スポーン JSON の各スポーンに groundY（その地点の高さ。面がなければ default）を書き込む。
+    書き出しは convert_shops.py と同じ形式（SpawnJsonWriter）。
+    """
+    from convert_shops import SpawnJsonWriter
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    writer = SpawnJsonWriter(path, data.get("description", ""), data["transform"])
+    stats = {"hit": 0, "miss": 0}
+    try:
+        for spawn in data["spawns"]:
+            h = hf.height_at(spawn["gameX"], spawn["gameZ"])
+            stats["hit" if h is not None else "miss"] += 1
+            spawn["groundY"] = round(max(h, default) if h is not None else default, 2)
+            writer.write(spawn)
+    finally:
+        writer.close()
+    return stats
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(script_dir)
+    data_dir = os.path.join(project_dir, "data")
+
+    parser = argparse.ArgumentParser(description="city.glb から高さマップを作り、スポーンに高さを書き込む")
+    parser.add_argument("--glb", default=os.path.join(project_dir, "gltf", "city.glb"), help="入力の GLB")
+    parser.add_argument("--out", default=None, help="高さマップの出力先（省略時は GLB と同じフォルダの city_height.bin）")
+    parser.add_argument("--cell", type=float, default=DEFAULT_CELL_SIZE, help="セルの大きさ（メートル）")
+    parser.add_argument("--no-spawns", action="store_true", help="スポーン JSON に groundY を書き込まない")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(os.path.dirname(args.glb), "city_height.bin")
+
+    print("=" * 50)
+    print("高さマップの焼き込み")
+    print("=" * 50)
+
+    if not os.path.exists(args.glb):
+        print(f"\nエラー: {args.glb} が見つかりません")
+        raise SystemExit(1)
+
+    hf = bake_heightfield(args.glb, args.cell)
+    filled = height_stats(hf.heights)[0]
+    print(f"\n範囲: X {hf.origin_x:.1f} 〜 {hf.origin_x + hf.width * hf.cell_size:.1f}, "
+          f"Z {hf.origin_z:.1f} 〜 {hf.origin_z + hf.depth * hf.cell_size:.1f}")
+    print(f"面のあるセル: {filled:,} / {hf.width * hf.depth:,}")
+    save_heightfield(hf, out_path)
+
+    if not args.no_spawns:
+        for filename in ("food_spawns.json", "equipment_spawns.json"):
+            path = os.path.join(data_dir, filename)
+            if not os.path.exists(path):
+                print(f"スキップ: {path} が見つかりません")
+                continue
+            stats = annotate_spawns(path, hf)
+            print(f"  groundY: 面あり {stats['hit']} 件 / 面なし {stats['miss']} 件")
@@ -0,0 +1,509 @@
+"""
+ブロック間の可視性（PVS: Potentially Visible Set）の事前計算
+
+ゲームは毎フレームすべてのブロックを描画し、視錐台カリングと近接シェーダーだけで間引いている。
+このスクリプトはブロックごとに「そのブロックの上空（プレイヤーの高度範囲）から見える可能性のあるブロック」を求め、
+ビット列の表として保存する。ゲームはプレイヤーのいるブロックの行を引くだけで描画するブロックを絞れる。
+
+方法（保守的な判定。見えないとするのは確実に見えないブロックだけ）:
+  - 遮蔽物は高さマップ（bake_heightfield.py）を粗いグリッドにしたもの。粗いセルの高さは細かいセルの最小値
+    （そのセル全体がその高さまで必ず埋まっている＝保守的な遮蔽物）
+  - 視点の範囲はブロックの XZ 範囲 × 高度 --max-altitude 以下（既定 160m、player.js の maxHeight）。
+    低い視点ほど遮られやすいので、判定に効くのは最高高度だけ
+  - ブロック j が見えないとするのは、視点の範囲から j の AABB へのどの線分も遮蔽物に遮られる場合だけ
+    （surely_hidden: 線分が通りうる高さの上限より高いセルを壁とし、壁を通らずに j まで XZ でたどれないこと）
+  - 先に視点の範囲の上端から j の上面へ数本のレイを飛ばし、通れば見えるとして上の判定を省く
+  - 霧の先（scene.js の Fog の far、1200m）より遠いブロックは見えないものとする
+  - 自分自身と隣接ブロックは常に見える
+  見えない側の誤りはない（見えるブロックを消さない）が、見える側には余分が入りうる。
+  計算量はブロックの組の数と、組ごとの2ブロックを囲む範囲のセル数で決まり、面の数にはよらない。
+  ブロック単位でプロセスプールに分けて並列に計算する。
+
+ファイル形式（リトルエンディアン）:
+  ヘッダ  magic "GPVS", version u16, 予約 u16, ブロック数 u32, 1行のバイト数 u32
+  名前    オフセット u32[ブロック数 + 1]、続けて UTF-8 本体（ブロック名）
+  表      4 バイト境界に揃えてから ブロック数 行 × 1行のバイト数（行 i のビット j: ブロック i からブロック j が見える）
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 計算には NumPy が必要（読み込みだけなら不要）
+    np = None
+
+MAGIC = b"GPVS"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+
+# player.js の maxHeight
+DEFAULT_MAX_ALTITUDE = 160.0
+# scene.js の Fog の far
+DEFAULT_MAX_DISTANCE = 1200.0
+DEFAULT_OCCLUDER_CELL = 4.0
+# 1回に判定するレイ上の点の数の上限（メモリ使用量の目安）
+DEFAULT_BATCH_SAMPLES = 4_000_000
+
+
+@dataclass
+class Block:
+    """PVS の対象のブロック（座標は three.js のワールド座標・Y-up）"""
+    name: str
+    min: Tuple[float, float, float]
+    max: Tuple[float, float, float]
+
+
+@dataclass
+class BlockPVS:
+    """ブロック間の可視性の表"""
+    names: List[str]
+    row_bytes: int
+    bits: bytes
+
+    def visible(self, i: int, j: int) -> bool:
+        """ブロック i からブロック j が見えるか"""
+        return bool(self.bits[i * self.row_bytes + (j >> 3)] >> (j & 7) & 1)
+
+    def visible_from(self, name: str) -> List[str]:
+        """ブロックから見えるブロックの名前"""
+        i = self.names.index(name)
+        return [self.names[j] for j in range(len(self.names)) if self.visible(i, j)]
+
+
+# ============================================================
+# 入力
+# ============================================================
+
+def blocks_from_manifest(path: str) -> List[Block]:
+    """ブロック一覧（split_city_blocks.py の city_blocks.json）から読む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return [
+        Block(b["name"], tuple(b["min"]), tuple(b["max"]))
+        for source in manifest.get("sources", [])
+        for b in source.get("blocks", [])
+    ]
+
+
+def blocks_from_glb(path: str) -> List[Block]:
+    """GLB のメッシュノードごとの AABB を読む（LOD のノードは除く）"""
+    from glb_reader import load_glb, iter_world_triangles
+
+    bounds: Dict[str, List[float]] = {}
+    for name, positions, tris in iter_world_triangles(load_glb(path)):
+        if "_LOD" in name:
+            continue
+        pts = positions[np.unique(tris)]
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        if name in bounds:
+            b = bounds[name]
+            lo = np.minimum(lo, b[:3])
+            hi = np.maximum(hi, b[3:])
+        bounds[name] = [*lo.tolist(), *hi.tolist()]
+    return [Block(name, tuple(b[:3]), tuple(b[3:])) for name, b in sorted(bounds.items())]
+
+
+@dataclass
+class OccluderGrid:
+    """遮蔽物の高さ（粗いグリッド）。面のないセルは -inf"""
+    origin_x: float
+    origin_z: float
+    cell_size: float
+    heights: "np.ndarray"  # (奥行き, 幅)
+
+
+def occluders_from_heightfield(hf, cell_size: float = DEFAULT_OCCLUDER_CELL) -> OccluderGrid:
+    """高さマップを粗いグリッドにまとめる（各セルは細かいセルの最小値。面のないセルは遮らない）"""
+    fine = np.asarray(hf.heights, dtype=np.float64).reshape(hf.depth, hf.width)
+    fine = np.where(np.isnan(fine), -np.inf, fine)
+    factor = max(1, int(round(cell_size / hf.cell_size)))
+    depth = -(-hf.depth // factor)
+    width = -(-hf.width // factor)
+    # 端数の部分は -inf（遮らない）で埋める。端のセルは遮らない側に倒れるので保守的なまま
+    padded = np.full((depth * factor, width * factor), -np.inf)
+    padded[:hf.depth, :hf.width] = fine
+    coarse = padded.reshape(depth, factor, width, factor).min(axis=(1, 3))
+    return OccluderGrid(hf.origin_x, hf.origin_z, hf.cell_size * factor, coarse)
+
+
+# ============================================================
+# 可視判定
+# ============================================================
+
+def _probe_points(lo: "np.ndarray", hi: "np.ndarray", y: "np.ndarray") -> "np.ndarray":
+    """ブロックの XZ 範囲の中央と四隅の点（高さ y）: (ブロック数, 5, 3)"""
+    unit = np.array([[0.5, 0.5], [0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+    x = lo[:, None, 0] + (hi - lo)[:, None, 0] * unit[None, :, 0]
+    z = lo[:, None, 2] + (hi - lo)[:, None, 2] * unit[None, :, 1]
+    return np.stack([x, np.broadcast_to(y[:, None], x.shape), z], axis=2)
+
+
+def _rays_clear(
+    origins: "np.ndarray",
+    targets: "np.ndarray",
+    source_lo: "np.ndarray",
+    source_hi: "np.ndarray",
+    target_lo: "np.ndarray",
+    target_hi: "np.ndarray",
+    occ: OccluderGrid,
+    batch_samples: int
+) -> "np.ndarray":
+    """
+    各レイ（origins[k] → targets[k]）が遮蔽物に遮られないか。
+    レイ上を遮蔽物のセルの半分の間隔で調べ、その点のセルの高さがレイの高さを超えていれば遮られたとする。
+    視点のブロックと目標ブロックの XZ 範囲内の点は調べない（ブロック自身で遮らないように）。
+    点の間の遮蔽物を見落とすことはあるが、見落とすと「見える」側に倒れるだけなので、見えることの確認に使える。
+    """
+    n = len(origins)
+    clear = np.ones(n, dtype=bool)
+    if not n:
+        return clear
+    step = occ.cell_size / 2
+    lengths = np.linalg.norm((targets - origins)[:, [0, 2]], axis=1)
+    counts = np.maximum(np.ceil(lengths / step).astype(np.int64), 1)
+    depth, width = occ.heights.shape
+    flat_heights = occ.heights.ravel()
+
+    ends = np.cumsum(counts)
+    start = 0
+    while start < n:
+        stop = int(np.searchsorted(ends, (ends[start - 1] if start else 0) + batch_samples, side="right"))
+        stop = max(stop, start + 1)
+        r = np.arange(start, stop)
+        c = counts[r]
+        total = int(c.sum())
+        ray = np.repeat(r, c)
+        k = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+        t = (k + 0.5) / counts[ray]
+        p = origins[ray] + (targets[ray] - origins[ray]) * t[:, None]
+
+        i = np.floor((p[:, 0] - occ.origin_x) / occ.cell_size).astype(np.int64)
+        j = np.floor((p[:, 2] - occ.origin_z) / occ.cell_size).astype(np.int64)
+        inside = (i >= 0) & (i < width) & (j >= 0) & (j < depth)
+        h = np.full(total, -np.inf)
+        h[inside] = flat_heights[j[inside] * width + i[inside]]
+
+        in_source = (
+            (p[:, 0] >= source_lo[0]) & (p[:, 0] <= source_hi[0]) &
+            (p[:, 2] >= source_lo[2]) & (p[:, 2] <= source_hi[2])
+        )
+        in_target = (
+            (p[:, 0] >= target_lo[ray, 0]) & (p[:, 0] <= target_hi[ray, 0]) &
+            (p[:, 2] >= target_lo[ray, 2]) & (p[:, 2] <= target_hi[ray, 2])
+        )
+        blocked = (h > p[:, 1]) & ~in_source & ~in_target
+        clear[r] = np.bincount(ray - start, weights=blocked, minlength=len(r))[:len(r)] == 0
+        start = stop
+    return clear
+
+
+def _rect_distances(starts: "np.ndarray", cell_size: float, lo: float, hi: float) -> Tuple["np.ndarray", "np.ndarray"]:
+    """1軸について、セル [s, s + cell_size] と区間 [lo, hi] の点どうしの最短・最長の距離"""
+    ends = starts + cell_size
+    near = np.maximum(0.0, np.maximum(lo - ends, starts - hi))
+    far = np.maximum(ends - lo, hi - starts)
+    return near, far
+
+
+def _reachable(passable: "np.ndarray", seeds: "np.ndarray", goals: "np.ndarray") -> bool:
+    """
+    通れるセルを4近傍でたどって seeds から goals に届くか。
+    行方向・列方向の通れるセルの連続区間を単位に、届いた区間を交互に広げる（曲がる回数だけ繰り返す）。
+    """
+    rows, cols = passable.shape
+    row_runs = np.cumsum(~passable, axis=1) + np.arange(rows)[:, None] * (cols + 1)
+    col_runs = np.cumsum(~passable, axis=0) + np.arange(cols)[None, :] * (rows + 1)
+    size = max(rows * (cols + 1), cols * (rows + 1)) + 1
+    reached = seeds & passable
+    count = int(reached.sum())
+    while not (reached & goals).any():
+        for runs in (row_runs, col_runs):
+            hit = np.zeros(size, dtype=bool)
+            hit[runs[reached]] = True
+            reached = passable & hit[runs]
+        new_count = int(reached.sum())
+        if new_count == count:
+            return False
+        count = new_count
+    return True
+
+
+def surely_hidden(
+    source_lo: "np.ndarray",
+    source_hi: "np.ndarray",
+    target_lo: "np.ndarray",
+    target_hi: "np.ndarray",
+    occ: OccluderGrid,
+    max_altitude: float
+) -> bool:
+    """
+    視点の範囲（source の XZ 範囲 × 高度 max_altitude 以下）から target の AABB へのどの線分も
+    遮蔽物に遮られるか（保守的な判定。True なら確実に見えない）。
+
+    線分がセル c の上を通る高さは、始点の高さ A（≤ max_altitude）と終点の高さ B（≤ target の上面 Ty）の間を
+    XZ の距離で線形に結んだものなので、c と視点の範囲・target の XZ 範囲との最短・最長の距離から
+    その上限が求まる（A ≥ Ty なら A - (A - Ty) × 最短(c, 視点) / (最短(c, 視点) + 最長(c, target))）。
+    セルの高さがこの上限以上なら、c の上を通る線分はすべてそのセルで遮られる。
+    そうしたセルを壁として、視点の範囲から target まで壁を通らずにたどれなければ見えない。
+    両方のブロックの XZ 範囲に掛かるセルは壁にしない（ブロック自身で遮らないように）。
+    """
+    x0 = min(source_lo[0], target_lo[0])
+    x1 = max(source_hi[0], target_hi[0])
+    z0 = min(source_lo[2], target_lo[2])
+    z1 = max(source_hi[2], target_hi[2])
+    cs = occ.cell_size
+    i0 = int(np.floor((x0 - occ.origin_x) / cs))
+    i1 = int(np.floor((x1 - occ.origin_x) / cs)) + 1
+    j0 = int(np.floor((z0 - occ.origin_z) / cs))
+    j1 = int(np.floor((z1 - occ.origin_z) / cs)) + 1
+
+    # 線分は2つのブロックを囲む矩形の中を通る。グリッドの外は遮らない
+    depth, width = occ.heights.shape
+    heights = np.full((j1 - j0, i1 - i0), -np.inf)
+    ci0, ci1 = max(i0, 0), min(i1, width)
+    cj0, cj1 = max(j0, 0), min(j1, depth)
+    if ci0 >= ci1 or cj0 >= cj1:
+        return False
+    heights[cj0 - j0:cj1 - j0, ci0 - i0:ci1 - i0] = occ.heights[cj0:cj1, ci0:ci1]
+
+    top = float(target_hi[1])
+    if heights.max() < min(max_altitude, top):
+        return False
+
+    xs = occ.origin_x + np.arange(i0, i1) * cs
+    zs = occ.origin_z + np.arange(j0, j1) * cs
+    sx_near, sx_far = _rect_distances(xs, cs, source_lo[0], source_hi[0])
+    sz_near, sz_far = _rect_distances(zs, cs, source_lo[2], source_hi[2])
+    tx_near, tx_far = _rect_distances(xs, cs, target_lo[0], target_hi[0])
+    tz_near, tz_far = _rect_distances(zs, cs, target_lo[2], target_hi[2])
+    source_near = np.hypot(sx_near[None, :], sz_near[:, None])
+    source_far = np.hypot(sx_far[None, :], sz_far[:, None])
+    target_near = np.hypot(tx_near[None, :], tz_near[:, None])
+    target_far = np.hypot(tx_far[None, :], tz_far[:, None])
+
+    if max_altitude >= top:
+        f = source_near / np.maximum(source_near + target_far, 1e-9)
+        bound = max_altitude - (max_altitude - top) * f
+    else:
+        f = target_near / np.maximum(target_near + source_far, 1e-9)
+        bound = top - (top - max_altitude) * f
+
+    in_source = source_near == 0
+    in_target = target_near == 0
+    passable = (heights < bound) | in_source | in_target
+    return not _reachable(passable, in_source, in_target)
+
+
+def visible_blocks(
+    source: int,
+    lo: "np.ndarray",
+    hi: "np.ndarray",
+    occ: OccluderGrid,
+    max_altitude: float = DEFAULT_MAX_ALTITUDE,
+    max_distance: float = DEFAULT_MAX_DISTANCE,
+    batch_samples: int = DEFAULT_BATCH_SAMPLES
+) -> "np.ndarray":
+    """
+    ブロック source から見える可能性のあるブロックの真偽の配列（保守的: False は surely_hidden で確かめたもの）。
+    まず視点の範囲の上端から相手の上面へ数本のレイを飛ばし、1本でも通れば見えるとする（安い確認）。
+    通らなかったブロックだけ surely_hidden で判定する。
+    """
+    # XZ 平面での AABB 同士の距離
+    gap_x = np.maximum(0, np.maximum(lo[:, 0] - hi[source, 0], lo[source, 0] - hi[:, 0]))
+    gap_z = np.maximum(0, np.maximum(lo[:, 2] - hi[source, 2], lo[source, 2] - hi[:, 2]))
+    gap = np.hypot(gap_x, gap_z)
+
+    visible = gap <= 1e-6  # 自分自身と接しているブロック
+    candidates = np.flatnonzero(~visible & (gap <= max_distance))
+    if not len(candidates):
+        return visible
+
+    views = _probe_points(lo[source:source + 1], hi[source:source + 1], np.array([max_altitude]))[0]
+    targets = _probe_points(lo[candidates], hi[candidates], hi[candidates, 1])  # (候補数, 5, 3)
+    per_block = targets.shape[1]
+    remaining = np.ones(len(candidates), dtype=bool)
+    for view in views:
+        idx = np.flatnonzero(remaining)
+        if not len(idx):
+            break
+        tgt = targets[idx].reshape(-1, 3)
+        owner = np.repeat(idx, per_block)
+        clear = _rays_clear(
+            np.broadcast_to(view, tgt.shape), tgt, lo[source], hi[source],
+            lo[candidates][owner], hi[candidates][owner], occ, batch_samples,
+        )
+        remaining &= ~(np.bincount(owner, weights=clear, minlength=len(candidates)) > 0)
+
+    for k in np.flatnonzero(remaining):
+        t = candidates[k]
+        if not surely_hidden(lo[source], hi[source], lo[t], hi[t], occ, max_altitude):
+            remaining[k] = False
+    visible[candidates[~remaining]] = True
+    return visible
+
+
+# ============================================================
+# 並列計算
+# ============================================================
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(lo, hi, occ, max_altitude, max_distance):
+    _worker.update(lo=lo, hi=hi, occ=occ, max_altitude=max_altitude, max_distance=max_distance)
+
+
+def _pvs_rows(sources: List[int]) -> List[Tuple[int, bytes]]:
+    """ブロックごとの行（ビット列）を計算する"""
+    rows = []
+    for source in sources:
+        visible = visible_blocks(
+            source, _worker["lo"], _worker["hi"], _worker["occ"], _worker["max_altitude"], _worker["max_distance"],
+        )
+        rows.append((source, np.packbits(visible, bitorder="little").tobytes()))
+    return rows
+
+
+def compute_pvs(
+    blocks: List[Block],
+    occ: OccluderGrid,
+    max_altitude: float = DEFAULT_MAX_ALTITUDE,
+    max_distance: float = DEFAULT_MAX_DISTANCE,
+    workers: int = 0
+) -> BlockPVS:
+    """全ブロックの PVS を計算する。workers > 0 ならブロックを分けてプロセスプールで並列に計算"""
+    if np is None:
+        raise RuntimeError("PVS の計算には NumPy が必要です（pip install numpy）")
+    lo = np.array([b.min for b in blocks], dtype=np.float64)
+    hi = np.array([b.max for b in blocks], dtype=np.float64)
+    row_bytes = (len(blocks) + 7) // 8
+    initargs = (lo, hi, occ, max_altitude, max_distance)
+
+    sources = list(range(len(blocks)))
+    if workers <= 0:
+        _init_worker(*initargs)
+        rows = _pvs_rows(sources)
+    else:
+        chunk = max(1, len(sources) // (workers * 8))
+        tasks = [sources[i:i + chunk] for i in range(0, len(sources), chunk)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            rows = [row for part in executor.map(_pvs_rows, tasks) for row in part]
+
+    bits = bytearray(row_bytes * len(blocks))
+    for source, row in rows:
+        bits[source * row_bytes:(source + 1) * row_bytes] = row
+    return BlockPVS([b.name for b in blocks], row_bytes, bytes(bits))
+
+
+# ============================================================
+# 保存・読み込み
+# ============================================================
+
+def pack_pvs(pvs: BlockPVS) -> bytes:
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(pvs.names), pvs.row_bytes))
+    encoded = [name.encode("utf-8") for name in pvs.names]
+    offsets = array("I", [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    out.extend(offsets.tobytes())
+    out.extend(b"".join(encoded))
+    out.extend(b"\0" * (-len(out) % 4))
+    out.extend(pvs.bits)
+    return bytes(out)
+
+
+def unpack_pvs(data: bytes) -> BlockPVS:
+    """バイナリから PVS を読み込む（NumPy 不要）"""
+    view = memoryview(data)
+    magic, version, _, count, row_bytes = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("PVS のバイナリ形式ではありません")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"未対応のバージョンです: {version}")
+    pos = _HEADER.size
+    offsets = array("I")
+    offsets.frombytes(view[pos:pos + 4 * (count + 1)])
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    pos += 4 * (count + 1)
+    blob = bytes(view[pos:pos + offsets[-1]])
+    names = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+    pos += offsets[-1]
+    pos += -pos % 4
+    return BlockPVS(names, row_bytes, bytes(view[pos:pos + count * row_bytes]))
+
+
+def save_pvs(pvs: BlockPVS, path: str) -> int:
+    data = pack_pvs(pvs)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def load_pvs(path: str) -> BlockPVS:
+    with open(path, 'rb') as f:
+        return unpack_pvs(f.read())
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+    from bake_heightfield import bake_heightfield, load_heightfield
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    gltf_dir = os.path.join(os.path.dirname(script_dir), "gltf")
+
+    parser = argparse.ArgumentParser(description="ブロック間の可視性（PVS）を事前計算する")
+    parser.add_argument("--glb", default=os.path.join(gltf_dir, "city.glb"), help="ブロック（ノード）と遮蔽物の元にする GLB")
+    parser.add_argument("--manifest", default=None, help="ブロックをブロック一覧（city_blocks.json）から読む")
+    parser.add_argument("--heightfield", default=None, help="遮蔽物に使う高さマップ（省略時は GLB から作る）")
+    parser.add_argument("--out", default=os.path.join(gltf_dir, "city_pvs.bin"), help="出力先")
+    parser.add_argument("--max-altitude", type=float, default=DEFAULT_MAX_ALTITUDE, help="視点の最高高度")
+    parser.add_argument("--max-distance", type=float, default=DEFAULT_MAX_DISTANCE, help="これより遠いブロックは見えないとする")
+    parser.add_argument("--occluder-cell", type=float, default=DEFAULT_OCCLUDER_CELL, help="遮蔽物のグリッドの大きさ（メートル）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列数（0 で並列化しない）")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("ブロック間の可視性（PVS）の計算")
+    print("=" * 50)
+
+    if args.manifest:
+        blocks = blocks_from_manifest(args.manifest)
+    elif os.path.exists(args.glb):
+        blocks = blocks_from_glb(args.glb)
+    else:
+        print(f"\nエラー: {args.glb} が見つかりません")
+        raise SystemExit(1)
+
+    if args.heightfield:
+        hf = load_heightfield(args.heightfield)
+    else:
+        hf = bake_heightfield(args.glb)
+    occ = occluders_from_heightfield(hf, args.occluder_cell)
+
+    start = time.perf_counter()
+    pvs = compute_pvs(blocks, occ, args.max_altitude, args.max_distance, args.workers)
+    elapsed = time.perf_counter() - start
+
+    n = len(blocks)
+    total = sum(bin(b).count("1") for b in pvs.bits)
+    print(f"\nブロック: {n} / 遮蔽物のグリッド: {occ.heights.shape[1]} x {occ.heights.shape[0]}（{occ.cell_size:.1f} m）")
+    print(f"見えるブロック: 平均 {total / max(1, n):.1f} / {n}（{total / max(1, n * n):.0%}）")
+    size = save_pvs(pvs, args.out)
+    print(f"保存完了: {args.out} ({size:,} bytes, {elapsed:.2f} 秒)")
@@ -0,0 +1,373 @@
+"""
+建物 AABB の当たり判定用インデックス（一様グリッド）の事前計算
+
+city.js の collisionBoxes は高さを求めるたびに全件を走査している。
+このスクリプトは建物の AABB を XZ 平面の一様グリッドに登録し、型付き配列だけで引ける形で保存する。
+ある地点の問い合わせでは、その地点のセルに登録された数個の AABB だけを調べればよい。
+
+入力:
+  - GLB（city.glb）のメッシュノードごとの AABB。--components で連結成分（建物1棟）ごとに分ける
+  ブロック一覧（city_blocks.json）の min / max は約 50m のブロック単位で、建物の AABB の代わりにならない
+  （ブロック内のどの地点もブロックで一番高い屋根の高さになる）ので使わない。
+
+ファイル形式（リトルエンディアン、座標は three.js のワールド座標・Y-up）:
+  ヘッダ（48 バイト）
+    magic "GCOL", version u16, 予約 u16, AABB 数 u32, 列数 u32（X）, 行数 u32（Z）, 登録数 u32,
+    原点 X f64, 原点 Z f64, セルの大きさ f64
+  AABB       float32[AABB 数][6]（minX, minY, minZ, maxX, maxY, maxZ）
+  セルの先頭  uint32[列数 * 行数 + 1]（セル c の AABB は 登録[先頭[c]:先頭[c+1]]、セルは Z の行ごと）
+  登録       uint32[登録数]（AABB の番号）
+"""
+
+import math
+import os
+import random
+import re
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import List, Tuple, Optional, Sequence
+
+MAGIC = b"GCOL"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHHIIIIddd")
+
+# 1つの AABB が登録されるセル数の目安（セルの大きさの自動決定に使う）
+TARGET_CELLS_PER_BOX = 4
+MIN_CELL_SIZE = 1.0
+# 頂点を同一とみなす距離（連結成分を求めるときの溶接）
+WELD_EPSILON = 1e-3
+# 地面・道路とみなして除く AABB（どのセルにも入り、どの問い合わせにも返ってしまうため）
+DEFAULT_MIN_HEIGHT = 2.0        # 高さ（maxY - minY）がこれ未満の平たい AABB
+DEFAULT_MAX_FOOTPRINT = 300.0   # XZ の長い辺がこれより大きい AABB
+GROUND_NAME_PATTERN = re.compile(r"ground|road|street|terrain|地面|道路", re.IGNORECASE)
+
+Box = Tuple[float, float, float, float, float, float]
+
+
+@dataclass
+class CollisionIndex:
+    """一様グリッドのインデックス。boxes は6個ずつの float32、offsets / items は uint32"""
+    origin_x: float
+    origin_z: float
+    cell_size: float
+    cols: int
+    rows: int
+    boxes: array
+    offsets: array
+    items: array
+
+    @property
+    def num_boxes(self) -> int:
+        return len(self.boxes) // 6
+
+    def box(self, index: int) -> Box:
+        return tuple(self.boxes[index * 6:index * 6 + 6])
+
+    def cell_of(self, x: float, z: float) -> Optional[int]:
+        """座標を含むセルの番号。範囲外なら None"""
+        i = math.floor((x - self.origin_x) / self.cell_size)
+        j = math.floor((z - self.origin_z) / self.cell_size)
+        if 0 <= i < self.cols and 0 <= j < self.rows:
+            return j * self.cols + i
+        return None
+
+    def boxes_at(self, x: float, z: float) -> List[int]:
+        """XZ 平面で (x, z) を含む AABB の番号（リファレンス実装）"""
+        cell = self.cell_of(x, z)
+        if cell is None:
+            return []
+        found = []
+        boxes = self.boxes
+        for k in range(self.offsets[cell], self.offsets[cell + 1]):
+            b = self.items[k]
+            o = b * 6
+            if boxes[o] <= x <= boxes[o + 3] and boxes[o + 2] <= z <= boxes[o + 5]:
+                found.append(b)
+        return found
+
+    def height_at(self, x: float, z: float, ground: float = 0.0) -> float:
+        """city.js の getHeightAt の AABB 部分と同じ: 含む AABB の maxY の最大（なければ ground）"""
+        h = ground
+        for b in self.boxes_at(x, z):
+            h = max(h, self.boxes[b * 6 + 4])
+        return h
+
+
+# ============================================================
+# 構築
+# ============================================================
+
+def auto_cell_size(boxes: Sequence[Box]) -> float:
+    """AABB の XZ の大きさの中央値から、1つの AABB が数セルに収まる程度のセルの大きさを決める"""
+    if not boxes:
+        return MIN_CELL_SIZE
+    extents = sorted(max(b[3] - b[0], b[5] - b[2]) for b in boxes)
+    median = extents[len(extents) // 2]
+    return max(MIN_CELL_SIZE, median / math.sqrt(TARGET_CELLS_PER_BOX) * 2)
+
+
+def build_collision_index(boxes: Sequence[Box], cell_size: Optional[float] = None) -> CollisionIndex:
+    """
+    AABB を一様グリッドに登録する。AABB は境界を含むので、境界がセルの端に一致する場合は両側のセルに登録する。
+    セル内の AABB は番号順に並ぶ。
+    """
+    if cell_size is None:
+        cell_size = auto_cell_size(boxes)
+    packed = array("f")
+    for b in boxes:
+        packed.extend(b)
+    # float32 に丸めた後の値でセルを決める（問い合わせも丸めた値で判定するため）
+    boxes = [tuple(packed[i * 6:i * 6 + 6]) for i in range(len(boxes))]
+
+    if boxes:
+        origin_x = math.floor(min(b[0] for b in boxes) / cell_size) * cell_size
+        origin_z = math.floor(min(b[2] for b in boxes) / cell_size) * cell_size
+        cols = math.floor((max(b[3] for b in boxes) - origin_x) / cell_size) + 1
+        rows = math.floor((max(b[5] for b in boxes) - origin_z) / cell_size) + 1
+    else:
+        origin_x = origin_z = 0.0
+        cols = rows = 1
+
+    def cell_range(b):
+        i0 = max(math.floor((b[0] - origin_x) / cell_size), 0)
+        i1 = min(math.floor((b[3] - origin_x) / cell_size), cols - 1)
+        j0 = max(math.floor((b[2] - origin_z) / cell_size), 0)
+        j1 = min(math.floor((b[5] - origin_z) / cell_size), rows - 1)
+        return i0, i1, j0, j1
+
+    # 1回目: セルごとの件数、2回目: 先頭位置に詰める（CSR 形式）
+    counts = array("I", bytes(4 * (cols * rows)))
+    ranges = [cell_range(b) for b in boxes]
+    for i0, i1, j0, j1 in ranges:
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                counts[j * cols + i] += 1
+    offsets = array("I", [0])
+    for c in counts:
+        offsets.append(offsets[-1] + c)
+    items = array("I", bytes(4 * offsets[-1]))
+    cursor = array("I", offsets[:-1])
+    for index, (i0, i1, j0, j1) in enumerate(ranges):
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                c = j * cols + i
+                items[cursor[c]] = index
+                cursor[c] += 1
+
+    return CollisionIndex(origin_x, origin_z, cell_size, cols, rows, packed, offsets, items)
+
+
+# ============================================================
+# 入力の読み込み
+# ============================================================
+
+def _connected_components(positions, triangles):
+    """三角形でつながった頂点の集合ごとのラベル（近い頂点は溶接してから求める）"""
+    import numpy as np
+
+    keys = np.round(positions / WELD_EPSILON).astype(np.int64)
+    _, welded = np.unique(keys, axis=0, return_inverse=True)
+    welded = welded.ravel()
+    tris = welded[triangles]
+    labels = np.arange(welded.max() + 1)
+    # 三角形内の最小ラベルを伝播し、ポインタジャンプで縮める。変化がなくなるまで繰り返す
+    while True:
+        tri_min = labels[tris].min(axis=1)
+        updated = labels.copy()
+        np.minimum.at(updated, tris.ravel(), np.repeat(tri_min, 3))
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return labels[welded]
+
+
+def is_building_box(
+    box: Box,
+    min_height: float = DEFAULT_MIN_HEIGHT,
+    max_footprint: float = DEFAULT_MAX_FOOTPRINT
+) -> bool:
+    """建物らしい AABB か（平たいもの・街全体に広がるものは地面・道路とみなす）"""
+    return box[4] - box[1] >= min_height and max(box[3] - box[0], box[5] - box[2]) <= max_footprint
+
+
+def boxes_from_glb(
+    path: str,
+    components: bool = False,
+    min_height: float = DEFAULT_MIN_HEIGHT,
+    max_footprint: float = DEFAULT_MAX_FOOTPRINT,
+    skipped: Optional[List[Box]] = None
+) -> List[Box]:
+    """
+    GLB のメッシュノード（components=True なら連結成分）ごとの AABB を読む。
+    名前が GROUND_NAME_PATTERN に合うノードと、is_building_box でない AABB（地面・道路）は除く。
+    skipped を渡すと除いた AABB を入れる。
+    """
+    import numpy as np
+    from glb_reader import load_glb, iter_world_triangles
+
+    if skipped is None:
+        skipped = []
+    boxes: List[Box] = []
+    for name, positions, tris in iter_world_triangles(load_glb(path)):
+        used = np.unique(tris)
+        if not components:
+            lo = positions[used].min(axis=0)
+            hi = positions[used].max(axis=0)
+            found = [tuple(float(v) for v in (*lo, *hi))]
+        else:
+            labels = _connected_components(positions, tris)[used]
+            pts = positions[used]
+            order = np.argsort(labels, kind="stable")
+            starts = np.flatnonzero(np.r_[True, labels[order][1:] != labels[order][:-1]])
+            lo = np.minimum.reduceat(pts[order], starts, axis=0)
+            hi = np.maximum.reduceat(pts[order], starts, axis=0)
+            found = [tuple(float(v) for v in (*a, *b)) for a, b in zip(lo, hi)]
+        ground = bool(GROUND_NAME_PATTERN.search(name))
+        for box in found:
+            if not ground and is_building_box(box, min_height, max_footprint):
+                boxes.append(box)
+            else:
+                skipped.append(box)
+    return boxes
+
+
+# ============================================================
+# 保存・読み込み
+# ============================================================
+
+def _le(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def pack_collision_index(index: CollisionIndex) -> bytes:
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, index.num_boxes, index.cols, index.rows, len(index.items),
+        index.origin_x, index.origin_z, index.cell_size,
+    )
+    return header + _le(index.boxes) + _le(index.offsets) + _le(index.items)
+
+
+def unpack_collision_index(data: bytes) -> CollisionIndex:
+    view = memoryview(data)
+    magic, version, _, num_boxes, cols, rows, num_items, origin_x, origin_z, cell_size = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("当たり判定インデックスのバイナリ形式ではありません")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"未対応のバージョンです: {version}")
+    pos = _HEADER.size
+    parts = []
+    for typecode, count in (("f", num_boxes * 6), ("I", cols * rows + 1), ("I", num_items)):
+        values = array(typecode)
+        values.frombytes(view[pos:pos + 4 * count])
+        if sys.byteorder == "big":
+            values.byteswap()
+        parts.append(values)
+        pos += 4 * count
+    return CollisionIndex(origin_x, origin_z, cell_size, cols, rows, *parts)
+
+
+def save_collision_index(index: CollisionIndex, path: str):
+    data = pack_collision_index(index)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    print(f"保存完了: {path} ({index.num_boxes} 個, {index.cols} x {index.rows} セル, {len(data):,} bytes)")
+
+
+def load_collision_index(path: str) -> CollisionIndex:
+    with open(path, 'rb') as f:
+        return unpack_collision_index(f.read())
+
+
+# ============================================================
+# 総当たりとの一致確認
+# ============================================================
+
+def brute_force_boxes_at(boxes: array, x: float, z: float) -> List[int]:
+    """全 AABB を走査して (x, z) を含むものを探す（city.js の collisionBoxes と同じ方法）"""
+    return [
+        i for i in range(len(boxes) // 6)
+        if boxes[i * 6] <= x <= boxes[i * 6 + 3] and boxes[i * 6 + 2] <= z <= boxes[i * 6 + 5]
+    ]
+
+
+def verify_collision_index(index: CollisionIndex, samples: int = 2000, seed: int = 0) -> int:
+    """
+    ランダムな地点と AABB の角・辺上の地点で、インデックスの問い合わせと総当たりの結果を比べる。
+    返り値: 一致しなかった地点の数
+    """
+    rng = random.Random(seed)
+    points = []
+    if index.num_boxes:
+        x0 = index.origin_x - index.cell_size
+        z0 = index.origin_z - index.cell_size
+        x1 = index.origin_x + (index.cols + 1) * index.cell_size
+        z1 = index.origin_z + (index.rows + 1) * index.cell_size
+        points += [(rng.uniform(x0, x1), rng.uniform(z0, z1)) for _ in range(samples)]
+        # 境界上の判定（<=）も確かめる
+        for _ in range(min(samples, index.num_boxes * 4)):
+            b = index.box(rng.randrange(index.num_boxes))
+            points.append((rng.choice((b[0], b[3])), rng.choice((b[2], b[5], (b[2] + b[5]) / 2))))
+    mismatches = 0
+    for x, z in points:
+        # float32 の AABB と比べるので、地点も float32 に丸めてから問い合わせる
+        x, z = array("f", (x, z))
+        if sorted(index.boxes_at(x, z)) != brute_force_boxes_at(index.boxes, x, z):
+            mismatches += 1
+    return mismatches
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(script_dir)
+
+    parser = argparse.ArgumentParser(description="建物 AABB の当たり判定用インデックスを作る")
+    parser.add_argument("--glb", default=None, help="GLB から作る（省略時は gltf/city.glb）")
+    parser.add_argument("--components", action="store_true", help="GLB のメッシュを連結成分（建物）ごとの AABB に分ける")
+    parser.add_argument("--min-height", type=float, default=DEFAULT_MIN_HEIGHT,
+                        help="これより低い（平たい）AABB は地面・道路として除く（メートル）")
+    parser.add_argument("--max-footprint", type=float, default=DEFAULT_MAX_FOOTPRINT,
+                        help="XZ の長い辺がこれより大きい AABB は地面・道路として除く（メートル）")
+    parser.add_argument("--cell", type=float, default=None, help="セルの大きさ（メートル。省略時は AABB の大きさから決める）")
+    parser.add_argument("--out", default=os.path.join(project_dir, "gltf", "city_collision.bin"), help="出力先")
+    parser.add_argument("--check", type=int, default=2000, help="総当たりと比べる地点の数（0 で確認しない）")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("当たり判定インデックスの作成")
+    print("=" * 50)
+
+    glb_path = args.glb or os.path.join(project_dir, "gltf", "city.glb")
+    if not os.path.exists(glb_path):
+        print(f"\nエラー: {glb_path} が見つかりません")
+        raise SystemExit(1)
+    skipped: List[Box] = []
+    boxes = boxes_from_glb(glb_path, args.components, args.min_height, args.max_footprint, skipped)
+    if skipped:
+        print(f"\n地面・道路として除いた AABB: {len(skipped)} 個")
+
+    index = build_collision_index(boxes, args.cell)
+    counts = [index.offsets[c + 1] - index.offsets[c] for c in range(index.cols * index.rows)]
+    print(f"\nAABB: {index.num_boxes} 個 / セル: {index.cell_size:.2f} m")
+    print(f"セルあたりの AABB: 平均 {sum(counts) / len(counts):.2f} / 最大 {max(counts)}")
+    save_collision_index(index, args.out)
+
+    if args.check:
+        restored = load_collision_index(args.out)
+        mismatches = verify_collision_index(restored, args.check)
+        print(f"総当たりとの一致確認: {'OK' if not mismatches else f'NG（{mismatches} 地点）'}")
+        if mismatches:
+            raise SystemExit(1)
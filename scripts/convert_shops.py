@@ -7,12 +7,24 @@
 4. ゲーム用の装備データ（data/equipment_spawns.json）を出力
 """
 
+import hashlib
 import json
+import math
 import os
 import random
-from typing import List, Dict, Any, Optional, Tuple
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (
+    List, Dict, Any, Optional, Tuple, Sequence, Iterable, Iterator, Callable, Set, FrozenSet, Deque, TypeVar
+)
 from dataclasses import dataclass, asdict
 
+from coord_transform import TransformParams
+from spawn_pack import write_spawn_pack, KIND_FOOD, KIND_EQUIPMENT
+
+T = TypeVar("T")
+
 # ============================================================
 # 食べ物の定義
 # ============================================================
@@ -153,10 +165,19 @@ class EquipmentSpawn:
     realLng: float
 
 
-def random_food_type() -> str:
+def shop_rng(osm_id: int, kind: str) -> random.Random:
+    """
+    お店ごとの乱数生成器を返す。
+    osm_id と用途（"food" / "equipment"）から種を決めるので、何度変換しても同じ結果になる。
+    """
+    return random.Random(f"{kind}:{osm_id}")
+
+
+def random_food_type(rng: Optional[random.Random] = None) -> str:
     """ランダムで食べ物タイプを選択"""
+    rng = rng or random
     total = sum(RANDOM_WEIGHTS.values())
-    r = random.random() * total
+    r = rng.random() * total
     for type_id, weight in RANDOM_WEIGHTS.items():
         r -= weight
         if r <= 0:
@@ -180,11 +201,31 @@ def transform_coordinates(
     return round(game_x, 2), round(game_z, 2)
 
 
+def transform_shop_coordinates(
+    shops: Sequence[Dict[str, Any]],
+    transform_params: Dict[str, Any]
+) -> List[Tuple[float, float]]:
+    """
+    全店舗の緯度経度を列にまとめて一括でゲーム座標に変換。
+    返り値は shops と同じ順の (game_x, game_z) のリスト（小数2桁に丸め済み）。
+    """
+    lats = array('d', [shop["lat"] for shop in shops])
+    lngs = array('d', [shop["lng"] for shop in shops])
+    params = TransformParams.from_dict(transform_params)
+    xs, zs = params.real_to_game_batch(lats, lngs)
+    return [(round(float(x), 2), round(float(z), 2)) for x, z in zip(xs, zs)]
+
+
 def convert_shop_to_food(
     shop: Dict[str, Any],
-    transform_params: Dict[str, Any]
+    transform_params: Dict[str, Any],
+    game_xz: Optional[Tuple[float, float]] = None,
+    rng: Optional[random.Random] = None
 ) -> Optional[FoodSpawn]:
-    """お店情報をFoodSpawnに変換"""
+    """
+    お店情報をFoodSpawnに変換。
+    rng を省略した場合は osm_id から決まる乱数を使う（毎回同じ結果）。
+    """
     category = shop["category"]
     
     # 食べ物系カテゴリでなければスキップ
@@ -193,12 +234,15 @@ def convert_shop_to_food(
     
     lat = shop["lat"]
     lng = shop["lng"]
-    game_x, game_z = transform_coordinates(lat, lng, transform_params)
+    # 一括変換済みの座標があればそれを使う
+    if game_xz is None:
+        game_xz = transform_coordinates(lat, lng, transform_params)
+    game_x, game_z = game_xz
 
     # カテゴリから食べ物タイプを決定
     food_type = CATEGORY_TO_FOOD_TYPE.get(category, "energy")
     if food_type == "random":
-        food_type = random_food_type()
+        food_type = random_food_type(rng or shop_rng(shop["osm_id"], "food"))
 
     # tagsから追加情報を取得
     tags = shop.get("tags", {})
@@ -221,9 +265,14 @@ def convert_shop_to_food(
 
 def convert_shop_to_equipment(
     shop: Dict[str, Any],
-    transform_params: Dict[str, Any]
+    transform_params: Dict[str, Any],
+    game_xz: Optional[Tuple[float, float]] = None,
+    rng: Optional[random.Random] = None
 ) -> Optional[EquipmentSpawn]:
-    """お店情報をEquipmentSpawnに変換"""
+    """
+    お店情報をEquipmentSpawnに変換。
+    rng を省略した場合は osm_id から決まる乱数を使う（毎回同じ結果）。
+    """
     category = shop["category"]
     
     # 装備系カテゴリでなければスキップ
@@ -232,11 +281,15 @@ def convert_shop_to_equipment(
     
     lat = shop["lat"]
     lng = shop["lng"]
-    game_x, game_z = transform_coordinates(lat, lng, transform_params)
+    # 一括変換済みの座標があればそれを使う
+    if game_xz is None:
+        game_xz = transform_coordinates(lat, lng, transform_params)
+    game_x, game_z = game_xz
 
     # カテゴリから装備タイプを決定
+    rng = rng or shop_rng(shop["osm_id"], "equipment")
     equip_types = CATEGORY_TO_EQUIPMENT.get(category, ["bag"])
-    selected_type = random.choice(equip_types)
+    selected_type = rng.choice(equip_types)
     
     # tagsから追加情報を取得
     tags = shop.get("tags", {})
@@ -244,7 +297,7 @@ def convert_shop_to_equipment(
     
     # 宝石の場合
     if selected_type == "gem":
-        gem = random.choice(BIRTHSTONES)
+        gem = rng.choice(BIRTHSTONES)
         return EquipmentSpawn(
             id=f"equip_{shop['osm_id']}",
             shopName=shop["name"],
@@ -289,11 +342,16 @@ def convert_shop_to_equipment(
     )
 
 
-def load_shops_raw(path: str) -> List[Dict[str, Any]]:
-    """shops_raw.json を読み込み"""
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data.get("shops", [])
+def load_shops_raw(path: str) -> Sequence[Dict[str, Any]]:
+    """
+    shops_raw.json を読み込み。
+    お店は1件ずつ読みながら列指向のテーブル（shop_table.ShopTable）に詰める。
+    テーブルを走査すると shops_raw.json の1件と同じ辞書が返る。
+    """
+    # shop_table は convert_shops を読み込むので、ここで読み込む
+    from shop_table import load_shop_table
+
+    return load_shop_table(path)[1]
 
 
 def load_transform_params(path: str) -> Dict[str, Any]:
@@ -302,101 +360,525 @@ def load_transform_params(path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
+# ============================================================
+# 出力（スポーンを1件ずつ書き出す）
+# ============================================================
+
+# 出力ごとのファイル名・説明・バイナリ形式の種類
+SPAWN_OUTPUTS = {
+    "food": {
+        "filename": "food_spawns",
+        "description": "浅草橋駅周辺のお店に基づく食べ物スポーン位置",
+        "pack_kind": KIND_FOOD,
+        "category_key": "category",
+    },
+    "equipment": {
+        "filename": "equipment_spawns",
+        "description": "浅草橋駅周辺のお店に基づく装備スポーン位置",
+        "pack_kind": KIND_EQUIPMENT,
+        "category_key": "shopCategory",
+    },
+}
+
+
+class SpawnJsonWriter:
+    """
+    スポーンを1件ずつ JSON に書き出す（全件をリストに溜めない）。
+    書き出し中は一時ファイルに書き、close() で置き換える。
+    件数は書き終えるまで分からないので "count" は "spawns" の後に置く。
+    """
+
+    def __init__(self, path: str, description: str, transform_params: Dict[str, Any]):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.count = 0
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        header = {
+            "version": "1.0",
+            "description": description,
+            "transform": transform_params,
+        }
+        text = json.dumps(header, ensure_ascii=False, indent=2)
+        self._file.write(text[:-2] + ',\n  "spawns": [')
+
+    def write(self, spawn: Dict[str, Any]):
+        item = json.dumps(spawn, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        self._file.write(("," if self.count else "") + "\n    " + item)
+        self.count += 1
+
+    def close(self):
+        self._file.write(("\n  " if self.count else "") + f'],\n  "count": {self.count}\n}}')
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        print(f"保存完了: {self.path} ({self.count} 件)")
+
+
+class SpawnPackWriter:
+    """スポーンをバイナリ形式（spawn_pack.py）で書き出す。列指向なので close() でまとめて詰める"""
+
+    def __init__(self, path: str, kind: int, description: str, transform_params: Dict[str, Any]):
+        self.path = path
+        self.kind = kind
+        self.description = description
+        self.transform_params = transform_params
+        self.spawns: List[Dict[str, Any]] = []
+
+    def write(self, spawn: Dict[str, Any]):
+        self.spawns.append(spawn)
+
+    def close(self):
+        write_spawn_pack(self.path, self.kind, self.spawns, self.transform_params, self.description)
+
+
+class SpawnSummary:
+    """サマリー表示用に、件数・種類別の集計・座標範囲・先頭10件を逐次集計する"""
+
+    def __init__(self, group_keys: Sequence[str], head_size: int = 10):
+        self.group_keys = group_keys
+        self.head_size = head_size
+        self.count = 0
+        self.groups: Dict[str, Dict[str, int]] = {key: {} for key in group_keys}
+        self.min_x = self.min_z = float("inf")
+        self.max_x = self.max_z = float("-inf")
+        self.head: List[Dict[str, Any]] = []
+
+    def write(self, spawn: Dict[str, Any]):
+        self.count += 1
+        for key in self.group_keys:
+            group = self.groups[key]
+            group[spawn[key]] = group.get(spawn[key], 0) + 1
+        self.min_x = min(self.min_x, spawn["gameX"])
+        self.max_x = max(self.max_x, spawn["gameX"])
+        self.min_z = min(self.min_z, spawn["gameZ"])
+        self.max_z = max(self.max_z, spawn["gameZ"])
+        if len(self.head) < self.head_size:
+            self.head.append(spawn)
+
+    def close(self):
+        pass
+
+
+# ============================================================
+# スポーン数の上限（区画ごと・カテゴリごと）
+# ============================================================
+
+@dataclass
+class SpawnBudget:
+    """区画ごとのスポーン数の上限。0 は制限なし"""
+    cell_size: float = 100.0     # 区画の一辺（ゲーム座標のメートル）
+    max_per_cell: int = 0        # 区画あたりの上限
+    max_per_category: int = 0    # 区画・カテゴリあたりの上限
+    min_spacing: float = 0.0     # スポーン同士の最小距離
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_per_cell > 0 or self.max_per_category > 0 or self.min_spacing > 0
+
+
+def spawn_priority(spawn_id: str) -> int:
+    """スポーンの選ばれる順（id から決まる乱数なので、何度変換しても同じ順になる）"""
+    return int(hashlib.sha1(spawn_id.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def select_spawns(
+    spawns: Sequence[Dict[str, Any]],
+    budget: SpawnBudget,
+    category_key: str
+) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], str]]]:
+    """
+    上限の範囲でスポーンを選ぶ（Poisson disk のダーツ投げ）。
+    id から決まるランダムな順に1件ずつ見て、区画・カテゴリの上限に達しておらず、
+    選んだスポーンから min_spacing 以上離れていれば選ぶ。ランダムな順に間隔を空けて選ぶので、
+    密集した通りでは間引かれ、まばらな所はそのまま残る（ブルーノイズ状の分布になる）。
+    間隔の判定は一辺 min_spacing のグリッドの周囲 3x3 セルだけを見る。
+    返り値: (選んだスポーン（元の順）, [(外したスポーン, 理由), ...]（元の順）)。理由は "cell" / "category" / "spacing"
+    """
+    order = sorted(range(len(spawns)), key=lambda i: (spawn_priority(spawns[i]["id"]), i))
+    cell_counts: Dict[Tuple[int, int], int] = {}
+    category_counts: Dict[Tuple[int, int, str], int] = {}
+    grid: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+    spacing = budget.min_spacing
+    reasons: Dict[int, str] = {}
+
+    for i in order:
+        spawn = spawns[i]
+        x, z = spawn["gameX"], spawn["gameZ"]
+        cell = (math.floor(x / budget.cell_size), math.floor(z / budget.cell_size))
+        category = (*cell, spawn[category_key])
+        if budget.max_per_cell and cell_counts.get(cell, 0) >= budget.max_per_cell:
+            reasons[i] = "cell"
+            continue
+        if budget.max_per_category and category_counts.get(category, 0) >= budget.max_per_category:
+            reasons[i] = "category"
+            continue
+        if spacing > 0:
+            gx, gz = math.floor(x / spacing), math.floor(z / spacing)
+            if any(
+                (px - x) ** 2 + (pz - z) ** 2 < spacing * spacing
+                for dx in (-1, 0, 1) for dz in (-1, 0, 1)
+                for px, pz in grid.get((gx + dx, gz + dz), ())
+            ):
+                reasons[i] = "spacing"
+                continue
+            grid.setdefault((gx, gz), []).append((x, z))
+        cell_counts[cell] = cell_counts.get(cell, 0) + 1
+        category_counts[category] = category_counts.get(category, 0) + 1
+
+    kept = [spawn for i, spawn in enumerate(spawns) if i not in reasons]
+    dropped = [(spawns[i], reasons[i]) for i in sorted(reasons)]
+    return kept, dropped
+
+
+class SpawnBudgetFilter:
+    """
+    上限を掛けてから後ろの書き出し先に流す（全件を見ないと選べないので close() まで溜める）。
+    外したスポーンは reserve に "reason" 付きで書き出す（ゲームがリスポーン時に入れ替えて使う）。
+    """
+
+    def __init__(self, budget: SpawnBudget, category_key: str, sinks: List[Any], reserve: Any = None):
+        self.budget = budget
+        self.category_key = category_key
+        self.sinks = sinks
+        self.reserve = reserve
+        self.spawns: List[Dict[str, Any]] = []
+        self.dropped: Dict[str, int] = {}
+
+    def write(self, spawn: Dict[str, Any]):
+        self.spawns.append(spawn)
+
+    def close(self):
+        kept, dropped = select_spawns(self.spawns, self.budget, self.category_key)
+        for spawn in kept:
+            for sink in self.sinks:
+                sink.write(spawn)
+        for spawn, reason in dropped:
+            self.dropped[reason] = self.dropped.get(reason, 0) + 1
+            if self.reserve:
+                self.reserve.write({**spawn, "reason": reason})
+        for sink in self.sinks:
+            sink.close()
+        if self.reserve:
+            self.reserve.close()
+
+
 def save_food_spawns(spawns: List[FoodSpawn], path: str, transform_params: Dict[str, Any]):
     """食べ物用JSONを保存"""
-    data = {
-        "version": "1.0",
-        "description": "浅草橋駅周辺のお店に基づく食べ物スポーン位置",
-        "transform": transform_params,
-        "count": len(spawns),
-        "spawns": [asdict(s) for s in spawns]
-    }
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"保存完了: {path} ({len(spawns)} 件)")
+    writer = SpawnJsonWriter(path, SPAWN_OUTPUTS["food"]["description"], transform_params)
+    for spawn in spawns:
+        writer.write(asdict(spawn))
+    writer.close()
 
 
 def save_equipment_spawns(spawns: List[EquipmentSpawn], path: str, transform_params: Dict[str, Any]):
     """装備用JSONを保存"""
-    data = {
-        "version": "1.0",
-        "description": "浅草橋駅周辺のお店に基づく装備スポーン位置",
-        "transform": transform_params,
-        "count": len(spawns),
-        "spawns": [asdict(s) for s in spawns]
+    writer = SpawnJsonWriter(path, SPAWN_OUTPUTS["equipment"]["description"], transform_params)
+    for spawn in spawns:
+        writer.write(asdict(spawn))
+    writer.close()
+
+
+# ============================================================
+# 変換パイプライン
+# ============================================================
+
+@dataclass
+class ConverterStage:
+    """変換ステージ: 対象カテゴリのお店を1種類のスポーンに変換する"""
+    output: str  # 出力名（"food", "equipment" など）
+    categories: FrozenSet[str]
+    id_prefix: str  # スポーンIDの接頭辞（id = 接頭辞 + osm_id）
+    convert: Callable[..., Any]  # (shop, transform_params, game_xz) -> スポーン or None
+
+
+# 登録済みのステージ（登録順に出力される）とカテゴリ別の索引
+CONVERTER_STAGES: List[ConverterStage] = []
+STAGES_BY_CATEGORY: Dict[str, List[ConverterStage]] = {}
+
+
+def register_converter(
+    output: str,
+    categories: Iterable[str],
+    id_prefix: str,
+    convert: Callable[..., Any]
+) -> ConverterStage:
+    """
+    変換ステージを登録する（敵・ランドマーク等の新しいスポーン種別もここに追加する）。
+    プロセスプールで変換する場合もワーカー側で同じ登録が必要なので、モジュール読み込み時に呼ぶこと。
+    """
+    stage = ConverterStage(output, frozenset(categories), id_prefix, convert)
+    CONVERTER_STAGES.append(stage)
+    for category in stage.categories:
+        STAGES_BY_CATEGORY.setdefault(category, []).append(stage)
+    return stage
+
+
+register_converter("food", FOOD_CATEGORIES, "food_", convert_shop_to_food)
+register_converter("equipment", EQUIPMENT_CATEGORIES, "equip_", convert_shop_to_equipment)
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+def _convert_chunk(
+    shops: List[Dict[str, Any]],
+    transform_params: Dict[str, Any]
+) -> List[List[Tuple[str, Dict[str, Any]]]]:
+    """
+    お店のまとまりを変換する（プロセスプールのワーカーでも実行される）。
+    座標はまとめて一括変換し、お店ごとに (出力名, スポーン辞書) のリストを返す。
+    """
+    results = []
+    for shop, game_xz in zip(shops, transform_shop_coordinates(shops, transform_params)):
+        records = []
+        for stage in STAGES_BY_CATEGORY.get(shop["category"], ()):
+            spawn = stage.convert(shop, transform_params, game_xz)
+            if spawn:
+                records.append((stage.output, asdict(spawn)))
+        results.append(records)
+    return results
+
+
+def _chunks(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_pipeline(
+    shops: Iterable[Dict[str, Any]],
+    transform_params: Dict[str, Any],
+    sinks: Dict[str, List[Any]],
+    previous: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None,
+    dirty_ids: Optional[Set[int]] = None,
+    workers: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Dict[str, int]:
+    """
+    お店を1回だけ走査し、カテゴリに対応するステージで変換して出力先（sinks）に流す。
+    sinks は 出力名 → write(spawn) を持つ書き出し先のリスト。
+    previous / dirty_ids を渡すと、dirty_ids 以外のお店は previous のスポーンをそのまま使う（差分変換）。
+    workers > 0 ならプロセスプールでチャンクごとに並列変換する（出力順はお店の順のまま）。
+    返り値: 出力名ごとの件数
+    """
+    counts = {name: 0 for name in sinks}
+
+    def emit(output: str, spawn: Dict[str, Any]):
+        for sink in sinks.get(output, ()):
+            sink.write(spawn)
+        if output in counts:
+            counts[output] += 1
+
+    def needs_convert(shop: Dict[str, Any]) -> bool:
+        return previous is None or dirty_ids is None or shop["osm_id"] in dirty_ids
+
+    def flush(chunk: List[Dict[str, Any]], converted: List[List[Tuple[str, Dict[str, Any]]]]):
+        converted_iter = iter(converted)
+        for shop in chunk:
+            if needs_convert(shop):
+                for output, spawn in next(converted_iter):
+                    emit(output, spawn)
+                continue
+            for stage in STAGES_BY_CATEGORY.get(shop["category"], ()):
+                spawn = previous.get(stage.output, {}).get(f"{stage.id_prefix}{shop['osm_id']}")
+                if spawn:
+                    emit(stage.output, spawn)
+
+    chunks = _chunks(shops, chunk_size)
+    if workers <= 0:
+        for chunk in chunks:
+            flush(chunk, _convert_chunk([s for s in chunk if needs_convert(s)], transform_params))
+        return counts
+
+    # 先読みするチャンク数を制限して、メモリ使用量を一定に保つ
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Tuple[List[Dict[str, Any]], Future]] = deque()
+        for chunk in chunks:
+            todo = [s for s in chunk if needs_convert(s)]
+            pending.append((chunk, executor.submit(_convert_chunk, todo, transform_params)))
+            if len(pending) >= workers * 2:
+                done_chunk, future = pending.popleft()
+                flush(done_chunk, future.result())
+        while pending:
+            done_chunk, future = pending.popleft()
+            flush(done_chunk, future.result())
+    return counts
+
+
+# ============================================================
+# 差分変換
+# ============================================================
+
+# 変換結果に影響するお店のフィールド
+SHOP_HASH_FIELDS = ("osm_id", "name", "category", "lat", "lng")
+SHOP_HASH_TAGS = ("name:ja", "cuisine")
+
+MANIFEST_VERSION = "1.0"
+
+
+def _hash_json(value: Any) -> str:
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def shop_content_hash(shop: Dict[str, Any]) -> str:
+    """変換に使うフィールドだけのハッシュ（それ以外のタグが変わっても再変換しない）"""
+    tags = shop.get("tags", {})
+    fields = {key: shop.get(key) for key in SHOP_HASH_FIELDS}
+    fields["tags"] = {key: tags.get(key, "") for key in SHOP_HASH_TAGS}
+    return _hash_json(fields)
+
+
+def transform_hash(transform_params: Dict[str, Any]) -> str:
+    """座標変換パラメータのハッシュ（係数のみ。reference_points 等の注記は含めない）"""
+    return _hash_json({key: transform_params[key] for key in ("scale_x", "scale_z", "offset_x", "offset_z")})
+
+
+def rules_hash() -> str:
+    """カテゴリ→アイテムの対応表と変換ステージ構成のハッシュ（変えたら全件再変換）"""
+    return _hash_json([
+        CATEGORY_TO_FOOD_TYPE, RANDOM_WEIGHTS, CATEGORY_TO_EQUIPMENT, EQUIPMENT_TYPES, BIRTHSTONES,
+        [[stage.output, sorted(stage.categories), stage.id_prefix] for stage in CONVERTER_STAGES],
+    ])
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """前回変換時のマニフェストを読み込み（なければ None）"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path: str, shop_hashes: Dict[str, str], transform_params: Dict[str, Any]):
+    """変換結果に対応するマニフェストを保存"""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "transform": transform_hash(transform_params),
+        "rules": rules_hash(),
+        "shops": shop_hashes,
     }
     with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"保存完了: {path} ({len(spawns)} 件)")
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
 
 
-def print_food_summary(spawns: List[FoodSpawn]):
+def _load_spawns(path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """既存の出力を id → スポーン の辞書で読み込み（なければ None）"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    spawns = {s["id"]: s for s in data.get("spawns", [])}
+    # groundY は bake_heightfield.py が後から書き込む値、reason は上限で外したスポーン（控え）の理由なので、
+    # 再利用するスポーンからは外す
+    for spawn in spawns.values():
+        spawn.pop("groundY", None)
+        spawn.pop("reason", None)
+    return spawns
+
+
+def load_previous_spawns(
+    shops: List[Dict[str, Any]],
+    transform_params: Dict[str, Any],
+    manifest_path: str,
+    output_paths: Dict[str, str],
+    full: bool = False,
+    reserve_paths: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[Dict[str, Dict[str, Dict[str, Any]]]], Set[int], Dict[str, Any]]:
+    """
+    前回のマニフェストと比べて、再変換が必要なお店を求める。
+    変換パラメータ・対応表が変わった場合や出力がない場合は全件変換（previous は None）。
+    出力を書き始める前に呼ぶこと（前回の出力をここで読み込む）。
+    reserve_paths の控え（上限で外したスポーン）があれば、それも前回のスポーンに含める。
+    返り値: (前回のスポーン, 再変換するお店の osm_id, 統計)
+    """
+    shop_hashes = {str(shop["osm_id"]): shop_content_hash(shop) for shop in shops}
+
+    manifest = None if full else load_manifest(manifest_path)
+    previous: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+    if (
+        manifest
+        and manifest.get("transform") == transform_hash(transform_params)
+        and manifest.get("rules") == rules_hash()
+    ):
+        previous = {}
+        for output, path in output_paths.items():
+            spawns = _load_spawns(path)
+            if spawns is None:
+                previous = None
+                break
+            reserve = _load_spawns(reserve_paths[output]) if reserve_paths and output in reserve_paths else None
+            previous[output] = {**(reserve or {}), **spawns}
+    if previous is None:
+        manifest = None
+
+    old_hashes = manifest["shops"] if manifest else {}
+    dirty = [shop for shop in shops if old_hashes.get(str(shop["osm_id"])) != shop_hashes[str(shop["osm_id"])]]
+
+    stats = {
+        "total": len(shops),
+        "added": sum(1 for shop in dirty if str(shop["osm_id"]) not in old_hashes),
+        "changed": sum(1 for shop in dirty if str(shop["osm_id"]) in old_hashes),
+        "removed": len(set(old_hashes) - set(shop_hashes)),
+        "full": previous is None,
+        "shop_hashes": shop_hashes,
+    }
+    return previous, {shop["osm_id"] for shop in dirty}, stats
+
+
+def print_food_summary(summary: SpawnSummary):
     """食べ物の変換結果サマリーを表示"""
     print("\n" + "=" * 50)
     print("食べ物変換結果サマリー")
     print("=" * 50)
 
-    # 食べ物タイプ別集計
-    types: Dict[str, int] = {}
-    for spawn in spawns:
-        types[spawn.foodTypeId] = types.get(spawn.foodTypeId, 0) + 1
-
-    print(f"\n総数: {len(spawns)} 件")
+    print(f"\n総数: {summary.count} 件")
     print("\n食べ物タイプ別:")
-    for type_id, count in sorted(types.items(), key=lambda x: -x[1]):
+    for type_id, count in sorted(summary.groups["foodTypeId"].items(), key=lambda x: -x[1]):
         print(f"  {type_id}: {count} 件")
 
     # 座標範囲
-    if spawns:
-        min_x = min(s.gameX for s in spawns)
-        max_x = max(s.gameX for s in spawns)
-        min_z = min(s.gameZ for s in spawns)
-        max_z = max(s.gameZ for s in spawns)
+    if summary.count:
         print(f"\nゲーム座標範囲:")
-        print(f"  X: {min_x:.2f} ~ {max_x:.2f}")
-        print(f"  Z: {min_z:.2f} ~ {max_z:.2f}")
+        print(f"  X: {summary.min_x:.2f} ~ {summary.max_x:.2f}")
+        print(f"  Z: {summary.min_z:.2f} ~ {summary.max_z:.2f}")
 
     print("\n最初の10件:")
-    for spawn in spawns[:10]:
-        print(f"  - {spawn.name} ({spawn.foodTypeId}) @ ({spawn.gameX}, {spawn.gameZ})")
+    for spawn in summary.head:
+        print(f"  - {spawn['name']} ({spawn['foodTypeId']}) @ ({spawn['gameX']}, {spawn['gameZ']})")
 
 
-def print_equipment_summary(spawns: List[EquipmentSpawn]):
+def print_equipment_summary(summary: SpawnSummary):
     """装備の変換結果サマリーを表示"""
     print("\n" + "=" * 50)
     print("装備変換結果サマリー")
     print("=" * 50)
 
-    # カテゴリ別集計
-    categories: Dict[str, int] = {}
-    types: Dict[str, int] = {}
-    for spawn in spawns:
-        categories[spawn.itemCategory] = categories.get(spawn.itemCategory, 0) + 1
-        types[spawn.typeId] = types.get(spawn.typeId, 0) + 1
-
-    print(f"\n総数: {len(spawns)} 件")
+    print(f"\n総数: {summary.count} 件")
     
     print("\nカテゴリ別:")
-    for cat, count in sorted(categories.items(), key=lambda x: -x[1]):
+    for cat, count in sorted(summary.groups["itemCategory"].items(), key=lambda x: -x[1]):
         print(f"  {cat}: {count} 件")
     
     print("\nタイプ別:")
-    for type_id, count in sorted(types.items(), key=lambda x: -x[1]):
+    for type_id, count in sorted(summary.groups["typeId"].items(), key=lambda x: -x[1]):
         print(f"  {type_id}: {count} 件")
 
     # 座標範囲
-    if spawns:
-        min_x = min(s.gameX for s in spawns)
-        max_x = max(s.gameX for s in spawns)
-        min_z = min(s.gameZ for s in spawns)
-        max_z = max(s.gameZ for s in spawns)
+    if summary.count:
         print(f"\nゲーム座標範囲:")
-        print(f"  X: {min_x:.2f} ~ {max_x:.2f}")
-        print(f"  Z: {min_z:.2f} ~ {max_z:.2f}")
+        print(f"  X: {summary.min_x:.2f} ~ {summary.max_x:.2f}")
+        print(f"  Z: {summary.min_z:.2f} ~ {summary.max_z:.2f}")
 
     print("\n最初の10件:")
-    for spawn in spawns[:10]:
-        print(f"  - {spawn.icon} {spawn.nameJa} ({spawn.effect}: {spawn.value:+.0%}) @ ({spawn.gameX}, {spawn.gameZ})")
+    for spawn in summary.head:
+        print(f"  - {spawn['icon']} {spawn['nameJa']} ({spawn['effect']}: {spawn['value']:+.0%}) @ ({spawn['gameX']}, {spawn['gameZ']})")
 
 
 # ============================================================
@@ -416,13 +898,35 @@ DEFAULT_TRANSFORM_PARAMS = {
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="お店情報をゲーム座標に変換")
+    parser.add_argument("--full", action="store_true", help="マニフェストを無視して全件変換する")
+    parser.add_argument("--packed", action="store_true", help="バイナリ形式（*_spawns.bin）も出力する")
+    parser.add_argument("--workers", type=int, default=0, help="プロセスプールで並列変換する場合のワーカー数（0: 使わない）")
+    parser.add_argument("--budget-cell", type=float, default=SpawnBudget.cell_size, help="上限を数える区画の一辺（メートル）")
+    parser.add_argument("--max-per-cell", type=int, default=0, help="区画あたりのスポーン数の上限（0: 制限なし）")
+    parser.add_argument("--max-per-category", type=int, default=0, help="区画・カテゴリあたりのスポーン数の上限（0: 制限なし）")
+    parser.add_argument("--min-spacing", type=float, default=0.0, help="スポーン同士の最小距離（メートル、0: 制限なし）")
+    parser.add_argument("--store", default=None, metavar="SQLITE", help="お店とスポーンを SQLite ストア（shop_store.py）にも書き込む")
+    args = parser.parse_args()
+    budget = SpawnBudget(args.budget_cell, args.max_per_cell, args.max_per_category, args.min_spacing)
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(os.path.dirname(script_dir), "data")
 
     shops_raw_path = os.path.join(data_dir, "shops_raw.json")
     transform_path = os.path.join(data_dir, "transform.json")
-    food_output_path = os.path.join(data_dir, "food_spawns.json")
-    equipment_output_path = os.path.join(data_dir, "equipment_spawns.json")
+    manifest_path = os.path.join(data_dir, "convert_manifest.json")
+    output_paths = {
+        name: os.path.join(data_dir, f"{output['filename']}.json")
+        for name, output in SPAWN_OUTPUTS.items()
+    }
+    # 上限で外したスポーン（控え）
+    reserve_paths = {
+        name: os.path.join(data_dir, f"{output['filename']}_reserve.json")
+        for name, output in SPAWN_OUTPUTS.items()
+    }
 
     print("=" * 50)
     print("お店情報をゲーム座標に変換")
@@ -453,34 +957,72 @@ if __name__ == "__main__":
     shops = load_shops_raw(shops_raw_path)
     print(f"\nお店データ読み込み: {len(shops)} 件")
 
-    # 食べ物の変換
-    food_spawns = []
-    for shop in shops:
-        spawn = convert_shop_to_food(shop, transform_params)
-        if spawn:
-            food_spawns.append(spawn)
+    # 追加・変更されたお店だけ変換する（前回の出力は書き出し前に読み込む）
+    previous, dirty_ids, stats = load_previous_spawns(
+        shops, transform_params, manifest_path, output_paths, full=args.full, reserve_paths=reserve_paths
+    )
+    if stats["full"]:
+        print(f"全件変換: {stats['total']} 件")
+    else:
+        print(f"差分変換: 追加 {stats['added']} 件 / 変更 {stats['changed']} 件 / 削除 {stats['removed']} 件")
 
-    print_food_summary(food_spawns)
-    save_food_spawns(food_spawns, food_output_path, transform_params)
-    
-    # 装備の変換
-    equipment_spawns = []
-    for shop in shops:
-        spawn = convert_shop_to_equipment(shop, transform_params)
-        if spawn:
-            equipment_spawns.append(spawn)
-
-    # 保存を先に実行（表示エラーでもデータは保存される）
-    save_equipment_spawns(equipment_spawns, equipment_output_path, transform_params)
-    
+    # 出力先: JSON ＋ サマリー集計（＋ バイナリ形式）
+    summaries = {
+        "food": SpawnSummary(["foodTypeId"]),
+        "equipment": SpawnSummary(["itemCategory", "typeId"]),
+    }
+    store = None
+    if args.store:
+        from shop_store import ShopStore, SpawnStoreWriter
+        store = ShopStore(args.store)
+        store.upsert_shops(shops)
+    sinks: Dict[str, List[Any]] = {}
+    for name, output in SPAWN_OUTPUTS.items():
+        sinks[name] = [
+            SpawnJsonWriter(output_paths[name], output["description"], transform_params),
+            summaries[name],
+        ]
+        if args.packed:
+            sinks[name].append(SpawnPackWriter(
+                os.path.join(data_dir, f"{output['filename']}.bin"),
+                output["pack_kind"], output["description"], transform_params
+            ))
+        if store:
+            sinks[name].append(SpawnStoreWriter(store, name, transform_params))
+        if budget.enabled:
+            reserve = SpawnJsonWriter(reserve_paths[name], output["description"] + "（上限で外した控え）", transform_params)
+            sinks[name] = [SpawnBudgetFilter(budget, output["category_key"], sinks[name], reserve)]
+
+    # 1回の走査で全種類のスポーンに変換して書き出す
+    counts = run_pipeline(shops, transform_params, sinks, previous, dirty_ids, workers=args.workers)
+    for outputs in sinks.values():
+        for sink in outputs:
+            sink.close()
+    if store:
+        store.close()
+    save_manifest(manifest_path, stats["shop_hashes"], transform_params)
+    if not budget.enabled:
+        # 前回の控えは今回すべて出力に戻したので消す
+        for path in reserve_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    if budget.enabled:
+        print(f"\nスポーン数の上限（区画 {budget.cell_size:g} m）:")
+        for name, outputs in sinks.items():
+            dropped = outputs[0].dropped
+            detail = " / ".join(f"{reason} {count} 件" for reason, count in sorted(dropped.items())) or "なし"
+            print(f"  {name}: {counts[name]} 件 → {summaries[name].count} 件（外した理由: {detail}）")
+
+    print_food_summary(summaries["food"])
     try:
-        print_equipment_summary(equipment_spawns)
+        print_equipment_summary(summaries["equipment"])
     except UnicodeEncodeError:
         # Windows PowerShellで絵文字が表示できない場合
-        print(f"\n装備: {len(equipment_spawns)} 件（詳細表示はスキップ）")
+        print(f"\n装備: {summaries['equipment'].count} 件（詳細表示はスキップ）")
 
     print("\n" + "=" * 50)
     print("変換完了!")
-    print(f"  食べ物: {len(food_spawns)} 件 → {food_output_path}")
-    print(f"  装備:   {len(equipment_spawns)} 件 → {equipment_output_path}")
+    print(f"  食べ物: {summaries['food'].count} 件 → {output_paths['food']}")
+    print(f"  装備:   {summaries['equipment'].count} 件 → {output_paths['equipment']}")
     print("=" * 50)
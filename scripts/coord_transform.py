@@ -6,8 +6,14 @@
 """
 
 import json
+from array import array
 from dataclasses import dataclass
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Any
+
+try:
+    import numpy as np
+except ImportError:  # 標準ライブラリのみの環境ではループ版で処理
+    np = None
 
 
 @dataclass
@@ -44,6 +50,20 @@ class TransformParams:
             }
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "TransformParams":
+        """transform.json 形式の辞書から生成"""
+        origin = data.get("origin", {})
+        return cls(
+            scale_x=data["scale_x"],
+            scale_z=data["scale_z"],
+            offset_x=data["offset_x"],
+            offset_z=data["offset_z"],
+            origin_lat=origin.get("lat", 0.0),
+            origin_lng=origin.get("lng", 0.0),
+            origin_name=origin.get("name", "")
+        )
+
     def real_to_game(self, lat: float, lng: float) -> Tuple[float, float]:
         """緯度・経度をゲーム座標に変換"""
         x = lng * self.scale_x + self.offset_x
@@ -56,6 +76,99 @@ class TransformParams:
         lat = (game_z - self.offset_z) / self.scale_z
         return (lat, lng)
 
+    def real_to_game_batch(
+        self,
+        lats: Any,
+        lngs: Any,
+        out_x: Any = None,
+        out_z: Any = None,
+        float32: bool = False
+    ) -> Tuple[Any, Any]:
+        """
+        緯度・経度の列をまとめてゲーム座標に変換（丸めなし）。
+        lats/lngs は NumPy 配列または array('d') などのバッファ。
+        out_x/out_z を渡すとその中に書き込む（事前確保したバッファを再利用できる）。
+        float32=True なら出力は float32（out_x/out_z の要素の型は float32 / array('f')、違えば ValueError）。
+        """
+        return _affine_batch(lngs, lats, self.scale_x, self.offset_x,
+                             self.scale_z, self.offset_z, out_x, out_z, float32)
+
+    def game_to_real_batch(
+        self,
+        game_xs: Any,
+        game_zs: Any,
+        out_lat: Any = None,
+        out_lng: Any = None,
+        float32: bool = False
+    ) -> Tuple[Any, Any]:
+        """ゲーム座標の列をまとめて緯度・経度に変換。返り値は (lats, lngs)"""
+        out_lng, out_lat = _affine_batch(
+            game_xs, game_zs,
+            1.0 / self.scale_x, -self.offset_x / self.scale_x,
+            1.0 / self.scale_z, -self.offset_z / self.scale_z,
+            out_lng, out_lat, float32
+        )
+        return (out_lat, out_lng)
+
+
+def _affine_batch(
+    src_a: Any,
+    src_b: Any,
+    scale_a: float,
+    offset_a: float,
+    scale_b: float,
+    offset_b: float,
+    out_a: Any,
+    out_b: Any,
+    float32: bool
+) -> Tuple[Any, Any]:
+    """
+    2列それぞれに a * scale + offset を適用する。
+    NumPy があれば1回のベクトル演算、なければ array のループで処理。
+    出力バッファの要素の型が float32 の指定と違う場合は ValueError（指定が黙って無視されないように）。
+    """
+    n = len(src_a)
+    if len(src_b) != n:
+        raise ValueError("入力列の長さが一致しません")
+
+    if np is not None:
+        dtype = np.float32 if float32 else np.float64
+        a = np.asarray(src_a, dtype=np.float64)
+        b = np.asarray(src_b, dtype=np.float64)
+        if out_a is None:
+            out_a = np.empty(n, dtype=dtype)
+        if out_b is None:
+            out_b = np.empty(n, dtype=dtype)
+        # array('d') 等もバッファとしてそのまま書き込み先にできる（コピーなし）
+        view_a = np.asarray(out_a)
+        view_b = np.asarray(out_b)
+        if len(view_a) < n or len(view_b) < n:
+            raise ValueError("出力バッファが入力より短いです")
+        for view in (view_a, view_b):
+            if view.dtype != dtype:
+                raise ValueError(f"出力バッファの型（{view.dtype}）が float32={float32} と一致しません")
+        view_a = view_a[:n]
+        view_b = view_b[:n]
+        # 緯度経度×係数は桁が大きいので、offset を足すまでは float64 で計算する
+        np.add(a * scale_a, offset_a, out=view_a, casting="same_kind")
+        np.add(b * scale_b, offset_b, out=view_b, casting="same_kind")
+        return (out_a, out_b)
+
+    typecode = "f" if float32 else "d"
+    if out_a is None:
+        out_a = array(typecode, bytes(n * array(typecode).itemsize))
+    if out_b is None:
+        out_b = array(typecode, bytes(n * array(typecode).itemsize))
+    if len(out_a) < n or len(out_b) < n:
+        raise ValueError("出力バッファが入力より短いです")
+    for out in (out_a, out_b):
+        if getattr(out, "typecode", typecode) != typecode:
+            raise ValueError(f"出力バッファの型（array('{out.typecode}')）が float32={float32} と一致しません")
+    for i in range(n):
+        out_a[i] = src_a[i] * scale_a + offset_a
+        out_b[i] = src_b[i] * scale_b + offset_b
+    return (out_a, out_b)
+
 
 def calculate_transform(points: List[ReferencePoint]) -> TransformParams:
     """
@@ -118,15 +231,7 @@ def load_transform(path: str) -> TransformParams:
     """変換パラメータをJSONから読み込み"""
     with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    return TransformParams(
-        scale_x=data["scale_x"],
-        scale_z=data["scale_z"],
-        offset_x=data["offset_x"],
-        offset_z=data["offset_z"],
-        origin_lat=data["origin"]["lat"],
-        origin_lng=data["origin"]["lng"],
-        origin_name=data["origin"]["name"]
-    )
+    return TransformParams.from_dict(data)
 
 
 # ============================================================
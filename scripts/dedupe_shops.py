@@ -0,0 +1,193 @@
+"""
+近くにある同じお店の統合（shops_raw.json の重複除去）
+
+OSM では同じお店がノードとウェイ（建物）の両方で登録されていたり、同じ名前のお店が数メートルおきに並んでいたりする。
+そのままだとゲームでは1軒ごとにスポーン（メッシュ・ビーム）が作られるので、
+fetch_shops.py の後・convert_shops.py の前に、距離が近く名前とカテゴリが同じお店を1件にまとめる。
+
+方法:
+  - 緯度経度を中心付近の平面（メートル）に投影し、統合距離を一辺とするセルに (名前, カテゴリ, セル) で登録する
+  - 各お店は周囲 3x3 セルの同じ名前・カテゴリのお店とだけ距離を比べ、統合距離以内ならつなぐ（Union-Find）
+  - つながったお店の中でタグの多いもの（同数なら osm_id の小さいもの）を残し、他のお店のタグで足りないキーを補う
+  - 残したお店の "source_osm_ids" に統合元のすべての osm_id を記録する
+セルごとの件数は距離で抑えられるので、全体で O(n)。
+"""
+
+import json
+import math
+import os
+import unicodedata
+from typing import Dict, Any, List, Tuple
+
+DEFAULT_MERGE_DISTANCE_M = 15.0
+
+# 緯度1度あたりの距離（メートル）
+METERS_PER_DEG_LAT = 111320.0
+
+
+def normalize_name(name: str) -> str:
+    """名前の比較用キー（全角・半角と大文字・小文字を揃え、空白と記号を除く）"""
+    text = unicodedata.normalize("NFKC", name).casefold()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in ("L", "N"))
+
+
+def _project(shops: List[Dict[str, Any]]) -> List[Tuple[float, float]]:
+    """緯度経度を平均緯度で正距円筒に投影した (x, y)（メートル）"""
+    if not shops:
+        return []
+    mean_lat = sum(s["lat"] for s in shops) / len(shops)
+    meters_per_deg_lng = METERS_PER_DEG_LAT * math.cos(math.radians(mean_lat))
+    return [(s["lng"] * meters_per_deg_lng, s["lat"] * METERS_PER_DEG_LAT) for s in shops]
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_duplicate_groups(
+    shops: List[Dict[str, Any]],
+    distance_m: float = DEFAULT_MERGE_DISTANCE_M,
+    match_category: bool = True
+) -> List[List[int]]:
+    """
+    統合するお店の番号のグループ（2件以上のものだけ）。
+    グループ内の番号と、グループ同士は先頭の番号の順に並ぶ。
+    """
+    points = _project(shops)
+    keys = [
+        (normalize_name(s["name"]), s["category"] if match_category else "")
+        for s in shops
+    ]
+    parent = list(range(len(shops)))
+    cells: Dict[Tuple[str, str, int, int], List[int]] = {}
+    limit = distance_m * distance_m
+
+    for i, (x, y) in enumerate(points):
+        cx = math.floor(x / distance_m)
+        cy = math.floor(y / distance_m)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells.get((*keys[i], cx + dx, cy + dy), ()):
+                    px, py = points[j]
+                    if (px - x) ** 2 + (py - y) ** 2 <= limit:
+                        ri, rj = _find(parent, i), _find(parent, j)
+                        if ri != rj:
+                            parent[max(ri, rj)] = min(ri, rj)
+        cells.setdefault((*keys[i], cx, cy), []).append(i)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(shops)):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def merge_group(shops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    同じお店のグループを1件にまとめる。
+    タグの多いお店（同数なら osm_id の小さいもの）を残し、座標もそのお店のものを使う。
+    """
+    keep = min(shops, key=lambda s: (-len(s.get("tags", {})), s["osm_id"]))
+    merged = dict(keep)
+    tags = dict(keep.get("tags", {}))
+    for shop in shops:
+        for key, value in shop.get("tags", {}).items():
+            tags.setdefault(key, value)
+        if not merged.get("name_en") and shop.get("name_en"):
+            merged["name_en"] = shop["name_en"]
+    merged["tags"] = tags
+    source_ids = set()
+    for shop in shops:
+        source_ids.update(shop.get("source_osm_ids", [shop["osm_id"]]))
+    merged["source_osm_ids"] = sorted(source_ids)
+    return merged
+
+
+def dedupe_shops(
+    shops: List[Dict[str, Any]],
+    distance_m: float = DEFAULT_MERGE_DISTANCE_M,
+    match_category: bool = True
+) -> Tuple[List[Dict[str, Any]], List[List[int]]]:
+    """
+    近くにある同じお店をまとめる。お店の順は保ち、グループは先頭のお店の位置に置く。
+    返り値: (統合後のお店, 統合したグループ（元の番号）)
+    """
+    groups = find_duplicate_groups(shops, distance_m, match_category)
+    first_of: Dict[int, List[int]] = {}
+    absorbed = set()
+    for members in groups:
+        first_of[members[0]] = members
+        absorbed.update(members[1:])
+
+    result = []
+    for i, shop in enumerate(shops):
+        if i in first_of:
+            result.append(merge_group([shops[j] for j in first_of[i]]))
+        elif i not in absorbed:
+            result.append(shop)
+    return result, groups
+
+
+def _distance_m(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    x = math.radians(b["lng"] - a["lng"]) * math.cos(math.radians((a["lat"] + b["lat"]) / 2))
+    y = math.radians(b["lat"] - a["lat"])
+    return math.hypot(x, y) * 6371000.0
+
+
+def save_shops_dedup(data: Dict[str, Any], shops: List[Dict[str, Any]], path: str, distance_m: float, merged: int):
+    """統合後のお店を shops_raw.json と同じ形式で保存（一時ファイルに書いてから置き換える）"""
+    data = dict(data)
+    data["count"] = len(shops)
+    data["dedupe"] = {"distance_m": distance_m, "merged": merged}
+    data["shops"] = shops
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"保存完了: {path} ({len(shops)} 件)")
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    default_path = os.path.join(os.path.dirname(script_dir), "data", "shops_raw.json")
+
+    parser = argparse.ArgumentParser(description="近くにある同じお店を1件にまとめる")
+    parser.add_argument("--input", default=default_path, help="入力（fetch_shops.py の shops_raw.json）")
+    parser.add_argument("--out", default=None, help="出力先（省略時は入力を上書き）")
+    parser.add_argument("--distance", type=float, default=DEFAULT_MERGE_DISTANCE_M, help="統合する距離（メートル）")
+    parser.add_argument("--any-category", action="store_true", help="カテゴリが違っても名前が同じなら統合する")
+    parser.add_argument("--dry-run", action="store_true", help="統合するグループを表示するだけで保存しない")
+    parser.add_argument("--show", type=int, default=10, help="表示するグループの数")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("近くにある同じお店の統合")
+    print("=" * 50)
+
+    if not os.path.exists(args.input):
+        print(f"\nエラー: {args.input} が見つかりません")
+        print("先に fetch_shops.py を実行してください")
+        raise SystemExit(1)
+    with open(args.input, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    shops = data.get("shops", [])
+
+    result, groups = dedupe_shops(shops, args.distance, not args.any_category)
+    merged = sum(len(g) - 1 for g in groups)
+    print(f"\nお店: {len(shops)} 件 → {len(result)} 件（{len(groups)} グループ、{merged} 件を統合、距離 {args.distance:g} m）")
+    for members in groups[:args.show]:
+        first = shops[members[0]]
+        spread = max(_distance_m(first, shops[j]) for j in members[1:])
+        ids = ", ".join(str(shops[j]["osm_id"]) for j in members)
+        print(f"  - {first['name']} ({first['category']}) × {len(members)}  最大 {spread:.1f} m  [{ids}]")
+
+    if not args.dry_run:
+        save_shops_dedup(data, result, args.out or args.input, args.distance, merged)
@@ -4,11 +4,23 @@ Overpass API（OpenStreetMap）からお店情報を取得するスクリプト
 浅草橋駅周辺の飲食店・コンビニ・装備店等を取得し、JSONで保存する。
 """
 
+import email.utils
 import json
+import math
+import sys
+import threading
+import time
+import urllib.error
 import urllib.request
 import urllib.parse
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable, TypeVar, BinaryIO, Sequence
+from dataclasses import dataclass
+
+from convert_shops import CATEGORY_TO_FOOD_TYPE, CATEGORY_TO_EQUIPMENT
+from overpass_cache import OverpassCache, CacheWriter, DEFAULT_TTL_S, DEFAULT_MAX_BYTES
+from overpass_stream import iter_overpass_elements, iter_overpass_file
 
 # Overpass API エンドポイント
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
@@ -18,100 +30,359 @@ DEFAULT_CENTER_LAT = 35.6963
 DEFAULT_CENTER_LNG = 139.7832
 DEFAULT_RADIUS_M = 500  # 検索半径（メートル）
 
+# タイル分割取得の既定値
+DEFAULT_TILE_SIZE_M = 500     # 1タイルの一辺（メートル）
+DEFAULT_MAX_IN_FLIGHT = 2     # 同時に投げるリクエスト数
+DEFAULT_RATE_PER_SEC = 1.0    # 1秒あたりのリクエスト開始数の上限
+DEFAULT_RETRIES = 3           # 失敗時の再試行回数
+DEFAULT_BACKOFF_S = 2.0       # 再試行の待ち時間（指数的に増やす）
+
+# 再試行すべき HTTP ステータス（混雑・タイムアウト系）
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# Retry-After で待つ時間の上限（秒）
+MAX_RETRY_AFTER_S = 300.0
+
+# 緯度1度あたりの距離（メートル）
+METERS_PER_DEG_LAT = 111320.0
+
+# 変換で使うタグ（--tags default で残すキー）。名前・カテゴリと convert_shops.py が読む name:ja / cuisine
+DEFAULT_TAG_ALLOWLIST = ("name", "name:ja", "name:en", "amenity", "shop", "cuisine")
+
+T = TypeVar("T")
+
 
 @dataclass
 class Shop:
-    """お店情報"""
+    """お店情報（件数が多くても小さく済むように __slots__ で持つ）"""
+    __slots__ = ("osm_id", "name", "name_en", "category", "lat", "lng", "tags")
     osm_id: int
     name: str
     name_en: Optional[str]
     category: str  # restaurant, cafe, convenience, etc.
     lat: float
     lng: float
-    tags: Dict[str, str]  # OSMの全タグ
+    tags: Dict[str, str]  # OSMのタグ（許可リストを指定した場合はそのキーだけ）
 
 
-def build_overpass_query(center_lat: float, center_lng: float, radius_m: int) -> str:
+def build_overpass_query(
+    center_lat: float,
+    center_lng: float,
+    radius_m: int,
+    tag_keys: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST
+) -> str:
     """
     Overpass QL クエリを構築。
     飲食店・カフェ・コンビニ・ファストフード・装備店等を検索。
+    tag_keys のタグだけを返す（None ならすべてのタグ）。
     """
-    # 検索対象のタグ - 食べ物系
-    amenities_food = [
-        "restaurant",
-        "cafe",
-        "fast_food",
-        "bar",
-        "pub",
-        "food_court",
-    ]
-    shops_food = [
-        "convenience",
-        "supermarket",
-        "bakery",
-        "confectionery",
-        "deli",
-    ]
-    
-    # 検索対象のタグ - 装備系
-    amenities_equip = [
-        "pharmacy",  # 薬局
-    ]
-    shops_equip = [
-        "jewelry",        # 宝石店 → 宝石
-        "bag",            # カバン店 → バッグ
-        "shoes",          # 靴屋 → 靴
-        "clothes",        # 衣料品店 → 防具、帽子、服
-        "sports",         # スポーツ用品 → 磁石、武器、翼
-        "electronics",    # 電器店 → 磁石
-        "optician",       # メガネ店 → メガネ
-        "watches",        # 時計店 → 時計
-        "chemist",        # ドラッグストア → 薬
-        "bicycle",        # 自転車店 → 自転車
-        "outdoor",        # アウトドア店 → 翼、釣り具
-        "fishing",        # 釣具店 → 釣り具
-        "houseware",      # 雑貨店 → 料理道具
-        "department_store",  # デパート → タオル、ランダム
-        "gift",           # ギフト店 → 旗
-        "variety_store",  # 100均・雑貨 → バッグ、旗
-        "hats",           # 帽子店 → 帽子
-    ]
-    
-    # 全てのamenityとshopを結合
-    all_amenities = amenities_food + amenities_equip
-    all_shops = shops_food + shops_equip
-
-    amenity_filter = "|".join(all_amenities)
-    shop_filter = "|".join(all_shops)
-
-    query = f"""
-[out:json][timeout:30];
-(
-  node["amenity"~"^({amenity_filter})$"](around:{radius_m},{center_lat},{center_lng});
-  node["shop"~"^({shop_filter})$"](around:{radius_m},{center_lat},{center_lng});
-  way["amenity"~"^({amenity_filter})$"](around:{radius_m},{center_lat},{center_lng});
-  way["shop"~"^({shop_filter})$"](around:{radius_m},{center_lat},{center_lng});
-);
-out center tags;
-"""
-    return query.strip()
+    return _build_query(f"(around:{radius_m},{center_lat},{center_lng})", tag_keys)
+
+
+def build_overpass_bbox_query(
+    bbox: Tuple[float, float, float, float],
+    tag_keys: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST
+) -> str:
+    """
+    矩形範囲 (south, west, north, east) で Overpass QL クエリを構築。
+    タイル分割取得で使用。
+    """
+    south, west, north, east = bbox
+    return _build_query(f"({south},{west},{north},{east})", tag_keys)
 
 
-def fetch_overpass(query: str) -> Dict[str, Any]:
-    """Overpass API にクエリを送信して結果を取得"""
+def query_categories() -> List[str]:
+    """検索対象のカテゴリ（amenity / shop の値）。変換の対応表にあるカテゴリをそのまま使う"""
+    return sorted(set(CATEGORY_TO_FOOD_TYPE) | set(CATEGORY_TO_EQUIPMENT))
+
+
+def _select_statement(area: str) -> str:
+    """対象のお店を選ぶ文（name があり、amenity または shop が対象カテゴリ）"""
+    category_filter = "|".join(query_categories())
+    return f'nwr[~"^(amenity|shop)$"~"^({category_filter})$"]["name"]{area};'
+
+
+def build_overpass_diff_query(center_lat: float, center_lng: float, radius_m: int, since: str) -> str:
+    """
+    since（ISO 8601 の UTC 時刻）以降に変わったお店だけを返す augmented diff のクエリ。
+    augmented diff は XML でしか返らず、convert も使えないので、タグはすべて返る（パース時に絞る）。
+    """
+    area = f"(around:{radius_m},{center_lat},{center_lng})"
+    return f'[out:xml][timeout:60][adiff:"{since}"];\n{_select_statement(area)}\nout center tags;'
+
+
+def _build_query(area: str, tag_keys: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST) -> str:
+    """
+    検索範囲の指定（around / bbox）を受け取ってクエリ本体を組み立てる。
+    絞り込みはサーバー側で行う:
+      - ノード・ウェイ・リレーションを nwr の1文でまとめて検索（amenity または shop が対象カテゴリ）
+      - name のないお店は返さない
+      - tag_keys を指定すると convert でそのタグと中心座標だけを返す（None なら out center tags ですべてのタグ）
+    """
+    select = _select_statement(area)
+    if tag_keys is None:
+        return f"[out:json][timeout:30];\n{select}\nout center tags;"
+
+    # 派生要素の型は "shop"。::geom に中心点を入れ、out geom で座標を返す（ないタグは空文字になるので parse_element で除く）
+    fields = ", ".join(f'"{key}" = t["{key}"]' for key in tag_keys)
+    return (
+        f"[out:json][timeout:30];\n{select}\n"
+        f"convert shop ::id = id(), ::geom = center(geom()), {fields};\n"
+        f"out geom;"
+    )
+
+
+def _build_request(query: str, url: str) -> urllib.request.Request:
     data = urllib.parse.urlencode({"data": query}).encode("utf-8")
-    req = urllib.request.Request(OVERPASS_URL, data=data, method="POST")
+    req = urllib.request.Request(url, data=data, method="POST")
     req.add_header("User-Agent", "GGJ2026-ShopFetcher/1.0")
+    return req
 
-    print(f"Overpass API にリクエスト中...")
-    with urllib.request.urlopen(req, timeout=60) as response:
-        result = json.loads(response.read().decode("utf-8"))
-    print(f"取得完了: {len(result.get('elements', []))} 件")
+
+def download_overpass(query: str, url: str = OVERPASS_URL) -> bytes:
+    """Overpass API にクエリを送信してレスポンス本体を取得"""
+    with urllib.request.urlopen(_build_request(query, url), timeout=60) as response:
+        return response.read()
+
+
+class _TeeReader:
+    """読み込んだデータをそのままキャッシュにも書き込むラッパー"""
+
+    def __init__(self, fp: BinaryIO, writer: CacheWriter):
+        self.fp = fp
+        self.writer = writer
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fp.read(size)
+        if data:
+            self.writer.write(data)
+        return data
+
+
+def stream_overpass(
+    query: str,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    limiter: Optional["RateLimiter"] = None,
+    meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Overpass API の結果を要素ごとに逐次返す（レスポンス全体をメモリに載せない）。
+    キャッシュにあればファイルから読み、なければ受信しながらキャッシュにも書き込む。
+    レート制限の待ちはネットワークにアクセスする場合のみ。
+    """
+    cached = cache.open(url, query) if cache else None
+    if cached is not None:
+        with cached:
+            yield from iter_overpass_elements(cached, meta)
+        return
+
+    if limiter:
+        limiter.wait()
+    with urllib.request.urlopen(_build_request(query, url), timeout=60) as response:
+        if not cache:
+            yield from iter_overpass_elements(response, meta)
+            return
+        writer = cache.writer(url, query)
+        try:
+            tee = _TeeReader(response, writer)
+            yield from iter_overpass_elements(tee, meta)
+            # 末尾の改行等も含めて保存する
+            while tee.read(64 * 1024):
+                pass
+        except BaseException:
+            # 途中で失敗・中断した場合はキャッシュに残さない
+            writer.discard()
+            raise
+        writer.commit()
+
+
+def fetch_overpass(
+    query: str,
+    url: str = OVERPASS_URL,
+    verbose: bool = True,
+    cache: Optional[OverpassCache] = None
+) -> Dict[str, Any]:
+    """Overpass API にクエリを送信して結果を取得（cache があればまずキャッシュを見る）"""
+    body = cache.get_bytes(url, query) if cache else None
+    if body is not None:
+        if verbose:
+            print(f"キャッシュから読み込み")
+    else:
+        if verbose:
+            print(f"Overpass API にリクエスト中...")
+        body = download_overpass(query, url)
+        if cache:
+            cache.put(url, query, body)
+    result = json.loads(body.decode("utf-8"))
+    if verbose:
+        print(f"取得完了: {len(result.get('elements', []))} 件")
     return result
 
 
-def parse_element(elem: Dict[str, Any]) -> Optional[Shop]:
-    """OSM要素をShopオブジェクトに変換"""
+class RateLimiter:
+    """
+    リクエスト開始の間隔を一定以上に保つ（スレッドセーフ）。
+    rate_per_sec <= 0 なら制限なし。
+    """
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        """次のリクエストを開始してよい時刻まで待つ"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_time)
+            self._next_time = start + self.interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _retry_after_s(error: urllib.error.HTTPError) -> Optional[float]:
+    """
+    レスポンスの Retry-After（秒数または HTTP の日時）を待ち時間（秒）にする。
+    ない・読めない場合は None。長すぎる値は MAX_RETRY_AFTER_S で打ち切る。
+    """
+    value = (error.headers.get("Retry-After") if error.headers else None) or ""
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        delay = float(value)
+    else:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        delay = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), MAX_RETRY_AFTER_S)
+
+
+def _call_with_retry(fn: Callable[[], T], retries: int, backoff_s: float) -> T:
+    """
+    混雑（429）やタイムアウト（504）等の一時的な失敗を指数バックオフで再試行する。
+    レスポンスに Retry-After があればその時間だけ待つ。
+    再試行しても失敗した場合は最後の例外を送出。
+    """
+    attempt = 0
+    while True:
+        delay = backoff_s * (2 ** attempt)
+        try:
+            return fn()
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUS_CODES or attempt >= retries:
+                raise
+            retry_after = _retry_after_s(e)
+            if retry_after is not None:
+                delay = retry_after
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if attempt >= retries:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+def fetch_overpass_with_retry(
+    query: str,
+    url: str = OVERPASS_URL,
+    limiter: Optional[RateLimiter] = None,
+    retries: int = DEFAULT_RETRIES,
+    backoff_s: float = DEFAULT_BACKOFF_S,
+    cache: Optional[OverpassCache] = None
+) -> Dict[str, Any]:
+    """
+    fetch_overpass を再試行付きで実行する。
+    キャッシュにヒットした場合はレート制限の待ちも発生しない。
+    """
+    body = cache.get_bytes(url, query) if cache else None
+    if body is not None:
+        return json.loads(body.decode("utf-8"))
+
+    def attempt() -> Dict[str, Any]:
+        if limiter:
+            limiter.wait()
+        body = download_overpass(query, url)
+        if cache:
+            cache.put(url, query, body)
+        return json.loads(body.decode("utf-8"))
+
+    return _call_with_retry(attempt, retries, backoff_s)
+
+
+def fetch_tile_shops(
+    query: str,
+    url: str = OVERPASS_URL,
+    limiter: Optional[RateLimiter] = None,
+    retries: int = DEFAULT_RETRIES,
+    backoff_s: float = DEFAULT_BACKOFF_S,
+    cache: Optional[OverpassCache] = None,
+    tag_allowlist: Optional[Sequence[str]] = None,
+    meta: Optional[Dict[str, Any]] = None
+) -> Tuple[int, List[Shop]]:
+    """
+    1タイル分のクエリを逐次パースで取得し、(要素数, Shopのリスト) を返す。
+    失敗時はタイル単位で最初からやり直す。meta にはレスポンスの elements 以外の値（osm3s 等）が入る。
+    """
+    def attempt() -> Tuple[int, List[Shop]]:
+        count = 0
+        shops = []
+        for elem in stream_overpass(query, url, cache, limiter, meta):
+            count += 1
+            shop = parse_element(elem, tag_allowlist)
+            if shop:
+                shops.append(shop)
+        return count, shops
+
+    return _call_with_retry(attempt, retries, backoff_s)
+
+
+def split_into_tiles(
+    center_lat: float,
+    center_lng: float,
+    radius_m: float,
+    tile_size_m: float = DEFAULT_TILE_SIZE_M
+) -> List[Tuple[float, float, float, float]]:
+    """
+    中心・半径の円を覆う正方形を、一辺 tile_size_m のグリッドに分割する。
+    返り値: (south, west, north, east) のリスト
+    """
+    meters_per_deg_lng = METERS_PER_DEG_LAT * math.cos(math.radians(center_lat))
+    n = max(1, math.ceil(2 * radius_m / tile_size_m))
+    step_lat = 2 * radius_m / n / METERS_PER_DEG_LAT
+    step_lng = 2 * radius_m / n / meters_per_deg_lng
+    south0 = center_lat - radius_m / METERS_PER_DEG_LAT
+    west0 = center_lng - radius_m / meters_per_deg_lng
+
+    tiles = []
+    for iy in range(n):
+        for ix in range(n):
+            south = south0 + iy * step_lat
+            west = west0 + ix * step_lng
+            tiles.append((
+                round(south, 7), round(west, 7),
+                round(south + step_lat, 7), round(west + step_lng, 7)
+            ))
+    return tiles
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """2点間の距離（メートル、正距円筒近似）"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6371000.0
+
+
+def parse_element(elem: Dict[str, Any], tag_allowlist: Optional[Sequence[str]] = None) -> Optional[Shop]:
+    """
+    OSM要素をShopオブジェクトに変換。
+    tag_allowlist を指定すると、そのキーのタグだけを残す。
+    タグのキーと値は intern するので、同じ文字列（"amenity" / "restaurant" 等）はお店の間で共有される。
+    """
     tags = elem.get("tags", {})
     name = tags.get("name")
 
@@ -122,63 +393,370 @@ def parse_element(elem: Dict[str, Any]) -> Optional[Shop]:
     # カテゴリ判定
     category = tags.get("amenity") or tags.get("shop") or "other"
 
-    # 座標取得（wayの場合はcenterを使用）
+    # 座標取得（wayの場合はcenterを使用、convert した派生要素は geometry の点）
+    geometry = elem.get("geometry")
     if elem["type"] == "node":
         lat = elem["lat"]
         lng = elem["lon"]
     elif "center" in elem:
         lat = elem["center"]["lat"]
         lng = elem["center"]["lon"]
+    elif isinstance(geometry, dict) and geometry.get("type") == "Point":
+        lng, lat = geometry["coordinates"][:2]
     else:
         return None
 
+    name_en = tags.get("name:en") or None
+    # convert の t["キー"] はタグがないと空文字になるので除く
+    tags = {key: value for key, value in tags.items() if value != ""}
+    if tag_allowlist is not None:
+        tags = {key: tags[key] for key in tag_allowlist if key in tags}
     return Shop(
         osm_id=elem["id"],
         name=name,
-        name_en=tags.get("name:en"),
-        category=category,
+        name_en=name_en,
+        category=sys.intern(category),
         lat=lat,
         lng=lng,
-        tags=tags
+        tags={sys.intern(key): sys.intern(value) for key, value in tags.items()}
     )
 
 
 def fetch_shops(
     center_lat: float = DEFAULT_CENTER_LAT,
     center_lng: float = DEFAULT_CENTER_LNG,
-    radius_m: int = DEFAULT_RADIUS_M
+    radius_m: int = DEFAULT_RADIUS_M,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    tag_allowlist: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST,
+    meta: Optional[Dict[str, Any]] = None
 ) -> List[Shop]:
-    """お店情報を取得"""
-    query = build_overpass_query(center_lat, center_lng, radius_m)
-    result = fetch_overpass(query)
+    """
+    お店情報を取得（tag_allowlist のタグだけをサーバー側で絞って取得する。None ならすべて）。
+    meta にはレスポンスの elements 以外の値（osm3s の timestamp_osm_base 等）が入る。
+    """
+    print(f"Overpass API にリクエスト中...")
+    shops = list(iter_shops(
+        center_lat, center_lng, radius_m, url=url, cache=cache, tag_allowlist=tag_allowlist, meta=meta
+    ))
+    print(f"取得完了: {len(shops)} 件")
 
-    shops = []
-    for elem in result.get("elements", []):
-        shop = parse_element(elem)
+    # 名前でソート
+    shops.sort(key=lambda s: s.name)
+    return shops
+
+
+def iter_shops(
+    center_lat: float = DEFAULT_CENTER_LAT,
+    center_lng: float = DEFAULT_CENTER_LNG,
+    radius_m: int = DEFAULT_RADIUS_M,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    tag_allowlist: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST,
+    meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Shop]:
+    """
+    お店情報を1件ずつ返す（fetch_shops のジェネレータ版）。
+    レスポンスを受信しながら Shop を作るので、メモリ使用量は範囲の広さに依存しない。
+    """
+    query = build_overpass_query(center_lat, center_lng, radius_m, tag_allowlist)
+    if meta is None:
+        meta = {}
+    for elem in stream_overpass(query, url, cache, meta=meta):
+        shop = parse_element(elem, tag_allowlist)
         if shop:
-            shops.append(shop)
+            yield shop
+    _warn_remark(meta)
 
-    # 名前でソート
+
+def iter_shops_from_file(path: str, tag_allowlist: Optional[Sequence[str]] = None) -> Iterator[Shop]:
+    """保存済みの Overpass レスポンス（JSONファイル）からお店情報を1件ずつ返す"""
+    meta: Dict[str, Any] = {}
+    for elem in iter_overpass_file(path, meta):
+        shop = parse_element(elem, tag_allowlist)
+        if shop:
+            yield shop
+    _warn_remark(meta)
+
+
+def snapshot_timestamp(meta: Dict[str, Any]) -> Optional[str]:
+    """レスポンスのデータの時点（osm3s.timestamp_osm_base、ISO 8601 の UTC 時刻）"""
+    return (meta.get("osm3s") or {}).get("timestamp_osm_base")
+
+
+def _warn_remark(meta: Dict[str, Any]):
+    """サーバー側のタイムアウト等はレスポンス末尾の remark に入るので表示する"""
+    remark = meta.get("remark")
+    if remark:
+        print(f"警告: Overpass API からの注意: {remark}")
+
+
+def fetch_shops_tiled(
+    center_lat: float = DEFAULT_CENTER_LAT,
+    center_lng: float = DEFAULT_CENTER_LNG,
+    radius_m: int = DEFAULT_RADIUS_M,
+    tile_size_m: float = DEFAULT_TILE_SIZE_M,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    rate_per_sec: float = DEFAULT_RATE_PER_SEC,
+    retries: int = DEFAULT_RETRIES,
+    backoff_s: float = DEFAULT_BACKOFF_S,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    tag_allowlist: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST,
+    meta: Optional[Dict[str, Any]] = None
+) -> List[Shop]:
+    """
+    範囲をタイルに分割し、矩形クエリを並列に投げてお店情報を取得する。
+    サーバー側のタイムアウトに掛からない大きさに分けることで広い半径を扱える。
+    結果は届いた順に osm_id で重複除去しながら統合し、最後に円の外を除く。
+    meta の osm3s にはタイルのうち最も古いデータの時刻（timestamp_osm_base）が入る。
+    """
+    tiles = split_into_tiles(center_lat, center_lng, radius_m, tile_size_m)
+    limiter = RateLimiter(rate_per_sec)
+    merged: Dict[int, Shop] = {}
+
+    print(f"タイル分割取得: {len(tiles)} タイル（同時 {max_in_flight} 件）")
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        tile_metas: List[Dict[str, Any]] = [{} for _ in tiles]
+        futures = {
+            executor.submit(
+                fetch_tile_shops,
+                build_overpass_bbox_query(tile, tag_allowlist), url, limiter, retries, backoff_s, cache,
+                tag_allowlist, tile_meta
+            ): tile
+            for tile, tile_meta in zip(tiles, tile_metas)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            count, tile_shops = future.result()
+            added = 0
+            for shop in tile_shops:
+                if shop.osm_id not in merged:
+                    merged[shop.osm_id] = shop
+                    added += 1
+            print(f"  [{done}/{len(tiles)}] {count} 件取得, 新規 {added} 件")
+
+    timestamps = [snapshot_timestamp(m) for m in tile_metas]
+    if meta is not None and all(timestamps):
+        # 差分更新はこの時刻以降の変更を取りに行くので、タイルの中で最も古い時刻にする
+        meta["osm3s"] = {"timestamp_osm_base": min(timestamps)}
+
+    # タイルは円を覆う正方形なので、半径の外側を除く
+    shops = [
+        shop for shop in merged.values()
+        if distance_m(center_lat, center_lng, shop.lat, shop.lng) <= radius_m
+    ]
     shops.sort(key=lambda s: s.name)
     return shops
 
 
-def save_shops_raw(shops: List[Shop], path: str):
-    """お店情報をJSONで保存（座標変換前）"""
-    data = {
+def save_shops_raw(
+    shops: List[Shop],
+    path: str,
+    center_lat: float = DEFAULT_CENTER_LAT,
+    center_lng: float = DEFAULT_CENTER_LNG,
+    radius_m: int = DEFAULT_RADIUS_M,
+    timestamp: Optional[str] = None,
+    source: str = "OpenStreetMap (Overpass API)"
+):
+    """
+    お店情報をJSONで保存（座標変換前）。
+    お店は列指向のテーブル（shop_table.ShopTable）に詰めてから1件ずつ書き出すので、全件の辞書のリストは作らない。
+    timestamp はデータの時点（Overpass の timestamp_osm_base）。refresh_shops.py の差分更新の起点になる。
+    """
+    # shop_table は fetch_shops を読み込むので、ここで読み込む
+    from shop_table import ShopTable, save_shop_table
+
+    header = {
         "version": "1.0",
-        "source": "OpenStreetMap (Overpass API)",
+        "source": source,
         "center": {
-            "lat": DEFAULT_CENTER_LAT,
-            "lng": DEFAULT_CENTER_LNG
+            "lat": center_lat,
+            "lng": center_lng
         },
-        "radius_m": DEFAULT_RADIUS_M,
+        "radius_m": radius_m,
         "count": len(shops),
-        "shops": [asdict(s) for s in shops]
     }
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"保存完了: {path} ({len(shops)} 件)")
+    if timestamp:
+        header["timestamp_osm_base"] = timestamp
+    save_shop_table(ShopTable.from_shops(shops), path, header)
+
+
+# ============================================================
+# クエリの絞り込みの効果（レスポンスの大きさの比較）
+# ============================================================
+
+def response_size(
+    query: str,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    retries: int = DEFAULT_RETRIES,
+    backoff_s: float = DEFAULT_BACKOFF_S
+) -> Dict[str, Any]:
+    """
+    クエリを実行し、レスポンス本体の実際の大きさを数える。キャッシュにあればキャッシュの本体を数え、
+    なければ取得してキャッシュにも保存する（2回目以降・--offline はネットワークにアクセスしない）。
+    返り値: {"bytes": 本体のバイト数, "elements": 要素数, "cached": キャッシュから読んだか, "remark": 実行時エラー}
+    """
+    body = cache.get_bytes(url, query) if cache else None
+    cached = body is not None
+    if body is None:
+        body = _call_with_retry(lambda: download_overpass(query, url), retries, backoff_s)
+        if cache:
+            cache.put(url, query, body)
+    result = json.loads(body.decode("utf-8"))
+    return {
+        "bytes": len(body),
+        "elements": len(result.get("elements", [])),
+        "cached": cached,
+        "remark": result.get("remark"),
+    }
+
+
+def compare_response_bytes(
+    center_lat: float,
+    center_lng: float,
+    radius_m: int,
+    tag_keys: Sequence[str] = DEFAULT_TAG_ALLOWLIST,
+    url: str = OVERPASS_URL,
+    cache: Optional[OverpassCache] = None,
+    retries: int = DEFAULT_RETRIES
+) -> Dict[str, Dict[str, Any]]:
+    """
+    すべてのタグを返すクエリ（out center tags）と、tag_keys だけを返すクエリ（convert）の両方を実行し、
+    レスポンスの実際の大きさを比べる。返り値: {"all_tags": response_size, "projected": response_size}
+    """
+    return {
+        "all_tags": response_size(build_overpass_query(center_lat, center_lng, radius_m, None), url, cache, retries),
+        "projected": response_size(build_overpass_query(center_lat, center_lng, radius_m, tag_keys), url, cache, retries),
+    }
+
+
+# ============================================================
+# 動作確認（タイル分割取得のスタブサーバー）
+# ============================================================
+
+# スタブサーバーが返すお店（中心からの北・東方向の距離 m, 名前）。名前が空の要素は parse_element で除かれる
+_FIXTURE_SHOPS = [
+    (0.0, 0.0, "中心の店"),       # タイルの境界上（複数のタイルに入る）
+    (200.0, 100.0, "北の店"),
+    (-300.0, -250.0, "南西の店"),
+    (480.0, 480.0, "隅の店"),     # タイルには入るが半径の外
+    (50.0, -50.0, ""),
+]
+# タイルの外側のこの距離（m）までの要素も返す（境界付近のウェイが両方のタイルに入るのと同じ）
+_FIXTURE_MARGIN_M = 20.0
+_FIXTURE_TIMESTAMP = "2026-01-01T00:00:00Z"
+
+
+def serve_tiles_fixture(center_lat: float, center_lng: float, port: int = 0):
+    """
+    タイル分割取得の動作確認用のスタブサーバー（スレッドで起動して HTTPServer を返す）。
+    クエリの矩形に入る _FIXTURE_SHOPS を convert の形で返す。最初のリクエストだけ 429（Retry-After: 0）を返す。
+    server.stats に {"requests": 件数, "throttled": 429 を返した件数} が入る。
+    """
+    import re
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    meters_per_deg_lng = METERS_PER_DEG_LAT * math.cos(math.radians(center_lat))
+    elements = [
+        {
+            "type": "shop",
+            "id": 9000 + i,
+            "geometry": {
+                "type": "Point",
+                "coordinates": [center_lng + east / meters_per_deg_lng, center_lat + north / METERS_PER_DEG_LAT],
+            },
+            "tags": {"name": name, "amenity": "restaurant"},
+        }
+        for i, (north, east, name) in enumerate(_FIXTURE_SHOPS)
+    ]
+    margin_lat = _FIXTURE_MARGIN_M / METERS_PER_DEG_LAT
+    margin_lng = _FIXTURE_MARGIN_M / meters_per_deg_lng
+    bbox_pattern = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+    stats = {"requests": 0, "throttled": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            query = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8")).get("data", [""])[0]
+            with lock:
+                stats["requests"] += 1
+                throttle = stats["throttled"] == 0
+                if throttle:
+                    stats["throttled"] += 1
+            if throttle:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            match = bbox_pattern.search(query)
+            if not match:
+                self.send_error(400)
+                return
+            south, west, north, east = map(float, match.groups())
+            found = [
+                elem for elem in elements
+                if south - margin_lat <= elem["geometry"]["coordinates"][1] <= north + margin_lat
+                and west - margin_lng <= elem["geometry"]["coordinates"][0] <= east + margin_lng
+            ]
+            body = json.dumps({
+                "version": 0.6,
+                "osm3s": {"timestamp_osm_base": _FIXTURE_TIMESTAMP},
+                "elements": found,
+            }, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", port), Handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def self_check() -> bool:
+    """
+    スタブサーバーに対してタイル分割取得を実行し、タイル分割・重複除去・半径の外の除外・
+    429 の再試行（Retry-After に従うこと）を確かめる。
+    """
+    center_lat, center_lng, radius_m, tile_size_m = DEFAULT_CENTER_LAT, DEFAULT_CENTER_LNG, 500, 250.0
+    # Retry-After（0秒）に従わず指数バックオフで待つと、この時間だけ掛かる
+    backoff_s = 30.0
+    tiles = split_into_tiles(center_lat, center_lng, radius_m, tile_size_m)
+    server = serve_tiles_fixture(center_lat, center_lng)
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/interpreter"
+    meta: Dict[str, Any] = {}
+    start = time.perf_counter()
+    try:
+        shops = fetch_shops_tiled(
+            center_lat, center_lng, radius_m, tile_size_m=tile_size_m, max_in_flight=2, rate_per_sec=0,
+            retries=1, backoff_s=backoff_s, url=url, meta=meta,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+    elapsed = time.perf_counter() - start
+
+    names = sorted(shop.name for shop in shops)
+    checks = [
+        ("タイルごとに1回 + 429 の再試行1回", server.stats["requests"] == len(tiles) + 1 and server.stats["throttled"] == 1),
+        ("Retry-After に従って待つ", elapsed < backoff_s),
+        ("重複除去・半径の外と名前のない要素の除外", names == sorted(["中心の店", "北の店", "南西の店"])),
+        ("データの時点", snapshot_timestamp(meta) == _FIXTURE_TIMESTAMP),
+    ]
+    print()
+    for label, passed in checks:
+        print(f"  {label}: {'OK' if passed else 'NG'}")
+    print(f"  リクエスト: {server.stats['requests']} 件（{len(tiles)} タイル） / {elapsed:.2f} 秒")
+    return all(passed for _, passed in checks)
 
 
 def print_summary(shops: List[Shop]):
@@ -203,27 +781,124 @@ def print_summary(shops: List[Shop]):
 
 
 if __name__ == "__main__":
+    import argparse
     import os
 
+    parser = argparse.ArgumentParser(description="浅草橋駅周辺のお店情報を取得")
+    parser.add_argument("--lat", type=float, default=DEFAULT_CENTER_LAT, help="中心の緯度")
+    parser.add_argument("--lng", type=float, default=DEFAULT_CENTER_LNG, help="中心の経度")
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS_M, help="検索半径（メートル）")
+    parser.add_argument("--tiled", action="store_true", help="範囲をタイルに分割して並列取得する")
+    parser.add_argument("--tile-size", type=float, default=DEFAULT_TILE_SIZE_M, help="タイルの一辺（メートル）")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="同時リクエスト数")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_SEC, help="1秒あたりのリクエスト数上限")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="失敗時の再試行回数")
+    parser.add_argument("--url", default=OVERPASS_URL, help="Overpass API エンドポイント")
+    parser.add_argument("--cache-dir", default=None, help="レスポンスキャッシュの保存先（既定: リポジトリ直下の .cache/overpass）")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わない")
+    parser.add_argument("--offline", action="store_true", help="キャッシュのみ使用し、ネットワークにアクセスしない")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_S / 3600, help="キャッシュの有効期限（時間）")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024), help="キャッシュの最大容量（MB）")
+    parser.add_argument(
+        "--tags", default="default",
+        help="取得するタグのキー（カンマ区切り。default で変換に使うキーだけ、all ですべて）",
+    )
+    parser.add_argument(
+        "--compare-bytes", action="store_true",
+        help="すべてのタグを返すクエリ（out center tags）と絞り込んだクエリ（convert）を両方実行し、"
+             "レスポンスの実際の大きさを比べて終了する（キャッシュがあればキャッシュを数える）",
+    )
+    parser.add_argument(
+        "--self-check", action="store_true",
+        help="スタブサーバーに対してタイル分割取得（重複除去・429 の再試行）を確かめて終了する",
+    )
+    args = parser.parse_args()
+
+    if args.self_check:
+        print("=" * 50)
+        print("タイル分割取得の動作確認（スタブサーバー）")
+        print("=" * 50)
+        raise SystemExit(0 if self_check() else 1)
+
+    tag_allowlist: Optional[Tuple[str, ...]] = DEFAULT_TAG_ALLOWLIST
+    if args.tags == "all":
+        tag_allowlist = None
+    elif args.tags != "default":
+        tag_allowlist = tuple(key.strip() for key in args.tags.split(",") if key.strip())
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    cache = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or os.path.join(os.path.dirname(script_dir), ".cache", "overpass")
+        cache = OverpassCache(
+            cache_dir,
+            ttl_s=args.cache_ttl * 3600,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            offline=args.offline
+        )
+    elif args.offline:
+        parser.error("--offline は --no-cache と同時に指定できません")
+
+    if args.compare_bytes:
+        keys = tag_allowlist or DEFAULT_TAG_ALLOWLIST
+        print("=" * 50)
+        print("クエリの絞り込みの効果")
+        print("=" * 50)
+        print(f"中心: {args.lat}, {args.lng} / 半径: {args.radius}m")
+        sizes = compare_response_bytes(args.lat, args.lng, args.radius, keys, args.url, cache, args.retries)
+        if cache:
+            cache.close()
+        labels = {"all_tags": "すべてのタグ（out center tags）", "projected": f"絞り込み（convert: {', '.join(keys)}）"}
+        for name, label in labels.items():
+            size = sizes[name]
+            source = "キャッシュ" if size["cached"] else "取得"
+            print(f"\n{label}")
+            print(f"  レスポンス: {size['bytes']:,} bytes / 要素: {size['elements']:,} 件（{source}）")
+            if size["remark"]:
+                print(f"  警告: Overpass API からの注意: {size['remark']}")
+        all_bytes, projected_bytes = sizes["all_tags"]["bytes"], sizes["projected"]["bytes"]
+        ratio = projected_bytes / all_bytes if all_bytes else 0.0
+        print(f"\nレスポンス: {all_bytes:,} bytes → {projected_bytes:,} bytes（{ratio:.0%}）")
+        raise SystemExit(1 if any(size["remark"] for size in sizes.values()) else 0)
+
     print("=" * 50)
     print("浅草橋駅周辺のお店情報を取得")
     print("=" * 50)
-    print(f"中心: {DEFAULT_CENTER_LAT}, {DEFAULT_CENTER_LNG}")
-    print(f"半径: {DEFAULT_RADIUS_M}m")
+    print(f"中心: {args.lat}, {args.lng}")
+    print(f"半径: {args.radius}m")
     print()
 
+    meta: Dict[str, Any] = {}
     try:
-        shops = fetch_shops()
+        if args.tiled:
+            shops = fetch_shops_tiled(
+                args.lat, args.lng, args.radius,
+                tile_size_m=args.tile_size,
+                max_in_flight=args.max_in_flight,
+                rate_per_sec=args.rate,
+                retries=args.retries,
+                url=args.url,
+                cache=cache,
+                tag_allowlist=tag_allowlist,
+                meta=meta
+            )
+        else:
+            shops = fetch_shops(
+                args.lat, args.lng, args.radius, url=args.url, cache=cache, tag_allowlist=tag_allowlist, meta=meta
+            )
         print_summary(shops)
+        if cache:
+            cache.print_stats()
+            cache.close()
 
         # 保存先
-        script_dir = os.path.dirname(os.path.abspath(__file__))
         output_dir = os.path.join(os.path.dirname(script_dir), "data")
         os.makedirs(output_dir, exist_ok=True)
         output_path = os.path.join(output_dir, "shops_raw.json")
         
         # 保存
-        save_shops_raw(shops, output_path)
+        save_shops_raw(shops, output_path, args.lat, args.lng, args.radius, snapshot_timestamp(meta))
 
     except Exception as e:
         print(f"エラー: {e}")
@@ -0,0 +1,263 @@
+"""
+GLB（バイナリ glTF 2.0）の読み書き
+
+Blender 等を使わずに gltf/city.glb を直接読み、三角形をワールド座標で取り出す。
+頂点・インデックスはバイナリチャンクへの memoryview から NumPy の配列ビューとして読む（コピーしない）。
+座標はそのまま three.js のワールド座標（Y-up、city.js ではモデルを原点・等倍で配置している）。
+
+対応していないもの: Draco / meshopt 圧縮、sparse アクセサ、外部バッファ（.bin ファイル）
+"""
+
+import json
+import math
+import os
+import struct
+from dataclasses import dataclass
+from typing import Dict, Any, List, Iterator, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # GLB の読み込みには NumPy が必要（読み込み時にエラーにする）
+    np = None
+
+GLB_MAGIC = b"glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+MODE_TRIANGLES = 4
+MODE_TRIANGLE_STRIP = 5
+MODE_TRIANGLE_FAN = 6
+
+_COMPONENT_DTYPES = {
+    5120: "i1",
+    5121: "u1",
+    5122: "<i2",
+    5123: "<u2",
+    5125: "<u4",
+    5126: "<f4",
+}
+
+# normalized な整数を -1〜1 / 0〜1 に戻すときの除数（KHR_mesh_quantization）
+_NORMALIZE_DIVISORS = {5120: 127.0, 5121: 255.0, 5122: 32767.0, 5123: 65535.0}
+
+_TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+_UNSUPPORTED_EXTENSIONS = ("KHR_draco_mesh_compression", "EXT_meshopt_compression")
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("GLB の読み込みには NumPy が必要です（pip install numpy）")
+
+
+@dataclass
+class GlbFile:
+    """GLB の JSON 部分と、バイナリチャンクへの memoryview"""
+    gltf: Dict[str, Any]
+    bin: memoryview
+
+    def accessor(self, index: int) -> "np.ndarray":
+        """
+        アクセサの中身を (件数, 要素数) の配列で返す。
+        byteStride 付きのインターリーブ配置でも strides を指定したビューで返すのでコピーしない。
+        """
+        acc = self.gltf["accessors"][index]
+        if "sparse" in acc:
+            raise ValueError(f"sparse アクセサには対応していません（accessor {index}）")
+        if "bufferView" not in acc:
+            raise ValueError(f"bufferView のないアクセサには対応していません（accessor {index}）")
+        view = self.gltf["bufferViews"][acc["bufferView"]]
+        if view.get("buffer", 0) != 0:
+            raise ValueError("外部バッファには対応していません（GLB のバイナリチャンクのみ）")
+
+        dtype = np.dtype(_COMPONENT_DTYPES[acc["componentType"]])
+        width = _TYPE_SIZES[acc["type"]]
+        count = acc["count"]
+        offset = view.get("byteOffset", 0) + acc.get("byteOffset", 0)
+        stride = view.get("byteStride") or dtype.itemsize * width
+        return np.ndarray(
+            shape=(count, width),
+            dtype=dtype,
+            buffer=self.bin,
+            offset=offset,
+            strides=(stride, dtype.itemsize),
+        )
+
+    def accessor_float(self, index: int) -> "np.ndarray":
+        """アクセサを float64 で返す（normalized な整数は -1〜1 / 0〜1 に戻す）"""
+        acc = self.gltf["accessors"][index]
+        values = self.accessor(index).astype(np.float64)
+        if acc.get("normalized"):
+            divisor = _NORMALIZE_DIVISORS[acc["componentType"]]
+            values = np.maximum(values / divisor, -1.0)
+        return values
+
+
+def read_glb(data: bytes) -> GlbFile:
+    """GLB のバイト列を JSON チャンクとバイナリチャンクに分ける"""
+    _require_numpy()
+    view = memoryview(data)
+    magic, version, length = struct.unpack_from("<4sII", view, 0)
+    if magic != GLB_MAGIC:
+        raise ValueError("GLB ファイルではありません")
+    if version != 2:
+        raise ValueError(f"未対応の glTF バージョンです: {version}")
+
+    gltf = None
+    bin_chunk = memoryview(b"")
+    pos = 12
+    while pos + 8 <= min(length, len(view)):
+        chunk_length, chunk_type = struct.unpack_from("<II", view, pos)
+        body = view[pos + 8:pos + 8 + chunk_length]
+        if chunk_type == CHUNK_JSON:
+            gltf = json.loads(bytes(body).decode("utf-8"))
+        elif chunk_type == CHUNK_BIN and not len(bin_chunk):
+            bin_chunk = body
+        pos += 8 + chunk_length
+    if gltf is None:
+        raise ValueError("GLB に JSON チャンクがありません")
+
+    for ext in gltf.get("extensionsRequired", []):
+        if ext in _UNSUPPORTED_EXTENSIONS:
+            raise ValueError(f"{ext} で圧縮された GLB には対応していません（圧縮なしで書き出してください）")
+    return GlbFile(gltf, bin_chunk)
+
+
+def load_glb(path: str) -> GlbFile:
+    """GLB ファイルを読み込む"""
+    with open(path, 'rb') as f:
+        return read_glb(f.read())
+
+
+def pack_glb(gltf: Dict[str, Any], bin_data: bytes) -> bytes:
+    """JSON とバイナリチャンクから GLB のバイト列を作る（チャンクは4バイト境界に揃える）"""
+    gltf = dict(gltf)
+    if bin_data:
+        gltf["buffers"] = [{"byteLength": len(bin_data)}]
+    else:
+        gltf.pop("buffers", None)
+    json_chunk = json.dumps(gltf, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    bin_chunk = bytes(bin_data) + b"\0" * (-len(bin_data) % 4)
+
+    length = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if bin_chunk else 0)
+    parts = [
+        struct.pack("<4sII", GLB_MAGIC, 2, length),
+        struct.pack("<II", len(json_chunk), CHUNK_JSON),
+        json_chunk,
+    ]
+    if bin_chunk:
+        parts += [struct.pack("<II", len(bin_chunk), CHUNK_BIN), bin_chunk]
+    return b"".join(parts)
+
+
+def write_glb(path: str, gltf: Dict[str, Any], bin_data: bytes) -> int:
+    """GLB を書き出す（一時ファイルに書いてから置き換える）。返り値: ファイルサイズ"""
+    data = pack_glb(gltf, bin_data)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def _node_matrix(node: Dict[str, Any]) -> "np.ndarray":
+    """ノードのローカル変換行列（4x4、列ベクトル用）"""
+    if "matrix" in node:
+        # glTF の matrix は列優先
+        return np.array(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    tx, ty, tz = node.get("translation", (0.0, 0.0, 0.0))
+    qx, qy, qz, qw = node.get("rotation", (0.0, 0.0, 0.0, 1.0))
+    sx, sy, sz = node.get("scale", (1.0, 1.0, 1.0))
+    rotation = np.array([
+        [1 - 2 * (qy * qy + qz * qz), 2 * (qx * qy - qz * qw), 2 * (qx * qz + qy * qw)],
+        [2 * (qx * qy + qz * qw), 1 - 2 * (qx * qx + qz * qz), 2 * (qy * qz - qx * qw)],
+        [2 * (qx * qz - qy * qw), 2 * (qy * qz + qx * qw), 1 - 2 * (qx * qx + qy * qy)],
+    ])
+    m = np.eye(4)
+    m[:3, :3] = rotation * np.array([sx, sy, sz])
+    m[:3, 3] = (tx, ty, tz)
+    return m
+
+
+def iter_mesh_nodes(glb: GlbFile) -> Iterator[Tuple[str, int, "np.ndarray"]]:
+    """シーン内のメッシュを持つノードを (ノード名, メッシュ番号, ワールド変換行列) で返す"""
+    gltf = glb.gltf
+    nodes = gltf.get("nodes", [])
+    scenes = gltf.get("scenes")
+    if scenes:
+        roots = scenes[gltf.get("scene", 0)].get("nodes", [])
+    else:
+        roots = range(len(nodes))
+
+    stack = [(index, np.eye(4)) for index in reversed(list(roots))]
+    while stack:
+        index, parent = stack.pop()
+        node = nodes[index]
+        world = parent @ _node_matrix(node)
+        if "mesh" in node:
+            yield node.get("name", f"node_{index}"), node["mesh"], world
+        for child in reversed(node.get("children", [])):
+            stack.append((child, world))
+
+
+def primitive_triangles(glb: GlbFile, primitive: Dict[str, Any]) -> "np.ndarray":
+    """プリミティブの三角形を頂点インデックスの (三角形数, 3) 配列で返す（点・線は空）"""
+    mode = primitive.get("mode", MODE_TRIANGLES)
+    if "indices" in primitive:
+        indices = glb.accessor(primitive["indices"])[:, 0].astype(np.int64)
+    else:
+        count = glb.gltf["accessors"][primitive["attributes"]["POSITION"]]["count"]
+        indices = np.arange(count, dtype=np.int64)
+
+    if mode == MODE_TRIANGLES:
+        return indices[:len(indices) // 3 * 3].reshape(-1, 3)
+    if mode == MODE_TRIANGLE_STRIP and len(indices) >= 3:
+        tris = np.stack([indices[:-2], indices[1:-1], indices[2:]], axis=1)
+        # 奇数番目は向きを揃えるため入れ替える
+        tris[1::2, [0, 1]] = tris[1::2, [1, 0]]
+        return tris
+    if mode == MODE_TRIANGLE_FAN and len(indices) >= 3:
+        return np.stack([np.full(len(indices) - 2, indices[0]), indices[1:-1], indices[2:]], axis=1)
+    return np.empty((0, 3), dtype=np.int64)
+
+
+def iter_world_triangles(glb: GlbFile) -> Iterator[Tuple[str, "np.ndarray", "np.ndarray"]]:
+    """
+    シーン内のすべての三角形をワールド座標で返す。
+    プリミティブごとに (ノード名, 頂点のワールド座標 (頂点数, 3), 三角形 (三角形数, 3)) を返す。
+    """
+    meshes = glb.gltf.get("meshes", [])
+    for name, mesh_index, world in iter_mesh_nodes(glb):
+        for primitive in meshes[mesh_index].get("primitives", []):
+            if "POSITION" not in primitive.get("attributes", {}):
+                continue
+            tris = primitive_triangles(glb, primitive)
+            if not len(tris):
+                continue
+            local = glb.accessor_float(primitive["attributes"]["POSITION"])
+            positions = local @ world[:3, :3].T + world[:3, 3]
+            yield name, positions, tris
+
+
+def load_world_triangles(glb: GlbFile) -> Tuple["np.ndarray", "np.ndarray"]:
+    """全プリミティブを1つにまとめ、(頂点のワールド座標, 三角形) を返す"""
+    positions: List["np.ndarray"] = []
+    triangles: List["np.ndarray"] = []
+    base = 0
+    for _, pos, tris in iter_world_triangles(glb):
+        positions.append(pos)
+        triangles.append(tris + base)
+        base += len(pos)
+    if not positions:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(positions), np.concatenate(triangles)
+
+
+def bounds_of(positions: "np.ndarray") -> Tuple[float, ...]:
+    """頂点の AABB を (min_x, min_y, min_z, max_x, max_y, max_z) で返す"""
+    if not len(positions):
+        return (math.nan,) * 6
+    lo = positions.min(axis=0)
+    hi = positions.max(axis=0)
+    return (float(lo[0]), float(lo[1]), float(lo[2]), float(hi[0]), float(hi[1]), float(hi[2]))
@@ -0,0 +1,435 @@
+"""
+OSM の抽出ファイル（.osm / .osm.pbf）からお店情報を取り込む（Overpass API を使わない）
+
+Geofabrik 等で配布されている地域の抽出ファイルを1回だけ先頭から読み、fetch_shops.py と同じ shops_raw.json を作る。
+ネットワークにつながらない環境や、Overpass API のタイムアウト・回数制限に掛かる広い範囲に使う。
+
+  - 条件は build_overpass_query と同じ（name があり、amenity または shop が対象カテゴリ）
+  - ウェイ・リレーションの座標は out center と同じく、ノードの範囲（外接矩形）の中心
+  - 出力は fetch_shops.py と同じ Shop（parse_element で作る）
+  - .osm（XML。.gz / .bz2 も可）は iterparse で読み、読み終えた要素は捨てる
+  - .osm.pbf は osm_pbf.py でブロックごとにデコードする。--workers でブロックを並列にデコードできる
+
+ウェイの中心を求めるため、ノードの位置を osm_id の昇順の型付き配列（1件 16 バイト）に持つ。
+半径を指定した場合は、範囲に余白（NODE_MARGIN_M）を足した中のノードだけを持つ。
+リレーションの中心は、メンバーのノードと、タグのないウェイ（マルチポリゴンの外周など）・対象のウェイの範囲から求める。
+"""
+
+import bz2
+import gzip
+import math
+import os
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple, Iterator, Sequence, Deque
+
+from fetch_shops import (
+    DEFAULT_CENTER_LAT, DEFAULT_CENTER_LNG, DEFAULT_RADIUS_M, DEFAULT_TAG_ALLOWLIST, METERS_PER_DEG_LAT,
+    Shop, query_categories, parse_element, distance_m, save_shops_raw, print_summary,
+)
+from osm_pbf import Block, Box, iter_blobs, blob_data, read_header_block, decode_block
+
+# 座標の単位（1e-7 度）
+E7 = 10_000_000
+
+# 半径を指定したとき、ノードの位置を持つ範囲の余白（範囲の端にかかる建物のウェイの中心を求めるため）
+NODE_MARGIN_M = 1000.0
+
+# お店の条件に使うタグのキー
+FILTER_KEYS = ("amenity", "shop")
+
+
+class IdTable:
+    """
+    osm_id → 整数の組 の表（osm_id の昇順の型付き配列と二分探索）。
+    OSM の抽出ファイルは種類ごとに osm_id の昇順なので、追加するだけで並ぶ。順が崩れた場合は最初の検索の前に並べ直す。
+    """
+
+    def __init__(self, columns: int):
+        self.ids = array("q")
+        self.columns = [array("i") for _ in range(columns)]
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in [self.ids, *self.columns])
+
+    def append(self, osm_id: int, *values: int):
+        if self.ids and osm_id <= self.ids[-1]:
+            self._sorted = False
+        self.ids.append(osm_id)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def extend(self, ids: Sequence[int], *columns: Sequence[int], ids_sorted: bool = True):
+        if not ids_sorted or (self.ids and len(ids) and ids[0] <= self.ids[-1]):
+            self._sorted = False
+        self.ids.extend(ids)
+        for column, values in zip(self.columns, columns):
+            column.extend(values)
+
+    def _sort(self):
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.ids = array("q", (self.ids[i] for i in order))
+        self.columns = [array(c.typecode, (c[i] for i in order)) for c in self.columns]
+        self._sorted = True
+
+    def get(self, osm_id: int) -> Optional[Tuple[int, ...]]:
+        if not self._sorted:
+            self._sort()
+        i = bisect_left(self.ids, osm_id)
+        if i < len(self.ids) and self.ids[i] == osm_id:
+            return tuple(column[i] for column in self.columns)
+        return None
+
+
+def matches_shop_query(tags: Dict[str, str], categories: frozenset) -> bool:
+    """build_overpass_query と同じ条件（name があり、amenity または shop が対象カテゴリ）"""
+    if not tags.get("name"):
+        return False
+    return tags.get("amenity") in categories or tags.get("shop") in categories
+
+
+class ShopExtractor:
+    """
+    抽出ファイルの要素を先頭から順に受け取り、条件に合うお店を Shop にする。
+    ノード → ウェイ → リレーションの順（OSM の抽出ファイルの順）に渡すこと。
+    center_lat / center_lng / radius_m を指定すると、中心がその円の中にあるお店だけを返す（radius_m=0 なら全域）。
+    """
+
+    def __init__(
+        self,
+        center_lat: float = DEFAULT_CENTER_LAT,
+        center_lng: float = DEFAULT_CENTER_LNG,
+        radius_m: float = 0,
+        tag_allowlist: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST
+    ):
+        self.center_lat = center_lat
+        self.center_lng = center_lng
+        self.radius_m = radius_m
+        self.tag_allowlist = tag_allowlist
+        self.categories = frozenset(query_categories())
+        self.nodes = IdTable(2)        # 緯度, 経度（E7）
+        self.way_boxes = IdTable(4)    # 最小緯度, 最小経度, 最大緯度, 最大経度（E7）
+        self.box: Optional[Box] = None
+        if radius_m > 0:
+            margin = radius_m + NODE_MARGIN_M
+            dlat = margin / METERS_PER_DEG_LAT
+            dlng = margin / (METERS_PER_DEG_LAT * math.cos(math.radians(center_lat)))
+            self.box = (
+                int((center_lat - dlat) * E7), int((center_lng - dlng) * E7),
+                int(math.ceil((center_lat + dlat) * E7)), int(math.ceil((center_lng + dlng) * E7)),
+            )
+        self.stats = {"nodes": 0, "ways": 0, "relations": 0, "matched": 0, "missing": 0}
+
+    # ------------------------------------------------------------
+    # 要素
+    # ------------------------------------------------------------
+
+    def add_node_location(self, osm_id: int, lat: int, lon: int):
+        box = self.box
+        if box is None or (box[0] <= lat <= box[2] and box[1] <= lon <= box[3]):
+            self.nodes.append(osm_id, lat, lon)
+
+    def node(self, osm_id: int, lat: int, lon: int, tags: Dict[str, str]) -> Optional[Shop]:
+        if not matches_shop_query(tags, self.categories):
+            return None
+        return self._emit({"type": "node", "id": osm_id, "lat": lat / E7, "lon": lon / E7, "tags": tags})
+
+    def way(self, osm_id: int, refs: Sequence[int], tags: Dict[str, str]) -> Optional[Shop]:
+        matched = matches_shop_query(tags, self.categories)
+        if tags and not matched:
+            return None
+        locations = [location for location in map(self.nodes.get, refs) if location is not None]
+        if not locations:
+            if matched:
+                self.stats["missing"] += 1
+            return None
+        lats = [location[0] for location in locations]
+        lons = [location[1] for location in locations]
+        bounds = (min(lats), min(lons), max(lats), max(lons))
+        # リレーションのメンバーとして使うかもしれないので範囲を持っておく
+        self.way_boxes.append(osm_id, *bounds)
+        if not matched:
+            return None
+        return self._emit({"type": "way", "id": osm_id, "center": _center(bounds), "tags": tags})
+
+    def relation(self, osm_id: int, members: Sequence[Tuple[str, int]], tags: Dict[str, str]) -> Optional[Shop]:
+        if not matches_shop_query(tags, self.categories):
+            return None
+        bounds = None
+        for member_type, ref in members:
+            if member_type == "node":
+                location = self.nodes.get(ref)
+                if location is not None:
+                    bounds = _extend_bounds(bounds, location[0], location[1], location[0], location[1])
+            elif member_type == "way":
+                box = self.way_boxes.get(ref)
+                if box is not None:
+                    bounds = _extend_bounds(bounds, *box)
+        if bounds is None:
+            self.stats["missing"] += 1
+            return None
+        return self._emit({"type": "relation", "id": osm_id, "center": _center(bounds), "tags": tags})
+
+    def _emit(self, elem: Dict[str, Any]) -> Optional[Shop]:
+        shop = parse_element(elem, self.tag_allowlist)
+        if shop is None:
+            return None
+        if self.radius_m > 0 and distance_m(self.center_lat, self.center_lng, shop.lat, shop.lng) > self.radius_m:
+            return None
+        self.stats["matched"] += 1
+        return shop
+
+    # ------------------------------------------------------------
+    # PBF のブロック
+    # ------------------------------------------------------------
+
+    def add_block(self, block: Block) -> Iterator[Shop]:
+        """osm_pbf.decode_block の結果を取り込む"""
+        self.stats["nodes"] += block.node_count
+        self.stats["ways"] += block.way_count
+        self.stats["relations"] += block.relation_count
+        self.nodes.extend(block.node_ids, block.node_lats, block.node_lons, ids_sorted=block.nodes_sorted)
+        for osm_id, lat, lon, tags in block.nodes:
+            shop = self.node(osm_id, lat, lon, tags)
+            if shop:
+                yield shop
+        for osm_id, refs, tags in block.ways:
+            shop = self.way(osm_id, refs, tags)
+            if shop:
+                yield shop
+        for osm_id, members, tags in block.relations:
+            shop = self.relation(osm_id, members, tags)
+            if shop:
+                yield shop
+
+
+def _extend_bounds(
+    bounds: Optional[Tuple[int, int, int, int]],
+    min_lat: int, min_lon: int, max_lat: int, max_lon: int
+) -> Tuple[int, int, int, int]:
+    if bounds is None:
+        return min_lat, min_lon, max_lat, max_lon
+    return min(bounds[0], min_lat), min(bounds[1], min_lon), max(bounds[2], max_lat), max(bounds[3], max_lon)
+
+
+def _center(bounds: Tuple[int, int, int, int]) -> Dict[str, float]:
+    """外接矩形の中心（Overpass の out center と同じく小数点以下 7 桁）"""
+    return {
+        "lat": round((bounds[0] + bounds[2]) / 2 / E7, 7),
+        "lon": round((bounds[1] + bounds[3]) / 2 / E7, 7),
+    }
+
+
+# ============================================================
+# .osm（XML）
+# ============================================================
+
+def _open_extract(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _e7(text: str) -> int:
+    return int(round(float(text) * E7))
+
+
+def iter_osm_xml_shops(path: str, extractor: ShopExtractor, meta: Optional[Dict[str, Any]] = None) -> Iterator[Shop]:
+    """
+    .osm（XML）を1回だけ読んでお店を返す。要素は読み終えたら捨てるので、メモリはノードの位置の表の分だけ。
+    meta にはファイルの時点（timestamp / osm_base）があれば入る。
+    """
+    if meta is None:
+        meta = {}
+    with _open_extract(path) as fp:
+        root = None
+        for event, elem in ET.iterparse(fp, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                    if elem.get("timestamp"):
+                        meta["timestamp"] = elem.get("timestamp")
+                continue
+            tag = elem.tag
+            if tag in ("node", "way", "relation"):
+                extractor.stats[tag + "s"] += 1
+            if tag == "node":
+                osm_id = int(elem.get("id"))
+                lat = _e7(elem.get("lat"))
+                lon = _e7(elem.get("lon"))
+                extractor.add_node_location(osm_id, lat, lon)
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                shop = extractor.node(osm_id, lat, lon, tags) if tags else None
+            elif tag == "way":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                shop = extractor.way(int(elem.get("id")), refs, tags)
+            elif tag == "relation":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                members = [(m.get("type"), int(m.get("ref"))) for m in elem.iter("member")]
+                shop = extractor.relation(int(elem.get("id")), members, tags)
+            else:
+                if tag == "meta" and elem.get("osm_base"):
+                    meta["timestamp"] = elem.get("osm_base")
+                continue
+            # 読み終えた要素は捨てる
+            root.clear()
+            if shop:
+                yield shop
+
+
+# ============================================================
+# .osm.pbf
+# ============================================================
+
+def _decode_blob(blob: bytes, keys: Tuple[str, ...], box: Optional[Box]) -> Block:
+    """ワーカーで1ブロックを展開・デコードする"""
+    return decode_block(blob_data(blob), keys, untagged_ways=True, box=box)
+
+
+def iter_pbf_shops(
+    path: str,
+    extractor: ShopExtractor,
+    workers: int = 0,
+    meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Shop]:
+    """
+    .osm.pbf を1回だけ読んでお店を返す。
+    workers > 0 ならプロセスプールでブロックを並列にデコードする（取り込みはファイルの順のまま）。
+    meta にはファイルの時点（レプリケーションの時刻）があれば入る。
+    """
+    if meta is None:
+        meta = {}
+
+    def handle_header(blob: bytes):
+        header = read_header_block(blob_data(blob))
+        if header["replication_timestamp"]:
+            stamp = datetime.fromtimestamp(header["replication_timestamp"], tz=timezone.utc)
+            meta["timestamp"] = stamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+        meta["writingprogram"] = header["writingprogram"]
+
+    with open(path, "rb") as fp:
+        blobs = iter_blobs(fp)
+        if workers <= 0:
+            for blob_type, blob in blobs:
+                if blob_type == "OSMHeader":
+                    handle_header(blob)
+                elif blob_type == "OSMData":
+                    yield from extractor.add_block(_decode_blob(blob, FILTER_KEYS, extractor.box))
+            return
+
+        # 先読みするブロック数を制限して、メモリ使用量を一定に保つ
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: Deque[Future] = deque()
+            for blob_type, blob in blobs:
+                if blob_type == "OSMHeader":
+                    handle_header(blob)
+                    continue
+                if blob_type != "OSMData":
+                    continue
+                pending.append(executor.submit(_decode_blob, blob, FILTER_KEYS, extractor.box))
+                if len(pending) >= workers * 2:
+                    yield from extractor.add_block(pending.popleft().result())
+            while pending:
+                yield from extractor.add_block(pending.popleft().result())
+
+
+def import_shops(
+    path: str,
+    center_lat: float = DEFAULT_CENTER_LAT,
+    center_lng: float = DEFAULT_CENTER_LNG,
+    radius_m: float = DEFAULT_RADIUS_M,
+    tag_allowlist: Optional[Sequence[str]] = DEFAULT_TAG_ALLOWLIST,
+    workers: int = 0,
+    meta: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Shop], ShopExtractor]:
+    """抽出ファイルからお店を取り込む（名前順）。返り値: (お店, 集計を持つ ShopExtractor)"""
+    extractor = ShopExtractor(center_lat, center_lng, radius_m, tag_allowlist)
+    if path.endswith(".pbf"):
+        shops = list(iter_pbf_shops(path, extractor, workers, meta))
+    else:
+        shops = list(iter_osm_xml_shops(path, extractor, meta))
+    shops.sort(key=lambda s: s.name)
+    return shops, extractor
+
+
+def covering_circle(shops: List[Shop]) -> Tuple[float, float, int]:
+    """お店全体を囲む円（外接矩形の中心と、そこから最も遠いお店までの距離）"""
+    if not shops:
+        return DEFAULT_CENTER_LAT, DEFAULT_CENTER_LNG, 0
+    lat = (min(s.lat for s in shops) + max(s.lat for s in shops)) / 2
+    lng = (min(s.lng for s in shops) + max(s.lng for s in shops)) / 2
+    radius = max(distance_m(lat, lng, s.lat, s.lng) for s in shops)
+    return round(lat, 7), round(lng, 7), int(math.ceil(radius))
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    default_out = os.path.join(os.path.dirname(script_dir), "data", "shops_raw.json")
+
+    parser = argparse.ArgumentParser(description="OSM の抽出ファイル（.osm / .osm.pbf）からお店情報を取り込む")
+    parser.add_argument("extract", help="抽出ファイル（.osm / .osm.gz / .osm.bz2 / .osm.pbf）")
+    parser.add_argument("--lat", type=float, default=DEFAULT_CENTER_LAT, help="中心の緯度")
+    parser.add_argument("--lng", type=float, default=DEFAULT_CENTER_LNG, help="中心の経度")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_M, help="検索半径（メートル。0 ならファイル全域）")
+    parser.add_argument("--workers", type=int, default=0, help="PBF のブロックを並列にデコードするワーカー数（0: 使わない）")
+    parser.add_argument("--tags", default="default", help="残すタグのキー（カンマ区切り。default / all）")
+    parser.add_argument("--out", default=default_out, help="出力先（shops_raw.json）")
+    args = parser.parse_args()
+
+    tag_allowlist: Optional[Tuple[str, ...]] = DEFAULT_TAG_ALLOWLIST
+    if args.tags == "all":
+        tag_allowlist = None
+    elif args.tags != "default":
+        tag_allowlist = tuple(key.strip() for key in args.tags.split(",") if key.strip())
+
+    print("=" * 50)
+    print("OSM の抽出ファイルからお店情報を取り込み")
+    print("=" * 50)
+    print(f"入力: {args.extract} ({os.path.getsize(args.extract):,} bytes)")
+    if args.radius > 0:
+        print(f"中心: {args.lat}, {args.lng} / 半径: {args.radius:g}m")
+    else:
+        print("範囲: ファイル全域")
+    print()
+
+    meta: Dict[str, Any] = {}
+    start = time.perf_counter()
+    shops, extractor = import_shops(
+        args.extract, args.lat, args.lng, args.radius, tag_allowlist, workers=args.workers, meta=meta
+    )
+    elapsed = time.perf_counter() - start
+    stats = extractor.stats
+    print(f"読み込み: ノード {stats['nodes']:,} / ウェイ {stats['ways']:,} / リレーション {stats['relations']:,}（{elapsed:.1f} 秒）")
+    print(f"ノードの位置の表: {len(extractor.nodes):,} 件 / {extractor.nodes.nbytes + extractor.way_boxes.nbytes:,} bytes")
+    if stats["missing"]:
+        print(f"警告: ノードの位置がファイルにないため {stats['missing']} 件のウェイ・リレーションを除きました")
+    print_summary(shops)
+
+    if args.radius > 0:
+        center_lat, center_lng, radius = args.lat, args.lng, int(args.radius)
+    else:
+        center_lat, center_lng, radius = covering_circle(shops)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    save_shops_raw(
+        shops, args.out, center_lat, center_lng, radius, meta.get("timestamp"),
+        source=f"OpenStreetMap ({os.path.basename(args.extract)})"
+    )
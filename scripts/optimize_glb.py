@@ -0,0 +1,373 @@
+"""
+GLB の軽量化（読み込み時間の短縮）
+
+city.js は gltf/city.glb をそのまま GLTFLoader で読み込むので、起動時間はダウンロードと GPU への転送でほぼ決まる。
+このスクリプトは GLB を次のように書き換える:
+
+  - ブロック（ノード名）ごとに、同じマテリアルのメッシュを1つのプリミティブにまとめる（ドローコール削減）
+  - 頂点座標を int16 に量子化し、ブロックのノードの translation / scale で元の座標に戻す（KHR_mesh_quantization）
+  - 法線を int8（normalized）に量子化する
+  - UV は 0〜1 に収まっていれば uint16（normalized）、収まらなければ float のまま
+  - 頂点カラー（COLOR_0）は uint8（normalized）の RGBA にする（glTF ではベースカラーに必ず掛かるので残す）
+  - マテリアルが使わない属性（マテリアルのテクスチャが参照しない TEXCOORD_n、TANGENT 等）とメッシュのないノードを捨てる
+  - 法線のないプリミティブは面ごとに頂点を分けてフラットな法線を付ける（glTF の仕様どおり）
+  - 頂点数が 65536 未満のプリミティブのインデックスを uint16 にする
+
+ブロック単位（ノード名）でまとめるので、split_city_blocks.py / split_glb_blocks.py で分割した GLB に使う。
+分割していない GLB には --block-size で三角形をグリッドのセルに振り分けてまとめる（1メッシュの GLB でも分かれる）。
+スケールは3軸共通（法線が歪まないようにするため）。精度はブロックの一番長い辺 / 65534。
+"""
+
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 軽量化には NumPy が必要（実行時にエラーにする）
+    np = None
+
+from glb_reader import load_glb, iter_mesh_nodes, primitive_triangles, write_glb
+from split_glb_blocks import (
+    GlbBuilder,
+    COMPONENT_FLOAT,
+    COMPONENT_UINT16,
+    COMPONENT_UINT32,
+    TARGET_ARRAY_BUFFER,
+    TARGET_ELEMENT_ARRAY_BUFFER,
+    group_blocks,
+    texture_refs,
+)
+
+COMPONENT_INT8 = 5120
+COMPONENT_UINT8 = 5121
+COMPONENT_INT16 = 5122
+
+QUANTIZATION_EXTENSION = "KHR_mesh_quantization"
+QUANTIZE_MAX = 32767
+
+# Blender で名前が重複したときの ".001" 等（同じブロックとしてまとめる）
+_DUPLICATE_SUFFIX = re.compile(r"\.\d{3}$")
+
+
+def material_texcoords(material: Optional[Dict[str, Any]]) -> List[int]:
+    """マテリアルのテクスチャが参照する UV の番号（textureInfo の texCoord。既定 0）"""
+    if material is None:
+        return []
+    refs: List[Dict[str, Any]] = []
+    texture_refs(material, refs)
+    return sorted({int(ref.get("texCoord", 0)) for ref in refs})
+
+
+def flat_shaded(positions: "np.ndarray", triangles: "np.ndarray", attributes: Dict[str, "np.ndarray"]):
+    """
+    法線のないメッシュ用に、面ごとに頂点を分けて面の法線を付ける
+    （glTF の仕様では NORMAL がなければフラットシェーディング）。
+    返り値: (位置, 法線, 属性, 三角形)
+    """
+    corners = triangles.reshape(-1)
+    positions = positions[corners]
+    a, b, c = positions[0::3], positions[1::3], positions[2::3]
+    face = np.cross(b - a, c - a)
+    length = np.linalg.norm(face, axis=1, keepdims=True)
+    normals = np.repeat(face / np.where(length > 0, length, 1.0), 3, axis=0)
+    attributes = {key: values[corners] for key, values in attributes.items()}
+    return positions, normals, attributes, np.arange(len(corners)).reshape(-1, 3)
+
+
+def collect_blocks(
+    glb,
+    block_size: Optional[Tuple[float, float]] = None
+) -> Tuple[Dict[str, Dict[Optional[int], List[Dict[str, Any]]]], Dict[str, int]]:
+    """
+    メッシュをブロック・マテリアルごとに集める。頂点と法線はワールド座標にしておく。
+    ブロックは通常ノード名。block_size を渡すと、三角形ごとに重心が入るグリッドのセル（Block_ix_iy）に振り分ける
+    （分割していない GLB 用。規則は split_glb_blocks.assign_blocks と同じ）。
+    返り値: (dict[ブロック名][マテリアル] -> [部品, ...], 捨てた属性の件数)
+    """
+    materials = glb.gltf.get("materials", [])
+    meshes = glb.gltf.get("meshes", [])
+    parts: List[Tuple[str, Optional[int], Dict[str, Any]]] = []
+    dropped: Dict[str, int] = {}
+    for name, mesh_index, world in iter_mesh_nodes(glb):
+        block = _DUPLICATE_SUFFIX.sub("", name)
+        normal_matrix = np.linalg.inv(world[:3, :3]).T
+        for primitive in meshes[mesh_index].get("primitives", []):
+            attributes = primitive.get("attributes", {})
+            if "POSITION" not in attributes:
+                continue
+            tris = primitive_triangles(glb, primitive)
+            if not len(tris):
+                continue
+            material = primitive.get("material")
+            texcoords = material_texcoords(materials[material] if material is not None else None)
+
+            positions = glb.accessor_float(attributes["POSITION"]) @ world[:3, :3].T + world[:3, 3]
+            # 残す属性（UV はマテリアルが参照する番号だけ。ない番号は 0 で埋める）
+            kept: Dict[str, "np.ndarray"] = {}
+            for index in texcoords:
+                key = f"TEXCOORD_{index}"
+                kept[key] = glb.accessor_float(attributes[key]) if key in attributes else np.zeros((len(positions), 2))
+            if "COLOR_0" in attributes:
+                color = glb.accessor_float(attributes["COLOR_0"])
+                if color.shape[1] == 3:
+                    color = np.concatenate([color, np.ones((len(color), 1))], axis=1)
+                kept["COLOR_0"] = color
+
+            for attribute in attributes:
+                if attribute in ("POSITION", "NORMAL") or attribute in kept:
+                    continue
+                dropped[attribute] = dropped.get(attribute, 0) + 1
+
+            if "NORMAL" in attributes:
+                n = glb.accessor_float(attributes["NORMAL"]) @ normal_matrix.T
+                length = np.linalg.norm(n, axis=1, keepdims=True)
+                normals = n / np.where(length > 0, length, 1.0)
+            else:
+                positions, normals, kept, tris = flat_shaded(positions, tris, kept)
+            parts.append((block, material, {"positions": positions, "normals": normals, "attributes": kept, "triangles": tris}))
+
+    if block_size is not None and parts:
+        # Blender の X・Y（glTF の X・-Z）のグリッド。原点は使われている頂点の最小の X と最大の Z
+        used = [p["positions"][np.unique(p["triangles"])] for _, _, p in parts]
+        min_x = min(float(u[:, 0].min()) for u in used)
+        max_z = max(float(u[:, 2].max()) for u in used)
+        regrouped = []
+        for _, material, part in parts:
+            # 三角形の重心が入るセルに振り分け、セルごとの部品に分けて頂点番号を振り直す
+            centers = part["positions"][part["triangles"]].mean(axis=1)
+            ix = ((centers[:, 0] - min_x) // block_size[0]).astype(np.int64)
+            iy = ((max_z - centers[:, 2]) // block_size[1]).astype(np.int64)
+            for (bx, by), tri_indices in group_blocks(ix, iy).items():
+                vertices, local = np.unique(part["triangles"][tri_indices], return_inverse=True)
+                regrouped.append((f"Block_{bx}_{by}", material, {
+                    "positions": part["positions"][vertices],
+                    "normals": part["normals"][vertices],
+                    "attributes": {key: values[vertices] for key, values in part["attributes"].items()},
+                    "triangles": local.reshape(-1, 3),
+                }))
+        parts = regrouped
+
+    blocks: Dict[str, Dict[Optional[int], List[Dict[str, Any]]]] = {}
+    for block, material, part in parts:
+        blocks.setdefault(block, {}).setdefault(material, []).append(part)
+    return blocks, dropped
+
+
+def merge_parts(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    同じマテリアルの部品を1つにまとめ、使われていない頂点を捨てる。
+    一部の部品にしかない頂点カラーは、ない部品を白（ベースカラーを変えない）で埋める。
+    """
+    base = np.cumsum([0] + [len(p["positions"]) for p in parts[:-1]])
+    positions = np.concatenate([p["positions"] for p in parts])
+    normals = np.concatenate([p["normals"] for p in parts])
+    triangles = np.concatenate([p["triangles"] + b for p, b in zip(parts, base)])
+    used, local = np.unique(triangles, return_inverse=True)
+
+    attributes = {}
+    for key in sorted({key for p in parts for key in p["attributes"]}):
+        width = 4 if key == "COLOR_0" else 2
+        fill = 1.0 if key == "COLOR_0" else 0.0
+        values = np.concatenate([
+            p["attributes"][key] if key in p["attributes"] else np.full((len(p["positions"]), width), fill)
+            for p in parts
+        ])
+        attributes[key] = values[used]
+    return {
+        "positions": positions[used],
+        "normals": normals[used],
+        "attributes": attributes,
+        "indices": local.reshape(-1),
+    }
+
+
+class OptimizedGlbBuilder(GlbBuilder):
+    """量子化したブロックのノードを持つ GLB を組み立てる"""
+
+    def _packed_accessor(self, values: "np.ndarray", width: int, component: int, type_: str, **extra) -> int:
+        """
+        頂点属性を4バイト境界に揃えて書き込む（VEC3 の int16 / int8 は1要素余分に詰めて byteStride を付ける）。
+        values は (件数, width) の整数配列。
+        """
+        count, components = values.shape
+        padded = np.zeros((count, width), dtype=values.dtype)
+        padded[:, :components] = values
+        stride = padded.dtype.itemsize * width
+        accessor = {
+            "bufferView": self._view(padded.astype(padded.dtype.newbyteorder("<")).tobytes(), TARGET_ARRAY_BUFFER, stride),
+            "componentType": component,
+            "count": count,
+            "type": type_,
+        }
+        accessor.update(extra)
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def add_quantized_block(self, name: str, primitives: List[Tuple[Optional[int], Dict[str, Any]]]) -> float:
+        """
+        ブロックを量子化して1つのノードとして追加する。primitives は (マテリアル, merge_parts の結果) のリスト。
+        返り値: 量子化による頂点座標の最大誤差（メートル）
+        """
+        lo = np.min([p["positions"].min(axis=0) for _, p in primitives], axis=0)
+        hi = np.max([p["positions"].max(axis=0) for _, p in primitives], axis=0)
+        center = (lo + hi) / 2
+        scale = max(float((hi - lo).max()) / 2 / QUANTIZE_MAX, 1e-9)
+
+        max_error = 0.0
+        mesh_primitives = []
+        for material, p in primitives:
+            q = np.clip(np.round((p["positions"] - center) / scale), -QUANTIZE_MAX, QUANTIZE_MAX).astype(np.int16)
+            max_error = max(max_error, float(np.abs(q * scale + center - p["positions"]).max()))
+            attributes = {
+                "POSITION": self._packed_accessor(
+                    q, 4, COMPONENT_INT16, "VEC3", min=q.min(axis=0).tolist(), max=q.max(axis=0).tolist()
+                ),
+                "NORMAL": self._packed_accessor(
+                    np.round(p["normals"] * 127).astype(np.int8), 4, COMPONENT_INT8, "VEC3", normalized=True
+                ),
+            }
+            for key, values in p["attributes"].items():
+                if key == "COLOR_0":
+                    attributes[key] = self._packed_accessor(
+                        np.round(np.clip(values, 0, 1) * 255).astype(np.uint8), 4, COMPONENT_UINT8, "VEC4", normalized=True
+                    )
+                elif len(values) and values.min() >= 0 and values.max() <= 1:
+                    attributes[key] = self._packed_accessor(
+                        np.round(values * 65535).astype(np.uint16), 2, COMPONENT_UINT16, "VEC2", normalized=True
+                    )
+                else:
+                    attributes[key] = self._accessor(values.astype(np.float32), COMPONENT_FLOAT, "VEC2", TARGET_ARRAY_BUFFER)
+
+            indices = p["indices"]
+            if len(p["positions"]) < 65536:
+                indices, component = indices.astype(np.uint16), COMPONENT_UINT16
+            else:
+                indices, component = indices.astype(np.uint32), COMPONENT_UINT32
+            primitive = {
+                "attributes": attributes,
+                "indices": self._accessor(indices, component, "SCALAR", TARGET_ELEMENT_ARRAY_BUFFER),
+            }
+            if material is not None:
+                primitive["material"] = self._material(material)
+            mesh_primitives.append(primitive)
+
+        self.gltf["meshes"].append({"name": name, "primitives": mesh_primitives})
+        self.gltf["nodes"].append({
+            "name": name,
+            "mesh": len(self.gltf["meshes"]) - 1,
+            "translation": center.tolist(),
+            "scale": [scale, scale, scale],
+        })
+        self.gltf["scenes"][0]["nodes"].append(len(self.gltf["nodes"]) - 1)
+        return max_error
+
+    def build(self) -> Tuple[Dict[str, Any], bytes]:
+        gltf, data = super().build()
+        used = [e for e in gltf.get("extensionsUsed", []) if e != QUANTIZATION_EXTENSION]
+        gltf["extensionsUsed"] = used + [QUANTIZATION_EXTENSION]
+        gltf["extensionsRequired"] = [QUANTIZATION_EXTENSION]
+        return gltf, data
+
+
+# ============================================================
+# 集計
+# ============================================================
+
+def glb_stats(glb, size: int) -> Dict[str, int]:
+    """ファイルサイズ・ドローコール数（メッシュを持つノードのプリミティブ数）・頂点数・三角形数"""
+    meshes = glb.gltf.get("meshes", [])
+    accessors = glb.gltf.get("accessors", [])
+    stats = {"bytes": size, "draw_calls": 0, "nodes": len(glb.gltf.get("nodes", [])), "vertices": 0, "triangles": 0}
+    for _, mesh_index, _ in iter_mesh_nodes(glb):
+        for primitive in meshes[mesh_index].get("primitives", []):
+            if "POSITION" not in primitive.get("attributes", {}):
+                continue
+            stats["draw_calls"] += 1
+            stats["vertices"] += accessors[primitive["attributes"]["POSITION"]]["count"]
+            stats["triangles"] += len(primitive_triangles(glb, primitive))
+    return stats
+
+
+def print_report(before: Dict[str, int], after: Dict[str, int], max_error: float, dropped: Dict[str, int]):
+    """最適化前後の比較を表示"""
+    print(f"\n{'':<14}{'最適化前':>14}{'最適化後':>14}{'比率':>8}")
+    labels = (
+        ("bytes", "サイズ"),
+        ("draw_calls", "ドローコール"),
+        ("nodes", "ノード"),
+        ("vertices", "頂点"),
+        ("triangles", "三角形"),
+    )
+    for key, label in labels:
+        ratio = after[key] / before[key] if before[key] else 0.0
+        print(f"{label:<14}{before[key]:>14,}{after[key]:>14,}{ratio:>8.0%}")
+    print(f"\n座標の量子化誤差: 最大 {max_error * 1000:.2f} mm")
+    if dropped:
+        print("捨てた属性: " + ", ".join(f"{k}（{v} 件）" for k, v in sorted(dropped.items())))
+
+
+# ============================================================
+# 最適化
+# ============================================================
+
+def optimize_glb(
+    in_path: str,
+    out_path: str,
+    block_size: Optional[Tuple[float, float]] = None
+) -> Tuple[Dict[str, int], Dict[str, int], float, Dict[str, int]]:
+    """
+    GLB を軽量化して書き出す。block_size を渡すとノード名ではなくグリッドのセルごとにまとめる。
+    返り値: (最適化前の集計, 最適化後の集計, 量子化誤差の最大, 捨てた属性)
+    """
+    if np is None:
+        raise RuntimeError("GLB の軽量化には NumPy が必要です（pip install numpy）")
+    source = load_glb(in_path)
+    if source.gltf.get("animations") or source.gltf.get("skins"):
+        raise ValueError("アニメーション・スキンを含む GLB には対応していません")
+    before = glb_stats(source, os.path.getsize(in_path))
+
+    blocks, dropped = collect_blocks(source, block_size)
+    builder = OptimizedGlbBuilder(source)
+    max_error = 0.0
+    for name in sorted(blocks):
+        by_material = blocks[name]
+        order = sorted(by_material, key=lambda m: -1 if m is None else m)
+        primitives = [(material, merge_parts(by_material[material])) for material in order]
+        max_error = max(max_error, builder.add_quantized_block(name, primitives))
+    size = write_glb(out_path, *builder.build())
+
+    after = glb_stats(load_glb(out_path), size)
+    return before, after, max_error, dropped
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    gltf_dir = os.path.join(os.path.dirname(script_dir), "gltf")
+
+    parser = argparse.ArgumentParser(description="GLB を量子化・統合して軽量化する")
+    parser.add_argument("--glb", default=os.path.join(gltf_dir, "city.glb"), help="入力の GLB")
+    parser.add_argument("--out", default=None, help="出力先（省略時は入力と同じフォルダの <名前>.opt.glb）")
+    parser.add_argument("--block-size", type=float, nargs=2, metavar=("X", "Y"), default=None,
+                        help="分割していない GLB 用。ノード名ではなくこの幅のグリッド（Blender の X・Y）ごとにまとめる")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.splitext(args.glb)[0] + ".opt.glb"
+
+    print("=" * 50)
+    print("GLB の軽量化")
+    print("=" * 50)
+
+    if not os.path.exists(args.glb):
+        print(f"\nエラー: {args.glb} が見つかりません")
+        raise SystemExit(1)
+
+    before, after, max_error, dropped = optimize_glb(args.glb, out_path, args.block_size)
+    print_report(before, after, max_error, dropped)
+    print(f"\n保存完了: {out_path}")
@@ -0,0 +1,413 @@
+"""
+OpenStreetMap PBF（.osm.pbf）の読み込み（Python のみ・外部ライブラリなし）
+
+PBF はブロブの並び:
+  [4 バイト（ビッグエンディアン）: BlobHeader の長さ] [BlobHeader] [Blob] ...
+  BlobHeader: type（"OSMHeader" / "OSMData"）, datasize
+  Blob: raw / zlib_data / lzma_data（圧縮されたブロック本体）
+ブロック本体は Protocol Buffers の HeaderBlock / PrimitiveBlock。
+PrimitiveBlock は文字列表と PrimitiveGroup（nodes / dense / ways / relations）の並びで、
+タグや役割は文字列表の番号、id と座標は差分（zigzag の varint）で入っている。
+
+ブロックは互いに独立しているので、iter_blobs で読んだブロブを別プロセスで decode_block できる。
+decode_block はすべてのノードの位置（型付き配列）と、指定したキーのタグを持つ要素だけを返す。
+座標は 1e-7 度単位の整数（E7。OSM の精度）で返す。
+"""
+
+import struct
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from itertools import accumulate
+from typing import Dict, Any, List, Optional, Tuple, Iterator, BinaryIO, Collection
+
+# 読める機能（HeaderBlock の required_features がこれ以外を含むファイルは読めない）
+SUPPORTED_FEATURES = {"OsmSchema-V0.6", "DenseNodes"}
+
+# Blob の最大の大きさ（仕様上の上限）
+MAX_BLOB_SIZE = 32 * 1024 * 1024
+
+# ノードの座標の単位（ナノ度）から E7 への変換
+NANO_PER_E7 = 100
+
+MEMBER_TYPES = ("node", "way", "relation")
+
+# (最小緯度, 最小経度, 最大緯度, 最大経度)（E7）
+Box = Tuple[int, int, int, int]
+
+
+# ============================================================
+# Protocol Buffers の最小限のデコード
+# ============================================================
+
+def _varint(buf: memoryview, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf: memoryview) -> Iterator[Tuple[int, Any]]:
+    """メッセージのフィールドを (番号, 値) で返す。値は varint なら int、長さ付きなら memoryview"""
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = _varint(buf, pos)
+        elif wire == 2:
+            length, pos = _varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"未対応のワイヤ形式: {wire}")
+        yield key >> 3, value
+
+
+def _packed(buf: memoryview) -> List[int]:
+    """packed の varint の並び"""
+    result = []
+    append = result.append
+    value = 0
+    shift = 0
+    for byte in buf:
+        if byte < 0x80:
+            append(value | (byte << shift))
+            value = 0
+            shift = 0
+        else:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+    return result
+
+
+def _packed_sint(buf: memoryview) -> List[int]:
+    """packed の sint（zigzag）の並び"""
+    return [(v >> 1) ^ -(v & 1) for v in _packed(buf)]
+
+
+def _delta(buf: memoryview) -> List[int]:
+    """差分で入った packed の sint の並びを元の値に戻す"""
+    return list(accumulate(_packed_sint(buf)))
+
+
+def _sint(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _int64(value: int) -> int:
+    """varint の int64（負の数は 2 の補数の 64 ビット）"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+# ============================================================
+# ブロブ
+# ============================================================
+
+def iter_blobs(fp: BinaryIO) -> Iterator[Tuple[str, bytes]]:
+    """ファイルのブロブを (種類, Blob のバイト列) で順に返す（展開はしない）"""
+    while True:
+        head = fp.read(4)
+        if not head:
+            return
+        if len(head) < 4:
+            raise ValueError("PBF の末尾が途中で切れています")
+        (header_size,) = struct.unpack(">I", head)
+        header = memoryview(fp.read(header_size))
+        blob_type = ""
+        data_size = 0
+        for number, value in _fields(header):
+            if number == 1:
+                blob_type = bytes(value).decode("utf-8")
+            elif number == 3:
+                data_size = value
+        if data_size > MAX_BLOB_SIZE:
+            raise ValueError(f"Blob が大きすぎます: {data_size} bytes")
+        blob = fp.read(data_size)
+        if len(blob) < data_size:
+            raise ValueError("PBF の末尾が途中で切れています")
+        yield blob_type, blob
+
+
+def blob_data(blob: bytes) -> bytes:
+    """Blob を展開してブロック本体のバイト列にする"""
+    for number, value in _fields(memoryview(blob)):
+        if number == 1:
+            return bytes(value)
+        if number == 3:
+            return zlib.decompress(value)
+        if number == 4:
+            import lzma
+            return lzma.decompress(value)
+        if number in (5, 6, 7):
+            raise ValueError("未対応の圧縮形式です（bzip2 / lz4 / zstd）。osmium cat 等で zlib に変換してください")
+    raise ValueError("Blob に本体がありません")
+
+
+# ============================================================
+# HeaderBlock
+# ============================================================
+
+def read_header_block(data: bytes) -> Dict[str, Any]:
+    """
+    HeaderBlock を辞書で返す。
+    キー: required_features, optional_features, writingprogram, source, bbox（E7 の Box）,
+         replication_timestamp（秒。ない場合は None）
+    """
+    header: Dict[str, Any] = {
+        "required_features": [], "optional_features": [],
+        "writingprogram": None, "source": None, "bbox": None, "replication_timestamp": None,
+    }
+    for number, value in _fields(memoryview(data)):
+        if number == 1:
+            box = {n: _sint(v) for n, v in _fields(value)}
+            # HeaderBBox: left, right, top, bottom（ナノ度）
+            header["bbox"] = (
+                box.get(4, 0) // NANO_PER_E7, box.get(1, 0) // NANO_PER_E7,
+                box.get(3, 0) // NANO_PER_E7, box.get(2, 0) // NANO_PER_E7,
+            )
+        elif number == 4:
+            header["required_features"].append(bytes(value).decode("utf-8"))
+        elif number == 5:
+            header["optional_features"].append(bytes(value).decode("utf-8"))
+        elif number == 16:
+            header["writingprogram"] = bytes(value).decode("utf-8")
+        elif number == 17:
+            header["source"] = bytes(value).decode("utf-8")
+        elif number == 32:
+            header["replication_timestamp"] = _int64(value)
+    unsupported = set(header["required_features"]) - SUPPORTED_FEATURES
+    if unsupported:
+        raise ValueError(f"未対応の機能を使った PBF です: {', '.join(sorted(unsupported))}")
+    return header
+
+
+# ============================================================
+# PrimitiveBlock
+# ============================================================
+
+@dataclass
+class Block:
+    """
+    PrimitiveBlock をデコードした結果。
+    node_ids / node_lats / node_lons: ブロック内のすべてのノードの位置（box を指定した場合はその中だけ）
+    nodes: (id, 緯度 E7, 経度 E7, タグ)、ways: (id, ノードの id の並び, タグ)、
+    relations: (id, [(メンバーの種類, id)], タグ) は、指定したキーのタグを持つ要素だけ。
+    タグのないウェイ（マルチポリゴンの外周など）は untagged_ways=True のとき ways にタグ {} で入る。
+    *_count はブロック内の要素の数（返さなかった要素も含む）。
+    """
+    node_count: int = 0
+    way_count: int = 0
+    relation_count: int = 0
+    node_ids: array = field(default_factory=lambda: array("q"))
+    node_lats: array = field(default_factory=lambda: array("i"))
+    node_lons: array = field(default_factory=lambda: array("i"))
+    nodes_sorted: bool = True
+    nodes: List[Tuple[int, int, int, Dict[str, str]]] = field(default_factory=list)
+    ways: List[Tuple[int, List[int], Dict[str, str]]] = field(default_factory=list)
+    relations: List[Tuple[int, List[Tuple[str, int]], Dict[str, str]]] = field(default_factory=list)
+
+
+class _BlockDecoder:
+    """1ブロック分の文字列表・座標の変換と、要素のデコード"""
+
+    def __init__(self, data: bytes, keys: Collection[str], untagged_ways: bool, box: Optional[Box]):
+        self.untagged_ways = untagged_ways
+        self.box = box
+        self.strings: List[str] = []
+        self.granularity = 100
+        self.lat_offset = 0
+        self.lon_offset = 0
+        groups = []
+        for number, value in _fields(memoryview(data)):
+            if number == 1:
+                self.strings = [bytes(s).decode("utf-8") for n, s in _fields(value) if n == 1]
+            elif number == 2:
+                groups.append(value)
+            elif number == 17:
+                self.granularity = value
+            elif number == 19:
+                self.lat_offset = _int64(value)
+            elif number == 20:
+                self.lon_offset = _int64(value)
+        self.groups = groups
+        # 要素を返すキー（文字列表の番号）
+        self.key_ids = {i for i, s in enumerate(self.strings) if s in keys}
+        self.block = Block()
+
+    def _e7(self, values: List[int], offset: int) -> List[int]:
+        if self.granularity == NANO_PER_E7 and offset == 0:
+            return values
+        g = self.granularity
+        return [(offset + g * v + NANO_PER_E7 // 2) // NANO_PER_E7 for v in values]
+
+    def _tags(self, keys: List[int], vals: List[int]) -> Dict[str, str]:
+        strings = self.strings
+        return {strings[k]: strings[v] for k, v in zip(keys, vals)}
+
+    def _add_nodes(self, ids: List[int], lats: List[int], lons: List[int]):
+        block = self.block
+        if ids and block.node_ids and ids[0] <= block.node_ids[-1]:
+            block.nodes_sorted = False
+        if self.box is not None:
+            min_lat, min_lon, max_lat, max_lon = self.box
+            kept = [
+                (i, la, lo) for i, la, lo in zip(ids, lats, lons)
+                if min_lat <= la <= max_lat and min_lon <= lo <= max_lon
+            ]
+            ids = [k[0] for k in kept]
+            lats = [k[1] for k in kept]
+            lons = [k[2] for k in kept]
+        block.node_ids.extend(ids)
+        block.node_lats.extend(lats)
+        block.node_lons.extend(lons)
+
+    def decode(self) -> Block:
+        for group in self.groups:
+            for number, value in _fields(group):
+                if number == 2:
+                    self._dense(value)
+                elif number == 1:
+                    self._node(value)
+                elif number == 3:
+                    self._way(value)
+                elif number == 4:
+                    self._relation(value)
+        return self.block
+
+    def _dense(self, buf: memoryview):
+        ids: List[int] = []
+        lats: List[int] = []
+        lons: List[int] = []
+        keys_vals: List[int] = []
+        for number, value in _fields(buf):
+            if number == 1:
+                ids = _delta(value)
+            elif number == 8:
+                lats = _delta(value)
+            elif number == 9:
+                lons = _delta(value)
+            elif number == 10:
+                keys_vals = _packed(value)
+        self.block.node_count += len(ids)
+        lats = self._e7(lats, self.lat_offset)
+        lons = self._e7(lons, self.lon_offset)
+        if any(b <= a for a, b in zip(ids, ids[1:])):
+            self.block.nodes_sorted = False
+
+        # keys_vals: ノードごとに キー, 値, キー, 値, ..., 0
+        key_ids = self.key_ids
+        if keys_vals and key_ids:
+            strings = self.strings
+            node = 0
+            pos = 0
+            end = len(keys_vals)
+            while pos < end:
+                start = pos
+                wanted = False
+                while keys_vals[pos] != 0:
+                    if keys_vals[pos] in key_ids:
+                        wanted = True
+                    pos += 2
+                if wanted:
+                    tags = {strings[keys_vals[k]]: strings[keys_vals[k + 1]] for k in range(start, pos, 2)}
+                    self.block.nodes.append((ids[node], lats[node], lons[node], tags))
+                pos += 1
+                node += 1
+        self._add_nodes(ids, lats, lons)
+
+    def _node(self, buf: memoryview):
+        node_id = lat = lon = 0
+        keys: List[int] = []
+        vals: List[int] = []
+        for number, value in _fields(buf):
+            if number == 1:
+                node_id = _sint(value)
+            elif number == 2:
+                keys = _packed(value)
+            elif number == 3:
+                vals = _packed(value)
+            elif number == 8:
+                lat = _sint(value)
+            elif number == 9:
+                lon = _sint(value)
+        self.block.node_count += 1
+        lat = self._e7([lat], self.lat_offset)[0]
+        lon = self._e7([lon], self.lon_offset)[0]
+        if self.key_ids.intersection(keys):
+            self.block.nodes.append((node_id, lat, lon, self._tags(keys, vals)))
+        self._add_nodes([node_id], [lat], [lon])
+
+    def _way(self, buf: memoryview):
+        self.block.way_count += 1
+        way_id = 0
+        keys: List[int] = []
+        vals: List[int] = []
+        refs: Optional[memoryview] = None
+        for number, value in _fields(buf):
+            if number == 1:
+                way_id = value
+            elif number == 2:
+                keys = _packed(value)
+            elif number == 3:
+                vals = _packed(value)
+            elif number == 8:
+                refs = value
+        if self.key_ids.intersection(keys):
+            tags = self._tags(keys, vals)
+        elif not keys and self.untagged_ways:
+            tags = {}
+        else:
+            return
+        self.block.ways.append((way_id, _delta(refs) if refs is not None else [], tags))
+
+    def _relation(self, buf: memoryview):
+        self.block.relation_count += 1
+        relation_id = 0
+        keys: List[int] = []
+        vals: List[int] = []
+        member_ids: Optional[memoryview] = None
+        member_types: Optional[memoryview] = None
+        for number, value in _fields(buf):
+            if number == 1:
+                relation_id = value
+            elif number == 2:
+                keys = _packed(value)
+            elif number == 3:
+                vals = _packed(value)
+            elif number == 9:
+                member_ids = value
+            elif number == 10:
+                member_types = value
+        if not self.key_ids.intersection(keys):
+            return
+        ids = _delta(member_ids) if member_ids is not None else []
+        types = _packed(member_types) if member_types is not None else []
+        members = [(MEMBER_TYPES[t], i) for t, i in zip(types, ids)]
+        self.block.relations.append((relation_id, members, self._tags(keys, vals)))
+
+
+def decode_block(
+    data: bytes,
+    keys: Collection[str],
+    untagged_ways: bool = False,
+    box: Optional[Box] = None
+) -> Block:
+    """
+    PrimitiveBlock をデコードする。
+    keys のいずれかをタグに持つノード・ウェイ・リレーションだけをタグ付きで返す（他はノードの位置だけ）。
+    box を指定すると、その範囲（E7）の外のノードの位置は返さない。
+    """
+    return _BlockDecoder(data, keys, untagged_ways, box).decode()
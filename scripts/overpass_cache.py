@@ -0,0 +1,224 @@
+"""
+Overpass API レスポンスのディスクキャッシュ
+
+クエリ文字列（＋エンドポイント）のハッシュをキーにして、レスポンス本体をそのまま保存する。
+同じクエリの再実行ではネットワークにアクセスしない。
+
+- TTL: 保存から ttl_s 秒を過ぎたエントリは使わない（オフライン時は期限切れでも使う）
+- 容量: 合計 max_bytes を超えたら最後に使った時刻が古い順に削除（LRU）
+- オフライン: キャッシュにないクエリは OfflineCacheMiss を送出
+- インデックス（index.json）は保存・削除のときと close() / 終了時にだけ書き込む（ヒットのたびには書かない）
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional, BinaryIO
+
+DEFAULT_TTL_S = 7 * 24 * 3600          # 1週間
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256MB
+
+INDEX_FILENAME = "index.json"
+
+
+class OfflineCacheMiss(Exception):
+    """オフラインモードでキャッシュにないクエリを要求した"""
+
+
+class CacheWriter:
+    """一時ファイルに書き込み、commit() で初めてキャッシュに登録する"""
+
+    def __init__(self, cache: "OverpassCache", key: str, tmp_path: str):
+        self.cache = cache
+        self.key = key
+        self.tmp_path = tmp_path
+        self.size = 0
+        self._file = open(tmp_path, 'wb')
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        self._file.close()
+        self.cache._commit(self.key, self.tmp_path, self.size)
+
+    def discard(self):
+        """途中で失敗した場合は一時ファイルを捨てる"""
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def cache_key(url: str, query: str) -> str:
+    """エンドポイントとクエリ文字列からキャッシュキー（SHA-256）を作る"""
+    h = hashlib.sha256()
+    h.update(url.encode("utf-8"))
+    h.update(b"\n")
+    h.update(query.encode("utf-8"))
+    return h.hexdigest()
+
+
+class OverpassCache:
+    """内容アドレス方式のレスポンスキャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        offline: bool = False
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index: Dict[str, Dict[str, Any]] = self._load_index()
+        # ヒットで last_used だけが変わり、まだ index.json に書いていない
+        self._dirty = False
+        atexit.register(self.close)
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILENAME)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        """インデックスを読み込み、実体のないエントリは捨てる"""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {k: v for k, v in index.items() if os.path.exists(self._entry_path(k))}
+
+    def _save_index(self):
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+        self._dirty = False
+
+    def _remove_entry(self, key: str):
+        """エントリをインデックスから外し、ファイルも消す（ロック取得済みで呼ぶ）"""
+        self._index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def close(self):
+        """ヒットで更新した last_used を index.json に書き込む（終了時にも自動で呼ばれる）"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def __enter__(self) -> "OverpassCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """
+        有効なエントリのファイルパスを返す。なければ None（ロック取得済みで呼ぶ）。
+        オフラインモードでは期限切れでも返し、ない場合は OfflineCacheMiss。
+        """
+        entry = self._index.get(key)
+        now = time.time()
+        expired = entry is not None and now - entry["created"] > self.ttl_s
+        path = self._entry_path(key)
+        if entry is None or (expired and not self.offline) or not os.path.exists(path):
+            if entry is not None:
+                # 期限切れのファイルも消す（残すと _evict の合計サイズに入らないまま場所を取る）
+                self._remove_entry(key)
+                self._dirty = True
+            self.misses += 1
+            if self.offline:
+                raise OfflineCacheMiss(f"キャッシュにないクエリです（オフライン）: {key[:12]}")
+            return None
+        entry["last_used"] = now
+        self.hits += 1
+        self._dirty = True
+        return path
+
+    def get_bytes(self, url: str, query: str) -> Optional[bytes]:
+        """キャッシュ済みのレスポンス本体を返す。なければ None"""
+        with self._lock:
+            path = self._lookup(cache_key(url, query))
+            if path is None:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def open(self, url: str, query: str) -> Optional[BinaryIO]:
+        """キャッシュ済みのレスポンスを読み込み用に開く（逐次パース用）。なければ None"""
+        with self._lock:
+            path = self._lookup(cache_key(url, query))
+            if path is None:
+                return None
+            return open(path, 'rb')
+
+    def get(self, url: str, query: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みのレスポンスを JSON として返す。なければ None"""
+        body = self.get_bytes(url, query)
+        if body is None:
+            return None
+        return json.loads(body.decode("utf-8"))
+
+    def put(self, url: str, query: str, body: bytes):
+        """レスポンス本体を保存し、容量を超えていれば古いものから削除"""
+        writer = self.writer(url, query)
+        writer.write(body)
+        writer.commit()
+
+    def writer(self, url: str, query: str) -> "CacheWriter":
+        """レスポンスを少しずつ書き込むためのライターを返す（受信しながら保存する用）"""
+        key = cache_key(url, query)
+        return CacheWriter(self, key, self._entry_path(key) + f".{threading.get_ident()}.tmp")
+
+    def _commit(self, key: str, tmp_path: str, size: int):
+        with self._lock:
+            os.replace(tmp_path, self._entry_path(key))
+            now = time.time()
+            self._index[key] = {"created": now, "last_used": now, "size": size}
+            self.stores += 1
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        """合計サイズが max_bytes 以下になるまで LRU で削除（ロック取得済みで呼ぶ）"""
+        total = sum(e["size"] for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._index, key=lambda k: self._index[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._index[key]["size"]
+            self._remove_entry(key)
+            self.evictions += 1
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(e["size"] for e in self._index.values())
+
+    def print_stats(self):
+        """ヒット・ミス等の統計を表示"""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        print("\nキャッシュ:")
+        print(f"  ヒット: {self.hits} 件 / ミス: {self.misses} 件（ヒット率 {rate:.0%}）")
+        print(f"  保存: {self.stores} 件 / 削除: {self.evictions} 件")
+        print(f"  使用量: {self.total_bytes() / 1024:.1f} KB（{len(self._index)} エントリ）")
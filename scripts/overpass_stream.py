@@ -0,0 +1,125 @@
+"""
+Overpass API レスポンス（JSON）の逐次パーサ
+
+レスポンス全体を読み込んでから json.loads するのではなく、
+ソケットやファイルから少しずつ読みながら "elements" 配列の要素を1件ずつ返す。
+メモリ使用量はレスポンス全体ではなく要素1件分＋読み込みバッファ程度に収まる。
+"""
+
+import codecs
+import json
+from typing import Dict, Any, Iterator, Optional, BinaryIO
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_START = "-0123456789"
+_NUMBER_END = ",]}" + _WHITESPACE
+
+
+class _Reader:
+    """バイナリストリームを UTF-8 で逐次デコードしながら読み進めるバッファ"""
+
+    def __init__(self, fp: BinaryIO, chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """次のチャンクを読み込む。これ以上データがなければ False"""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode(b"", final=True)
+            self.pos = 0
+            return False
+        # 読み終えた部分は捨ててバッファを小さく保つ
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """空白を読み飛ばし、次の1文字を返す（終端なら空文字）"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Overpass レスポンスの解析に失敗: '{char}' が必要です（位置 {self.pos}）")
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        """JSON 値を1つ読む。バッファ内で完結していなければ追加で読み込む"""
+        if self.peek() in _NUMBER_START:
+            # 数値は途中で切れていても解析できてしまうので、区切り文字まで読み込んでおく
+            while not any(c in _NUMBER_END for c in self.buf[self.pos:]) and self.fill():
+                pass
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            self.pos = end
+            return obj
+
+
+def iter_overpass_elements(
+    fp: BinaryIO,
+    meta: Optional[Dict[str, Any]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    array_key: str = "elements"
+) -> Iterator[Dict[str, Any]]:
+    """
+    Overpass の JSON レスポンスから "elements" の要素を1件ずつ返す。
+    meta を渡すと、elements 以外のトップレベルの値（version, osm3s, remark 等）を格納する。
+    "remark"（タイムアウト等の実行時エラー）は elements の後に来るので、読み切った後に参照すること。
+    array_key を変えると、同じ形の別のファイル（shops_raw.json の "shops" 等）も1件ずつ読める。
+    """
+    reader = _Reader(fp, chunk_size)
+    decoder = json.JSONDecoder()
+    if meta is None:
+        meta = {}
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value(decoder)
+        reader.expect(":")
+        if key == array_key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value(decoder)
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                        continue
+                    reader.expect("]")
+                    break
+        else:
+            meta[key] = reader.value(decoder)
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        break
+
+
+def iter_overpass_file(path: str, meta: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """保存済みの Overpass レスポンス（JSONファイル）から要素を1件ずつ返す"""
+    with open(path, 'rb') as f:
+        yield from iter_overpass_elements(f, meta)
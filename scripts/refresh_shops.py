@@ -0,0 +1,418 @@
+"""
+shops_raw.json の差分更新（Overpass API の augmented diff）
+
+fetch_shops.py で範囲全体を取り直す代わりに、shops_raw.json に記録したデータの時点（timestamp_osm_base）以降に
+追加・変更・削除されたお店だけを取得し、osm_id で shops_raw.json に反映する。
+数件のお店の変化なら、レスポンスは全件の取得より桁違いに小さい。
+
+augmented diff のレスポンス（XML）:
+  <osm>
+    <meta osm_base="2026-01-01T00:00:00Z"/>              ← 差分の終点（次回の起点）
+    <action type="create"> <node .../> </action>
+    <action type="modify"> <old>...</old> <new>...</new> </action>
+    <action type="delete"> <old>...</old> <new>...</new> </action>   ← 削除・条件から外れた要素
+  </osm>
+XML は受信しながら action ごとに読み、読み終えた部分は捨てる（全体をメモリに載せない）。
+
+dedupe_shops.py でまとめた shops_raw.json にも使える。まとめられて残っていない osm_id の追加・変更は無視し、
+削除は残ったお店の source_osm_ids から外す（更新後に dedupe_shops.py をもう一度実行するとよい）。
+"""
+
+import json
+import os
+import threading
+import urllib.request
+import xml.etree.ElementTree as ET
+from dataclasses import asdict
+from typing import Dict, Any, List, Optional, Tuple, Iterator, BinaryIO
+
+from fetch_shops import (
+    OVERPASS_URL, DEFAULT_RETRIES, DEFAULT_BACKOFF_S, DEFAULT_TAG_ALLOWLIST,
+    build_overpass_diff_query, parse_element, _build_request, _call_with_retry,
+)
+
+ACTION_CREATE = "create"
+ACTION_MODIFY = "modify"
+ACTION_DELETE = "delete"
+
+
+def _xml_element(elem: ET.Element) -> Dict[str, Any]:
+    """OSM XML の node / way / relation を Overpass JSON の要素と同じ形の辞書にする"""
+    result: Dict[str, Any] = {"type": elem.tag, "id": int(elem.get("id"))}
+    if elem.get("lat") is not None:
+        result["lat"] = float(elem.get("lat"))
+        result["lon"] = float(elem.get("lon"))
+    center = elem.find("center")
+    if center is not None:
+        result["center"] = {"lat": float(center.get("lat")), "lon": float(center.get("lon"))}
+    tags = {tag.get("k"): tag.get("v") for tag in elem.findall("tag")}
+    if tags:
+        result["tags"] = tags
+    if elem.get("visible") == "false":
+        result["visible"] = False
+    return result
+
+
+def iter_adiff_actions(fp: BinaryIO, meta: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    augmented diff（XML）の action を (種類, 変更後の要素) で1件ずつ返す。
+    削除の要素は変更前（old）のもの。meta には差分の終点（osm_base）と remark を入れる。
+    """
+    if meta is None:
+        meta = {}
+    root = None
+    for event, elem in ET.iterparse(fp, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == "meta":
+            meta["osm_base"] = elem.get("osm_base")
+        elif elem.tag == "remark":
+            meta["remark"] = (elem.text or "").strip()
+        elif elem.tag == "action":
+            kind = elem.get("type")
+            side = "old" if kind == ACTION_DELETE else "new"
+            container = elem.find(side)
+            if container is None:
+                container = elem
+            target = next((child for child in container if child.tag in ("node", "way", "relation")), None)
+            if target is not None:
+                yield kind, _xml_element(target)
+            # 読み終えた action（と meta）は捨てる
+            root.clear()
+
+
+def apply_diff(
+    shops: List[Dict[str, Any]],
+    actions: Iterator[Tuple[str, Dict[str, Any]]],
+    tag_allowlist: Optional[Tuple[str, ...]] = DEFAULT_TAG_ALLOWLIST
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[Any]]]:
+    """
+    差分を osm_id でお店の一覧に反映する。
+    返り値: (反映後のお店（名前順）, 種類ごとの変化 {"created": [...], "modified": [...], "deleted": [...], "ignored": [...]})
+    """
+    by_id: Dict[int, Dict[str, Any]] = {shop["osm_id"]: shop for shop in shops}
+    # dedupe_shops.py でまとめられた osm_id → 残ったお店の osm_id
+    merged_into: Dict[int, int] = {}
+    for shop in shops:
+        for source_id in shop.get("source_osm_ids", ()):
+            if source_id != shop["osm_id"]:
+                merged_into[source_id] = shop["osm_id"]
+
+    changes: Dict[str, List[Any]] = {"created": [], "modified": [], "deleted": [], "ignored": []}
+    for kind, elem in actions:
+        osm_id = elem["id"]
+        if kind == ACTION_DELETE:
+            if osm_id in by_id:
+                changes["deleted"].append(by_id.pop(osm_id))
+            elif osm_id in merged_into and merged_into[osm_id] in by_id:
+                keep = by_id[merged_into.pop(osm_id)]
+                keep["source_osm_ids"] = [i for i in keep["source_osm_ids"] if i != osm_id]
+                changes["deleted"].append({"osm_id": osm_id, "name": keep["name"], "category": keep["category"]})
+            continue
+
+        if osm_id in merged_into:
+            changes["ignored"].append(osm_id)
+            continue
+        shop = parse_element(elem, tag_allowlist)
+        if shop is None:
+            # 名前が消えた等で対象外になった
+            if osm_id in by_id:
+                changes["deleted"].append(by_id.pop(osm_id))
+            continue
+        record = asdict(shop)
+        old = by_id.get(osm_id)
+        if old is None:
+            by_id[osm_id] = record
+            changes["created"].append(record)
+            continue
+        if "source_osm_ids" in old:
+            record["source_osm_ids"] = old["source_osm_ids"]
+        if record != old:
+            by_id[osm_id] = record
+            changes["modified"].append(record)
+
+    result = sorted(by_id.values(), key=lambda s: s["name"])
+    return result, changes
+
+
+class _CountingReader:
+    """読み込んだバイト数を数えるラッパー（counter["bytes"] に足していく）"""
+
+    def __init__(self, fp: BinaryIO, counter: Dict[str, int]):
+        self.fp = fp
+        self.counter = counter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fp.read(size)
+        self.counter["bytes"] = self.counter.get("bytes", 0) + len(data)
+        return data
+
+
+def stream_diff(
+    query: str,
+    url: str = OVERPASS_URL,
+    retries: int = DEFAULT_RETRIES,
+    backoff_s: float = DEFAULT_BACKOFF_S,
+    meta: Optional[Dict[str, Any]] = None,
+    received: Optional[Dict[str, int]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    差分のクエリを送信し、レスポンス（XML）を受信しながら action を1件ずつ返す（iter_adiff_actions と同じ形）。
+    再試行するのは接続と応答のステータス（429 等）まで。受信の途中で失敗したらそのまま例外になる
+    （apply_diff が読み切る前なので、shops_raw.json は書き換わらない）。
+    received を渡すと受信したバイト数を received["bytes"] に入れる。
+    """
+    response = _call_with_retry(
+        lambda: urllib.request.urlopen(_build_request(query, url), timeout=120), retries, backoff_s
+    )
+    with response:
+        yield from iter_adiff_actions(_CountingReader(response, received if received is not None else {}), meta)
+
+
+def save_refreshed(data: Dict[str, Any], shops: List[Dict[str, Any]], path: str, timestamp: str):
+    """反映後のお店を shops_raw.json の形式で保存（一時ファイルに書いてから置き換える）"""
+    data = dict(data)
+    data.pop("shops", None)
+    data["count"] = len(shops)
+    data["timestamp_osm_base"] = timestamp
+    data["shops"] = shops
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"保存完了: {path} ({len(shops)} 件)")
+
+
+def fixture_server(body: bytes, port: int = 0):
+    """
+    動作確認用のスタブサーバー（HTTPServer。起動はしない）。どのリクエストにも body（差分のレスポンス）を返す。
+    server.stats["requests"] にリクエスト数が入る。
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    stats = {"requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            stats["requests"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/osm3s+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", port), Handler)
+    server.stats = stats
+    return server
+
+
+def serve_fixture(path: str, port: int):
+    """
+    保存した差分のレスポンス（path）を返すスタブサーバーを起動する（Ctrl+C で終了）。
+    python refresh_shops.py --url http://127.0.0.1:{port}/api/interpreter で接続する。
+    """
+    with open(path, 'rb') as f:
+        server = fixture_server(f.read(), port)
+    print(f"スタブサーバー: http://127.0.0.1:{port}/api/interpreter → {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ============================================================
+# 動作確認（スタブサーバーと差分のフィクスチャ）
+# ============================================================
+
+# 差分の前のお店（Overpass の要素の形）。9010 は dedupe_shops.py で 9011・9012 をまとめたお店
+_FIXTURE_BASE = [
+    {"type": "node", "id": 9001, "lat": 35.6960, "lon": 139.7830, "tags": {"name": "変わる店", "amenity": "restaurant"}},
+    {"type": "node", "id": 9002, "lat": 35.6961, "lon": 139.7831, "tags": {"name": "閉じる店", "amenity": "cafe"}},
+    {"type": "node", "id": 9003, "lat": 35.6962, "lon": 139.7832, "tags": {"name": "そのままの店", "shop": "convenience"}},
+    {"type": "node", "id": 9010, "lat": 35.6963, "lon": 139.7833, "tags": {"name": "まとめた店", "amenity": "fast_food"}},
+]
+_FIXTURE_MERGED = {9010: [9010, 9011, 9012]}
+_FIXTURE_OSM_BASE = "2026-01-02T00:00:00Z"
+# augmented diff のレスポンス: 追加 9004 / 変更 9001 / 削除 9002 / 中身の変わらない変更 9003 /
+# まとめられた 9011 の削除（source_osm_ids から外す）/ まとめられた 9012 の変更（無視）
+_FIXTURE_ADIFF = f"""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="Overpass API">
+<meta osm_base="{_FIXTURE_OSM_BASE}"/>
+<action type="create">
+  <node id="9004" lat="35.6964" lon="139.7834" version="1"><tag k="name" v="新しい店"/><tag k="amenity" v="restaurant"/></node>
+</action>
+<action type="modify">
+  <old><node id="9001" lat="35.6960" lon="139.7830" version="1"><tag k="name" v="変わる店"/><tag k="amenity" v="restaurant"/></node></old>
+  <new><node id="9001" lat="35.6960" lon="139.7830" version="2"><tag k="name" v="変わった店"/><tag k="amenity" v="restaurant"/></node></new>
+</action>
+<action type="delete">
+  <old><node id="9002" lat="35.6961" lon="139.7831" version="1"><tag k="name" v="閉じる店"/><tag k="amenity" v="cafe"/></node></old>
+  <new><node id="9002" visible="false" version="2"/></new>
+</action>
+<action type="modify">
+  <old><node id="9003" lat="35.6962" lon="139.7832" version="1"><tag k="name" v="そのままの店"/><tag k="shop" v="convenience"/></node></old>
+  <new><node id="9003" lat="35.6962" lon="139.7832" version="2"><tag k="name" v="そのままの店"/><tag k="shop" v="convenience"/><tag k="note" v="x"/></node></new>
+</action>
+<action type="delete">
+  <old><node id="9011" lat="35.6963" lon="139.7833" version="1"><tag k="name" v="まとめた店"/><tag k="amenity" v="fast_food"/></node></old>
+  <new><node id="9011" visible="false" version="2"/></new>
+</action>
+<action type="modify">
+  <old><node id="9012" lat="35.6963" lon="139.7833" version="1"><tag k="name" v="まとめた店"/><tag k="amenity" v="fast_food"/></node></old>
+  <new><node id="9012" lat="35.6963" lon="139.7833" version="2"><tag k="name" v="まとめた店 2号"/><tag k="amenity" v="fast_food"/></node></new>
+</action>
+</osm>
+""".encode("utf-8")
+
+
+def self_check() -> bool:
+    """
+    _FIXTURE_ADIFF を返すスタブサーバーから差分を受信しながら反映し、
+    追加・変更・削除と、dedupe_shops.py でまとめたお店（source_osm_ids）の扱いを確かめる。
+    """
+    import tempfile
+
+    shops = []
+    for elem in _FIXTURE_BASE:
+        record = asdict(parse_element(elem, DEFAULT_TAG_ALLOWLIST))
+        if elem["id"] in _FIXTURE_MERGED:
+            record["source_osm_ids"] = list(_FIXTURE_MERGED[elem["id"]])
+        shops.append(record)
+
+    server = fixture_server(_FIXTURE_ADIFF)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/interpreter"
+    meta: Dict[str, Any] = {}
+    received: Dict[str, int] = {}
+    try:
+        query = build_overpass_diff_query(35.6963, 139.7833, 500, "2026-01-01T00:00:00Z")
+        result, changes = apply_diff(shops, stream_diff(query, url, retries=0, meta=meta, received=received))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "shops_raw.json")
+        save_refreshed({"version": "1.0", "count": len(shops)}, result, path, meta.get("osm_base"))
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+
+    def ids(key: str) -> List[int]:
+        return sorted(shop["osm_id"] for shop in changes[key])
+
+    by_id = {shop["osm_id"]: shop for shop in result}
+    checks = [
+        ("追加", ids("created") == [9004]),
+        ("変更", ids("modified") == [9001] and by_id[9001]["name"] == "変わった店"),
+        ("削除", ids("deleted") == [9002, 9011] and 9002 not in by_id),
+        ("残らないタグだけの変更は変化なし", 9003 in by_id),
+        ("まとめたお店の削除は source_osm_ids から外す", by_id[9010]["source_osm_ids"] == [9010, 9012]),
+        ("まとめたお店の変更は無視", changes["ignored"] == [9012] and by_id[9010]["name"] == "まとめた店"),
+        ("差分の終点を保存", saved["timestamp_osm_base"] == _FIXTURE_OSM_BASE and saved["count"] == 4),
+        ("受信しながら反映", server.stats["requests"] == 1 and received.get("bytes") == len(_FIXTURE_ADIFF)),
+    ]
+    print()
+    for label, passed in checks:
+        print(f"  {label}: {'OK' if passed else 'NG'}")
+    print(f"  差分のレスポンス: {received.get('bytes', 0):,} bytes")
+    return all(passed for _, passed in checks)
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    default_path = os.path.join(os.path.dirname(script_dir), "data", "shops_raw.json")
+
+    parser = argparse.ArgumentParser(description="shops_raw.json を前回の取得以降の差分で更新する")
+    parser.add_argument("--input", default=default_path, help="更新する shops_raw.json")
+    parser.add_argument("--since", default=None, help="差分の起点（省略時は shops_raw.json の timestamp_osm_base）")
+    parser.add_argument("--url", default=OVERPASS_URL, help="Overpass API エンドポイント")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="失敗時の再試行回数")
+    parser.add_argument("--diff-file", default=None, help="保存済みの差分のレスポンス（XML）を反映する（ネットワークにアクセスしない）")
+    parser.add_argument("--tags", default="default", help="残すタグのキー（カンマ区切り。default / all）")
+    parser.add_argument("--dry-run", action="store_true", help="変化を表示するだけで保存しない")
+    parser.add_argument("--show", type=int, default=10, help="種類ごとに表示するお店の数")
+    parser.add_argument("--serve-fixture", default=None, metavar="XML", help="差分のレスポンスを返すスタブサーバーを起動する")
+    parser.add_argument("--port", type=int, default=8765, help="スタブサーバーのポート")
+    parser.add_argument("--self-check", action="store_true", help="内蔵の差分をスタブサーバーから反映して動作を確かめる")
+    args = parser.parse_args()
+
+    if args.serve_fixture:
+        serve_fixture(args.serve_fixture, args.port)
+        raise SystemExit(0)
+    if args.self_check:
+        print("=" * 50)
+        print("差分更新の動作確認（スタブサーバー）")
+        print("=" * 50)
+        raise SystemExit(0 if self_check() else 1)
+
+    tag_allowlist: Optional[Tuple[str, ...]] = DEFAULT_TAG_ALLOWLIST
+    if args.tags == "all":
+        tag_allowlist = None
+    elif args.tags != "default":
+        tag_allowlist = tuple(key.strip() for key in args.tags.split(",") if key.strip())
+
+    print("=" * 50)
+    print("お店情報の差分更新")
+    print("=" * 50)
+
+    if not os.path.exists(args.input):
+        print(f"\nエラー: {args.input} が見つかりません")
+        print("先に fetch_shops.py を実行してください")
+        raise SystemExit(1)
+    with open(args.input, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    since = args.since or data.get("timestamp_osm_base")
+    if not since and not args.diff_file:
+        print("\nエラー: データの時点（timestamp_osm_base）が記録されていません")
+        print("fetch_shops.py で取り直すか、--since で起点を指定してください")
+        raise SystemExit(1)
+
+    meta: Dict[str, Any] = {}
+    received: Dict[str, int] = {}
+    if args.diff_file:
+        print(f"\n差分: {args.diff_file}")
+        with open(args.diff_file, 'rb') as f:
+            actions = iter_adiff_actions(_CountingReader(f, received), meta)
+            shops, changes = apply_diff(data.get("shops", []), actions, tag_allowlist)
+    else:
+        query = build_overpass_diff_query(data["center"]["lat"], data["center"]["lng"], data["radius_m"], since)
+        print(f"\n{since} 以降の差分を取得中...")
+        actions = stream_diff(query, args.url, args.retries, meta=meta, received=received)
+        shops, changes = apply_diff(data.get("shops", []), actions, tag_allowlist)
+    print(f"差分のレスポンス: {received.get('bytes', 0):,} bytes")
+    if meta.get("remark"):
+        print(f"警告: Overpass API からの注意: {meta['remark']}")
+        raise SystemExit(1)
+
+    print(f"\nお店: {len(data.get('shops', []))} 件 → {len(shops)} 件")
+    labels = {"created": "追加", "modified": "変更", "deleted": "削除"}
+    for key, label in labels.items():
+        print(f"  {label}: {len(changes[key])} 件")
+        for shop in changes[key][:args.show]:
+            print(f"    - {shop['name']} ({shop['category']}) [{shop['osm_id']}]")
+    if changes["ignored"]:
+        print(f"  統合済みのため無視: {len(changes['ignored'])} 件")
+
+    timestamp = meta.get("osm_base") or since
+    print(f"データの時点: {since} → {timestamp}")
+    if not args.dry_run:
+        save_refreshed(data, shops, args.input, timestamp)
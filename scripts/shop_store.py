@@ -0,0 +1,472 @@
+"""
+お店とスポーンの SQLite ストア（R 木の空間インデックス付き）
+
+shops_raw.json やスポーン JSON はファイル全体を読み書きするしかなく、範囲で絞るにも全件を走査する。
+ShopStore は標準ライブラリの sqlite3 で、お店・タグ・生成したスポーンを1つのデータベースに持つ。
+
+  - お店は緯度経度、スポーンはゲーム座標（gameX, gameZ）の R 木（SQLite の rtree モジュール）で範囲検索できる
+  - 追加・更新は1回のトランザクションでまとめて行い、osm_id / スポーンの id ごとに行単位で置き換える
+  - 複数の範囲の shops_raw.json を取り込んでも osm_id で重なりを除いて1つにまとまる
+  - スポーンは food_spawns.json / equipment_spawns.json と同じ形式に書き出せる（convert_shops.py の SpawnJsonWriter）
+
+テーブル:
+  shops(osm_id, name, name_en, category, lat, lng, extra)     extra は source_osm_ids など他のキー（JSON）
+  tags(osm_id, position, key, value)                         お店のタグ（元の順）
+  spawns(id, output, osm_id, seq, game_x, game_z, data)      data はスポーンの JSON（groundY なども含む）
+  meta(key, value)                                           変換パラメータなど（JSON）
+R 木（shop_rtree / spawn_rtree）はトリガーで表と同時に更新する。
+rtree モジュールのない SQLite では、座標の列の B 木インデックスで代わりに絞る（結果は同じ）。
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from convert_shops import SPAWN_OUTPUTS, SpawnJsonWriter
+
+# Shop のフィールド（shops_raw.json の1件のキーの順）。これ以外のキーは extra に入れる
+SHOP_COLUMNS = ("osm_id", "name", "name_en", "category", "lat", "lng")
+
+# まとめて書き込む行数
+DEFAULT_BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shops (
+    osm_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_en TEXT,
+    category TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS shops_name ON shops(name);
+CREATE TABLE IF NOT EXISTS tags (
+    osm_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (osm_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS spawns (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    output TEXT NOT NULL,
+    osm_id INTEGER,
+    seq INTEGER NOT NULL,
+    game_x REAL NOT NULL,
+    game_z REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spawns_output ON spawns(output, seq);
+"""
+
+RTREE_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS shop_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TRIGGER IF NOT EXISTS shops_rtree_insert AFTER INSERT ON shops BEGIN
+    INSERT OR REPLACE INTO shop_rtree VALUES (new.osm_id, new.lat, new.lat, new.lng, new.lng);
+END;
+CREATE TRIGGER IF NOT EXISTS shops_rtree_update AFTER UPDATE OF lat, lng ON shops BEGIN
+    UPDATE shop_rtree SET min_lat = new.lat, max_lat = new.lat, min_lng = new.lng, max_lng = new.lng
+    WHERE id = new.osm_id;
+END;
+CREATE TRIGGER IF NOT EXISTS shops_rtree_delete AFTER DELETE ON shops BEGIN
+    DELETE FROM shop_rtree WHERE id = old.osm_id;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS spawn_rtree USING rtree(id, min_x, max_x, min_z, max_z);
+CREATE TRIGGER IF NOT EXISTS spawns_rtree_insert AFTER INSERT ON spawns BEGIN
+    INSERT OR REPLACE INTO spawn_rtree VALUES (new.rowid, new.game_x, new.game_x, new.game_z, new.game_z);
+END;
+CREATE TRIGGER IF NOT EXISTS spawns_rtree_update AFTER UPDATE OF game_x, game_z ON spawns BEGIN
+    UPDATE spawn_rtree SET min_x = new.game_x, max_x = new.game_x, min_z = new.game_z, max_z = new.game_z
+    WHERE id = new.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS spawns_rtree_delete AFTER DELETE ON spawns BEGIN
+    DELETE FROM spawn_rtree WHERE id = old.rowid;
+END;
+"""
+
+# rtree モジュールがないときの代わり
+FALLBACK_SCHEMA = """
+CREATE INDEX IF NOT EXISTS shops_lat_lng ON shops(lat, lng);
+CREATE INDEX IF NOT EXISTS spawns_x_z ON spawns(game_x, game_z);
+"""
+
+
+def _has_rtree(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.rtree_probe USING rtree(id, a, b)")
+        conn.execute("DROP TABLE temp.rtree_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ShopStore:
+    """
+    お店とスポーンの SQLite ストア。
+    with ShopStore(path) as store: ... で使う（抜けるときに閉じる）。path に ":memory:" も使える。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # トランザクションは transaction() で明示的に張る
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.rtree = _has_rtree(self.conn)
+        self.conn.executescript(SCHEMA + (RTREE_SCHEMA if self.rtree else FALLBACK_SCHEMA))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "ShopStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """1回のトランザクション（例外が出たらすべて取り消す）"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # ------------------------------------------------------------
+    # meta
+    # ------------------------------------------------------------
+
+    def set_meta(self, key: str, value: Any):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # ------------------------------------------------------------
+    # お店
+    # ------------------------------------------------------------
+
+    def upsert_shops(self, shops: Iterable[Dict[str, Any]], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """お店（shops_raw.json の1件の辞書）を osm_id ごとに追加・置き換える（1回のトランザクション）。返り値: 件数"""
+        count = 0
+        with self.transaction() as conn:
+            for chunk in _chunks(shops, batch_size):
+                shop_rows = []
+                tag_rows = []
+                # 同じ osm_id が続けて来たら後のものを使う
+                for shop in {shop["osm_id"]: shop for shop in chunk}.values():
+                    extra = {key: value for key, value in shop.items() if key not in SHOP_COLUMNS and key != "tags"}
+                    shop_rows.append((
+                        shop["osm_id"], shop["name"], shop.get("name_en"), shop["category"], shop["lat"], shop["lng"],
+                        json.dumps(extra, ensure_ascii=False) if extra else None,
+                    ))
+                    for position, (key, value) in enumerate(shop.get("tags", {}).items()):
+                        tag_rows.append((shop["osm_id"], position, key, value))
+                # 行の置き換えで R 木の行が変わらないように、DELETE + INSERT ではなく UPSERT にする
+                conn.executemany(
+                    "INSERT INTO shops(osm_id, name, name_en, category, lat, lng, extra) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(osm_id) DO UPDATE SET name = excluded.name, name_en = excluded.name_en, "
+                    "category = excluded.category, lat = excluded.lat, lng = excluded.lng, extra = excluded.extra",
+                    shop_rows
+                )
+                conn.executemany("DELETE FROM tags WHERE osm_id = ?", [(row[0],) for row in shop_rows])
+                conn.executemany("INSERT INTO tags(osm_id, position, key, value) VALUES (?, ?, ?, ?)", tag_rows)
+                count += len(shop_rows)
+        return count
+
+    def delete_shops(self, osm_ids: Iterable[int]) -> int:
+        """お店とそのタグを削除する。返り値: 削除した件数"""
+        rows = [(osm_id,) for osm_id in osm_ids]
+        with self.transaction() as conn:
+            # rowcount はトリガー（R 木）での削除を数えない
+            deleted = conn.executemany("DELETE FROM shops WHERE osm_id = ?", rows).rowcount
+            conn.executemany("DELETE FROM tags WHERE osm_id = ?", rows)
+        return deleted
+
+    def _shop_rows(self, where: str = "", params: Tuple[Any, ...] = ()) -> List[Dict[str, Any]]:
+        shops = self.conn.execute(
+            f"SELECT osm_id, name, name_en, category, lat, lng, extra FROM shops {where} ORDER BY name, osm_id",
+            params
+        ).fetchall()
+        if not shops:
+            return []
+        tags: Dict[int, Dict[str, str]] = {}
+        ids = [row[0] for row in shops]
+        # SQLite の変数の上限（古い版は 999）を超えないように分けて引く
+        for chunk in _chunks(ids, 500):
+            marks = ",".join("?" * len(chunk))
+            for osm_id, key, value in self.conn.execute(
+                f"SELECT osm_id, key, value FROM tags WHERE osm_id IN ({marks}) ORDER BY osm_id, position", chunk
+            ):
+                tags.setdefault(osm_id, {})[key] = value
+        result = []
+        for osm_id, name, name_en, category, lat, lng, extra in shops:
+            shop = {
+                "osm_id": osm_id, "name": name, "name_en": name_en, "category": category,
+                "lat": lat, "lng": lng, "tags": tags.get(osm_id, {}),
+            }
+            if extra:
+                shop.update(json.loads(extra))
+            result.append(shop)
+        return result
+
+    def shop(self, osm_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._shop_rows("WHERE osm_id = ?", (osm_id,))
+        return rows[0] if rows else None
+
+    def shops(self) -> List[Dict[str, Any]]:
+        """すべてのお店（名前順。fetch_shops.py の shops_raw.json と同じ順）"""
+        return self._shop_rows()
+
+    def shops_in_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Dict[str, Any]]:
+        """緯度経度の矩形（境界を含む）にあるお店（名前順）"""
+        params = (min_lat, max_lat, min_lng, max_lng)
+        exact = "lat BETWEEN ? AND ? AND lng BETWEEN ? AND ?"
+        if self.rtree:
+            # R 木の座標は float32 に丸められているので、R 木で候補を絞ってから元の値で確かめる
+            return self._shop_rows(
+                "WHERE osm_id IN (SELECT id FROM shop_rtree WHERE max_lat >= ? AND min_lat <= ? "
+                f"AND max_lng >= ? AND min_lng <= ?) AND {exact}",
+                params + params
+            )
+        return self._shop_rows(f"WHERE {exact}", params)
+
+    def count_shops(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM shops").fetchone()[0]
+
+    # ------------------------------------------------------------
+    # スポーン
+    # ------------------------------------------------------------
+
+    def upsert_spawns(
+        self,
+        output: str,
+        spawns: Iterable[Dict[str, Any]],
+        replace: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> int:
+        """
+        スポーンを id ごとに追加・置き換える（1回のトランザクション）。
+        既存のスポーンは書き出しの順（seq）を保ち、新しいスポーンは末尾に付く。
+        replace=True なら output のスポーンをすべてこの内容にする（convert_shops.py の出力と同じ順になる）。
+        返り値: 件数
+        """
+        count = 0
+        with self.transaction() as conn:
+            if replace:
+                conn.execute("DELETE FROM spawns WHERE output = ?", (output,))
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM spawns WHERE output = ?", (output,)).fetchone()[0]
+            for chunk in _chunks(spawns, batch_size):
+                rows = []
+                for spawn in chunk:
+                    seq += 1
+                    rows.append((
+                        spawn["id"], output, _spawn_osm_id(spawn["id"]), seq, spawn["gameX"], spawn["gameZ"],
+                        json.dumps(spawn, ensure_ascii=False),
+                    ))
+                conn.executemany(
+                    "INSERT INTO spawns(id, output, osm_id, seq, game_x, game_z, data) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET output = excluded.output, osm_id = excluded.osm_id, "
+                    "game_x = excluded.game_x, game_z = excluded.game_z, data = excluded.data",
+                    rows
+                )
+                count += len(rows)
+        return count
+
+    def delete_spawns(self, ids: Iterable[str]) -> int:
+        rows = [(spawn_id,) for spawn_id in ids]
+        with self.transaction() as conn:
+            return conn.executemany("DELETE FROM spawns WHERE id = ?", rows).rowcount
+
+    def iter_spawns(self, output: str) -> Iterator[Dict[str, Any]]:
+        """output のスポーンを書き出しの順に1件ずつ返す"""
+        cursor = self.conn.execute("SELECT data FROM spawns WHERE output = ? ORDER BY seq", (output,))
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def spawns_in_box(
+        self,
+        min_x: float,
+        min_z: float,
+        max_x: float,
+        max_z: float,
+        output: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """ゲーム座標の矩形（境界を含む）にあるスポーン（output ごと・書き出しの順）"""
+        params: Tuple[Any, ...] = (min_x, max_x, min_z, max_z)
+        where = "game_x BETWEEN ? AND ? AND game_z BETWEEN ? AND ?"
+        if self.rtree:
+            where = (
+                "rowid IN (SELECT id FROM spawn_rtree WHERE max_x >= ? AND min_x <= ? "
+                f"AND max_z >= ? AND min_z <= ?) AND {where}"
+            )
+            params = params + params
+        if output is not None:
+            where += " AND output = ?"
+            params = params + (output,)
+        cursor = self.conn.execute(f"SELECT data FROM spawns WHERE {where} ORDER BY output, seq", params)
+        return [json.loads(data) for (data,) in cursor]
+
+    def count_spawns(self, output: Optional[str] = None) -> int:
+        if output is None:
+            return self.conn.execute("SELECT COUNT(*) FROM spawns").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM spawns WHERE output = ?", (output,)).fetchone()[0]
+
+    def export_spawns(self, output: str, path: str, transform_params: Optional[Dict[str, Any]] = None) -> int:
+        """output のスポーンを convert_shops.py と同じ形式の JSON に書き出す。返り値: 件数"""
+        if transform_params is None:
+            transform_params = self.get_meta("transform", {})
+        writer = SpawnJsonWriter(path, SPAWN_OUTPUTS[output]["description"], transform_params)
+        try:
+            for spawn in self.iter_spawns(output):
+                writer.write(spawn)
+        finally:
+            writer.close()
+        return writer.count
+
+    # ------------------------------------------------------------
+    # JSON からの取り込み
+    # ------------------------------------------------------------
+
+    def import_shops_raw(self, path: str) -> int:
+        """shops_raw.json のお店を取り込む（同じ osm_id は置き換える）。返り値: 件数"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return self.upsert_shops(data.get("shops", []))
+
+    def import_spawns(self, output: str, path: str) -> int:
+        """スポーン JSON を取り込む（output のスポーンはすべてこの内容になる）。変換パラメータも記録する"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        count = self.upsert_spawns(output, data.get("spawns", []), replace=True)
+        if "transform" in data:
+            self.set_meta("transform", data["transform"])
+        return count
+
+
+def _spawn_osm_id(spawn_id: str) -> Optional[int]:
+    """スポーンの id（food_123 / equip_123）からお店の osm_id を取り出す"""
+    tail = spawn_id.rsplit("_", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+class SpawnStoreWriter:
+    """
+    convert_shops.py の書き出し先（sink）。スポーンを溜めておき、close() でストアの output の内容をまとめて置き換える
+    （SpawnPackWriter と同じく、書き込みは1回のトランザクション）。
+    """
+
+    def __init__(self, store: ShopStore, output: str, transform_params: Dict[str, Any]):
+        self.store = store
+        self.output = output
+        self.transform_params = transform_params
+        self.spawns: List[Dict[str, Any]] = []
+
+    def write(self, spawn: Dict[str, Any]):
+        self.spawns.append(spawn)
+
+    def close(self):
+        count = self.store.upsert_spawns(self.output, self.spawns, replace=True)
+        self.store.set_meta("transform", self.transform_params)
+        print(f"保存完了: {self.store.path} の {self.output} ({count} 件)")
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), "data")
+
+    def parse_box(text: str) -> Tuple[float, float, float, float]:
+        values = tuple(float(v) for v in text.split(","))
+        if len(values) != 4:
+            raise argparse.ArgumentTypeError("4つの数をカンマ区切りで指定してください")
+        return values
+
+    parser = argparse.ArgumentParser(description="お店とスポーンの SQLite ストア（取り込み・範囲検索・書き出し）")
+    parser.add_argument("--db", default=os.path.join(data_dir, "shops.sqlite"), help="データベースのパス")
+    parser.add_argument("--import-shops", nargs="*", default=None, metavar="JSON",
+                        help="shops_raw.json を取り込む（複数指定可。省略時は data/shops_raw.json）")
+    parser.add_argument("--import-spawns", action="store_true", help="data/food_spawns.json と equipment_spawns.json を取り込む")
+    parser.add_argument("--bbox", type=parse_box, default=None, metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+                        help="緯度経度の矩形にあるお店を表示する")
+    parser.add_argument("--box", type=parse_box, default=None, metavar="MIN_X,MIN_Z,MAX_X,MAX_Z",
+                        help="ゲーム座標の矩形にあるスポーンを表示する")
+    parser.add_argument("--export", default=None, metavar="DIR", help="スポーンを JSON（food_spawns.json 等）に書き出す")
+    parser.add_argument("--show", type=int, default=10, help="表示する件数")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("お店とスポーンの SQLite ストア")
+    print("=" * 50)
+
+    with ShopStore(args.db) as store:
+        print(f"\nデータベース: {args.db}（空間インデックス: {'R 木' if store.rtree else 'B 木（rtree なし）'}）")
+
+        if args.import_shops is not None:
+            for path in args.import_shops or [os.path.join(data_dir, "shops_raw.json")]:
+                start = time.perf_counter()
+                count = store.import_shops_raw(path)
+                print(f"取り込み: {path} ({count} 件, {(time.perf_counter() - start) * 1000:.0f} ms)")
+        if args.import_spawns:
+            for name, output in SPAWN_OUTPUTS.items():
+                path = os.path.join(data_dir, f"{output['filename']}.json")
+                if os.path.exists(path):
+                    count = store.import_spawns(name, path)
+                    print(f"取り込み: {path} ({count} 件)")
+
+        spawn_counts = " / ".join(f"{name} {store.count_spawns(name)} 件" for name in SPAWN_OUTPUTS)
+        print(f"お店: {store.count_shops()} 件 / スポーン: {spawn_counts}")
+
+        if args.bbox:
+            start = time.perf_counter()
+            shops = store.shops_in_bbox(*args.bbox)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"\n緯度経度 {args.bbox} のお店: {len(shops)} 件 ({elapsed:.1f} ms)")
+            for shop in shops[:args.show]:
+                print(f"  - {shop['name']} ({shop['category']}) {shop['lat']:.6f}, {shop['lng']:.6f}")
+
+        if args.box:
+            start = time.perf_counter()
+            spawns = store.spawns_in_box(*args.box)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"\nゲーム座標 {args.box} のスポーン: {len(spawns)} 件 ({elapsed:.1f} ms)")
+            for spawn in spawns[:args.show]:
+                print(f"  - {spawn['id']} ({spawn['gameX']:.1f}, {spawn['gameZ']:.1f})")
+
+        if args.export:
+            os.makedirs(args.export, exist_ok=True)
+            for name, output in SPAWN_OUTPUTS.items():
+                store.export_spawns(name, os.path.join(args.export, f"{output['filename']}.json"))
@@ -0,0 +1,240 @@
+"""
+お店情報の列指向テーブル（広い範囲の shops_raw.json 用）
+
+Shop を1件ずつ辞書やオブジェクトで持つと、件数が増えたときにタグのキー・値の文字列の繰り返しがメモリとファイルの大半を占める。
+ShopTable は列ごとの型付き配列に詰め、文字列（名前・タグのキーと値）は文字列表に1回だけ持って番号で参照する。
+カテゴリは小さな列挙（番号 uint8）で持つ。
+
+shops_raw.json と同じ形式で読み書きでき、同じ内容なら同じバイト列になる（往復で変わらない）。
+dedupe_shops.py の source_osm_ids や、未知のキーもそのまま保つ。
+fetch_shops.save_shops_raw はこのテーブルで書き出し、convert_shops.load_shops_raw はこのテーブルに読み込む。
+"""
+
+import json
+import os
+from array import array
+from typing import Dict, Any, List, Iterator, Iterable, Tuple
+
+from convert_shops import CATEGORY_TO_FOOD_TYPE, CATEGORY_TO_EQUIPMENT
+from fetch_shops import Shop
+from overpass_stream import iter_overpass_elements
+
+# カテゴリの列挙の初期値（対応表にあるカテゴリ。これ以外はテーブルごとに追加する）
+SHOP_CATEGORIES = tuple(CATEGORY_TO_FOOD_TYPE) + tuple(CATEGORY_TO_EQUIPMENT) + ("other",)
+
+# Shop のフィールド（shops_raw.json の1件のキーの順）
+SHOP_FIELDS = ("osm_id", "name", "name_en", "category", "lat", "lng", "tags")
+
+
+class StringTable:
+    """文字列の表（同じ文字列は1回だけ持ち、番号で参照する）"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, text: str) -> int:
+        index = self._index.get(text)
+        if index is None:
+            index = len(self.strings)
+            self._index[text] = index
+            self.strings.append(text)
+        return index
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class ShopTable:
+    """
+    お店の列指向テーブル。
+    タグは CSR 形式: お店 i のタグは tag_keys / tag_values の [tag_offsets[i], tag_offsets[i+1]) の範囲。
+    name_en がないお店は -1。source_osm_ids などほとんどのお店にないキーは番号 → 値の辞書で持つ。
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.categories: List[str] = list(SHOP_CATEGORIES)
+        self._category_index = {c: i for i, c in enumerate(self.categories)}
+        self.osm_ids = array("q")
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.names = array("I")
+        self.names_en = array("i")
+        self.category_codes = array("B")
+        self.tag_offsets = array("I", [0])
+        self.tag_keys = array("I")
+        self.tag_values = array("I")
+        self.extras: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.osm_ids)
+
+    def _category_code(self, category: str) -> int:
+        code = self._category_index.get(category)
+        if code is None:
+            code = len(self.categories)
+            if code > 255:
+                raise ValueError("カテゴリが多すぎます（256 種類まで）")
+            self._category_index[category] = code
+            self.categories.append(category)
+        return code
+
+    def append(self, shop: Dict[str, Any]):
+        """shops_raw.json の1件（辞書）を追加する"""
+        self.osm_ids.append(shop["osm_id"])
+        self.lats.append(shop["lat"])
+        self.lngs.append(shop["lng"])
+        self.names.append(self.strings.add(shop["name"]))
+        name_en = shop.get("name_en")
+        self.names_en.append(-1 if name_en is None else self.strings.add(name_en))
+        self.category_codes.append(self._category_code(shop["category"]))
+        for key, value in shop.get("tags", {}).items():
+            self.tag_keys.append(self.strings.add(key))
+            self.tag_values.append(self.strings.add(value))
+        self.tag_offsets.append(len(self.tag_keys))
+        extra = {key: value for key, value in shop.items() if key not in SHOP_FIELDS}
+        if extra:
+            self.extras[len(self.osm_ids) - 1] = extra
+
+    def append_shop(self, shop: Shop):
+        """Shop を追加する"""
+        self.append({field: getattr(shop, field) for field in SHOP_FIELDS})
+
+    def tags(self, i: int) -> Dict[str, str]:
+        strings = self.strings
+        return {
+            strings[self.tag_keys[k]]: strings[self.tag_values[k]]
+            for k in range(self.tag_offsets[i], self.tag_offsets[i + 1])
+        }
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """i 番目のお店を shops_raw.json の1件（辞書）として返す"""
+        name_en = self.names_en[i]
+        row = {
+            "osm_id": self.osm_ids[i],
+            "name": self.strings[self.names[i]],
+            "name_en": None if name_en < 0 else self.strings[name_en],
+            "category": self.categories[self.category_codes[i]],
+            "lat": self.lats[i],
+            "lng": self.lngs[i],
+            "tags": self.tags(i),
+        }
+        row.update(self.extras.get(i, {}))
+        return row
+
+    def shop(self, i: int) -> Shop:
+        """i 番目のお店を Shop として返す"""
+        row = self.row(i)
+        return Shop(*(row[field] for field in SHOP_FIELDS))
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.row(i)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.row(i)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> "ShopTable":
+        table = cls()
+        for row in rows:
+            table.append(row)
+        return table
+
+    @classmethod
+    def from_shops(cls, shops: Iterable[Shop]) -> "ShopTable":
+        table = cls()
+        for shop in shops:
+            table.append_shop(shop)
+        return table
+
+
+# ============================================================
+# 読み書き（shops_raw.json と同じ形式）
+# ============================================================
+
+def load_shop_table(path: str) -> Tuple[Dict[str, Any], ShopTable]:
+    """
+    shops_raw.json を読み込む。返り値: (shops 以外のキー, テーブル)
+    "shops" は overpass_stream で1件ずつ読みながらテーブルに詰めるので、全件の辞書のリストは作らない。
+    """
+    header: Dict[str, Any] = {}
+    with open(path, 'rb') as f:
+        table = ShopTable.from_rows(iter_overpass_elements(f, header, array_key="shops"))
+    return header, table
+
+
+def save_shop_table(table: ShopTable, path: str, header: Dict[str, Any]):
+    """
+    shops_raw.json と同じ形式で保存する（1件ずつ書き出すので全件の辞書を作らない）。
+    json.dump(..., indent=2) と同じバイト列になる。"shops" は最後のキーとして書き、"count" は件数に合わせる。
+    """
+    header = {key: value for key, value in header.items() if key != "shops"}
+    if "count" in header:
+        header["count"] = len(table)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        text = json.dumps(header, ensure_ascii=False, indent=2)
+        if not len(table):
+            f.write((text[:-2] + ',\n  "shops": []\n}') if header else '{\n  "shops": []\n}')
+        else:
+            f.write((text[:-2] + ',\n  "shops": [') if header else '{\n  "shops": [')
+            for i in range(len(table)):
+                item = json.dumps(table.row(i), ensure_ascii=False, indent=2).replace("\n", "\n    ")
+                f.write(("," if i else "") + "\n    " + item)
+            f.write("\n  ]\n}")
+    os.replace(tmp_path, path)
+    print(f"保存完了: {path} ({len(table)} 件)")
+
+
+# ============================================================
+# 使用例・テスト（shops_raw.json → テーブル → JSON の往復確認とメモリ比較）
+# ============================================================
+
+if __name__ == "__main__":
+    import tempfile
+    import tracemalloc
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(os.path.dirname(script_dir), "data", "shops_raw.json")
+
+    print("=" * 50)
+    print("お店情報の列指向テーブル")
+    print("=" * 50)
+
+    if not os.path.exists(path):
+        print(f"\nスキップ: {path} が見つかりません")
+        raise SystemExit(0)
+    with open(path, 'rb') as f:
+        original = f.read()
+
+    tracemalloc.start()
+    rows = json.loads(original.decode("utf-8"))["shops"]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    header, table = load_shop_table(path)
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"\nお店: {len(table)} 件 / 文字列: {len(table.strings)} 種類 / タグ: {len(table.tag_keys)} 個")
+    print(f"メモリ: 辞書 {dict_bytes:,} bytes → テーブル {table_bytes:,} bytes")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, "shops_raw.json")
+        save_shop_table(table, out_path, header)
+        with open(out_path, 'rb') as f:
+            restored = f.read()
+    same = restored.rstrip(b"\n") == original.rstrip(b"\n") and list(table) == rows
+    print(f"往復一致: {'OK' if same else 'NG'}")
+    if not same:
+        raise SystemExit(1)
@@ -0,0 +1,379 @@
+"""
+スポーン位置の空間インデックス（静的な KD 木）と検証
+
+food_spawns.json / equipment_spawns.json（またはバイナリ形式 .bin）の gameX / gameZ から KD 木を作り、
+最近傍（k 件）・半径内・矩形内の問い合わせに答える。点の並べ替えと分割軸だけを型付き配列で持つ。
+
+検証（python spawn_index.py）:
+  - 間隔: 各スポーンの最も近い別のスポーンまでの距離。--min-spacing 未満の組を数える
+  - 建物: 当たり判定インデックス（build_collision_index.py の city_collision.bin）の AABB の中に入ったスポーン。
+    平たい・街全体に広がる AABB（地面・道路）は除き、groundY があれば屋根の上のスポーンは数えない
+  - 分布: --district-size 四方の区画ごとのスポーン数。空の区画・混み合った区画
+どれも KD 木の問い合わせなので全体で O(n log n)（建物は AABB 1個につき O(log n + 該当数)）。
+"""
+
+import heapq
+import json
+import math
+import os
+import random
+from array import array
+from typing import Dict, Any, List, Tuple, Sequence, Iterator, Optional
+
+from build_collision_index import is_building_box, DEFAULT_MIN_HEIGHT, DEFAULT_MAX_FOOTPRINT
+
+# 葉にまとめる点の数（これ以下の範囲は総当たりで調べる）
+DEFAULT_LEAF_SIZE = 8
+DEFAULT_MIN_SPACING = 2.0
+DEFAULT_DISTRICT_SIZE = 100.0
+# groundY が AABB の上面からこの範囲内なら屋根の上にいる（中ではない）とみなす
+ROOF_TOLERANCE = 0.5
+
+
+class SpawnIndex:
+    """
+    2次元（gameX, gameZ）の静的な KD 木。
+    点は木の順に並べ替えて xs / zs に持ち、ids に元の番号を持つ。
+    範囲 [lo, hi) の節の分割点は mid = (lo + hi) // 2 で、分割軸は axes[mid]（0: X, 1: Z）。
+    """
+
+    def __init__(self, points: Sequence[Tuple[float, float]], leaf_size: int = DEFAULT_LEAF_SIZE):
+        self.leaf_size = max(1, leaf_size)
+        order = list(range(len(points)))
+        self.axes = array("b", bytes(len(points)))
+
+        # 範囲の広い方の軸で並べ替え、中央で分ける
+        stack = [(0, len(points))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= self.leaf_size:
+                continue
+            part = order[lo:hi]
+            xs = [points[i][0] for i in part]
+            zs = [points[i][1] for i in part]
+            axis = 0 if max(xs) - min(xs) >= max(zs) - min(zs) else 1
+            part.sort(key=lambda i: points[i][axis])
+            order[lo:hi] = part
+            mid = (lo + hi) // 2
+            self.axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+        self.ids = array("I", order)
+        self.xs = array("d", (points[i][0] for i in order))
+        self.zs = array("d", (points[i][1] for i in order))
+        # 元の番号 → 木の順の位置
+        self.positions = array("I", bytes(4 * len(order)))
+        for p, i in enumerate(order):
+            self.positions[i] = p
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def point(self, i: int) -> Tuple[float, float]:
+        """元の番号 i の点の (x, z)"""
+        p = self.positions[i]
+        return self.xs[p], self.zs[p]
+
+    def nearest(self, x: float, z: float, k: int = 1, exclude: Optional[int] = None) -> List[Tuple[float, int]]:
+        """(x, z) に近い順に k 件の (距離, 元の番号)。exclude の番号は除く"""
+        heap: List[Tuple[float, int]] = []  # (-距離の2乗, 元の番号) の最大ヒープ
+        xs, zs, ids, axes = self.xs, self.zs, self.ids, self.axes
+        leaf_size = self.leaf_size
+
+        def consider(p):
+            if ids[p] == exclude:
+                return
+            d2 = (xs[p] - x) ** 2 + (zs[p] - z) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, ids[p]))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, ids[p]))
+
+        def search(lo, hi):
+            if hi - lo <= leaf_size:
+                for p in range(lo, hi):
+                    consider(p)
+                return
+            mid = (lo + hi) // 2
+            diff = (x - xs[mid]) if axes[mid] == 0 else (z - zs[mid])
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(*near)
+            consider(mid)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                search(*far)
+
+        if k > 0:
+            search(0, len(ids))
+        return sorted((math.sqrt(-d2), i) for d2, i in heap)
+
+    def within(self, x: float, z: float, radius: float) -> List[int]:
+        """(x, z) から radius 以内（境界を含む）の元の番号"""
+        r2 = radius * radius
+        xs, zs, ids = self.xs, self.zs, self.ids
+        return [
+            ids[p] for p in self._range(x - radius, z - radius, x + radius, z + radius)
+            if (xs[p] - x) ** 2 + (zs[p] - z) ** 2 <= r2
+        ]
+
+    def in_box(self, min_x: float, min_z: float, max_x: float, max_z: float) -> List[int]:
+        """XZ の矩形（境界を含む）に入る元の番号。city.js の AABB の判定と同じく境界上も含む"""
+        ids = self.ids
+        return [ids[p] for p in self._range(min_x, min_z, max_x, max_z)]
+
+    def _range(self, min_x: float, min_z: float, max_x: float, max_z: float) -> Iterator[int]:
+        """矩形に入る点の位置（木の順）"""
+        xs, zs, axes = self.xs, self.zs, self.axes
+        leaf_size = self.leaf_size
+        stack = [(0, len(self.ids))]
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= leaf_size:
+                for p in range(lo, hi):
+                    if min_x <= xs[p] <= max_x and min_z <= zs[p] <= max_z:
+                        yield p
+                continue
+            mid = (lo + hi) // 2
+            if min_x <= xs[mid] <= max_x and min_z <= zs[mid] <= max_z:
+                yield mid
+            split, low, high = (xs[mid], min_x, max_x) if axes[mid] == 0 else (zs[mid], min_z, max_z)
+            # 分割点と同じ座標の点は両側にありうるので等号を含める
+            if low <= split:
+                stack.append((lo, mid))
+            if high >= split:
+                stack.append((mid + 1, hi))
+
+
+# ============================================================
+# 読み込み
+# ============================================================
+
+def load_spawns(path: str) -> List[Dict[str, Any]]:
+    """スポーンを読み込む（.json または spawn_pack.py のバイナリ形式 .bin）"""
+    if path.endswith(".bin"):
+        from spawn_pack import read_spawn_pack
+        return read_spawn_pack(path)["spawns"]
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("spawns", [])
+
+
+def spawn_points(spawns: Sequence[Dict[str, Any]]) -> List[Tuple[float, float]]:
+    return [(s["gameX"], s["gameZ"]) for s in spawns]
+
+
+def spawn_label(spawn: Dict[str, Any]) -> str:
+    """表示用の名前（食べ物は name、装備は shopName）"""
+    return spawn.get("shopName") or spawn.get("name") or spawn.get("id", "")
+
+
+# ============================================================
+# 検証
+# ============================================================
+
+def check_spacing(index: SpawnIndex, min_spacing: float) -> Dict[str, Any]:
+    """各スポーンの最も近い別のスポーンまでの距離と、min_spacing 未満の組"""
+    nearest = []
+    close_pairs = []
+    for p in range(len(index)):
+        i = index.ids[p]
+        found = index.nearest(index.xs[p], index.zs[p], 1, exclude=i)
+        if not found:
+            continue
+        d = found[0][0]
+        nearest.append(d)
+        if d < min_spacing:
+            # 互いに最近傍とは限らないので半径内の全員と組にする（組は番号の小さい側で1回だけ数える）
+            for j in index.within(index.xs[p], index.zs[p], min_spacing):
+                x, z = index.point(j)
+                dist = math.hypot(index.xs[p] - x, index.zs[p] - z)
+                if j > i and dist < min_spacing:
+                    close_pairs.append((dist, i, j))
+    nearest.sort()
+    close_pairs.sort()
+    return {
+        "min": nearest[0] if nearest else math.nan,
+        "median": nearest[len(nearest) // 2] if nearest else math.nan,
+        "mean": sum(nearest) / len(nearest) if nearest else math.nan,
+        "pairs": close_pairs,
+    }
+
+
+def check_buildings(
+    index: SpawnIndex,
+    boxes: array,
+    ground_y: Optional[Sequence[Optional[float]]] = None,
+    min_height: float = DEFAULT_MIN_HEIGHT,
+    max_footprint: float = DEFAULT_MAX_FOOTPRINT
+) -> List[Tuple[int, int]]:
+    """
+    建物の AABB（float32 ×6 の並び）に入ったスポーン: (スポーンの番号, AABB の番号) の一覧。
+    地面・道路らしい AABB（is_building_box でないもの）は調べない。
+    ground_y（スポーンの番号順の groundY。ないものは None）を渡すと、高さが AABB の minY〜maxY の間のときだけ数える
+    （屋根の上のスポーンは中ではない）。
+    """
+    found = []
+    for b in range(len(boxes) // 6):
+        o = b * 6
+        box = tuple(boxes[o:o + 6])
+        if not is_building_box(box, min_height, max_footprint):
+            continue
+        for i in index.in_box(box[0], box[2], box[3], box[5]):
+            y = ground_y[i] if ground_y is not None else None
+            if y is not None and not box[1] <= y < box[4] - ROOF_TOLERANCE:
+                continue
+            found.append((i, b))
+    found.sort()
+    return found
+
+
+def check_coverage(
+    points: Sequence[Tuple[float, float]],
+    district_size: float,
+    bounds: Optional[Tuple[float, float, float, float]] = None
+) -> Dict[Tuple[int, int], int]:
+    """
+    district_size 四方の区画ごとのスポーン数。bounds (min_x, min_z, max_x, max_z) の範囲の区画は
+    スポーンがなくても 0 として含める（省略時はスポーンの範囲）。
+    """
+    if bounds is None:
+        if not points:
+            return {}
+        bounds = (
+            min(x for x, _ in points), min(z for _, z in points),
+            max(x for x, _ in points), max(z for _, z in points),
+        )
+    min_x, min_z, max_x, max_z = bounds
+    cols = math.floor((max_x - min_x) / district_size) + 1
+    rows = math.floor((max_z - min_z) / district_size) + 1
+    counts = {(i, j): 0 for j in range(rows) for i in range(cols)}
+    for x, z in points:
+        i = math.floor((x - min_x) / district_size)
+        j = math.floor((z - min_z) / district_size)
+        if (i, j) in counts:
+            counts[(i, j)] += 1
+    return counts
+
+
+def verify_spawn_index(index: SpawnIndex, samples: int = 200, seed: int = 0) -> int:
+    """
+    ランダムな地点で最近傍・半径内・矩形内の問い合わせを総当たりと比べる。
+    返り値: 一致しなかった問い合わせの数
+    """
+    if not len(index):
+        return 0
+    rng = random.Random(seed)
+    points = [index.point(i) for i in range(len(index))]
+    x0, x1 = min(p[0] for p in points), max(p[0] for p in points)
+    z0, z1 = min(p[1] for p in points), max(p[1] for p in points)
+    span = max(x1 - x0, z1 - z0, 1.0)
+    mismatches = 0
+    for _ in range(samples):
+        x = rng.uniform(x0 - span * 0.1, x1 + span * 0.1)
+        z = rng.uniform(z0 - span * 0.1, z1 + span * 0.1)
+        # 距離は KD 木と同じ式で求める（math.hypot とは最後の桁が違うことがある）
+        dist = sorted((math.sqrt((px - x) ** 2 + (pz - z) ** 2), i) for i, (px, pz) in enumerate(points))
+        k = rng.randint(1, 5)
+        if [d for d, _ in index.nearest(x, z, k)] != [d for d, _ in dist[:k]]:
+            mismatches += 1
+        r = rng.uniform(0, span * 0.1)
+        if sorted(index.within(x, z, r)) != sorted(i for d, i in dist if d <= r):
+            mismatches += 1
+        w = rng.uniform(0, span * 0.2)
+        expected = [i for i, (px, pz) in enumerate(points) if x <= px <= x + w and z <= pz <= z + w]
+        if sorted(index.in_box(x, z, x + w, z + w)) != expected:
+            mismatches += 1
+    return mismatches
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from build_collision_index import load_collision_index
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(script_dir)
+    data_dir = os.path.join(project_dir, "data")
+
+    parser = argparse.ArgumentParser(description="スポーン位置を検証する（間隔・建物との重なり・区画ごとの分布）")
+    parser.add_argument(
+        "spawns", nargs="*",
+        default=[os.path.join(data_dir, "food_spawns.json"), os.path.join(data_dir, "equipment_spawns.json")],
+        help="スポーンのファイル（.json / .bin）。複数指定するとまとめて調べる",
+    )
+    parser.add_argument("--min-spacing", type=float, default=DEFAULT_MIN_SPACING, help="これより近いスポーンの組を報告する（メートル）")
+    parser.add_argument(
+        "--collision", default=os.path.join(project_dir, "gltf", "city_collision.bin"),
+        help="建物の AABB（build_collision_index.py の出力。なければ建物の検証は省略）",
+    )
+    parser.add_argument("--district-size", type=float, default=DEFAULT_DISTRICT_SIZE, help="分布を数える区画の大きさ（メートル）")
+    parser.add_argument("--show", type=int, default=10, help="報告する組・スポーンの数")
+    parser.add_argument("--check", type=int, default=0, help="総当たりと比べる問い合わせの数（0 で確認しない）")
+    parser.add_argument("--strict", action="store_true", help="近すぎる組や建物の中のスポーンがあれば終了コード 1 で終わる")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("スポーン位置の検証")
+    print("=" * 50)
+
+    spawns: List[Dict[str, Any]] = []
+    for path in args.spawns:
+        if not os.path.exists(path):
+            print(f"\nスキップ: {path} が見つかりません")
+            continue
+        loaded = load_spawns(path)
+        print(f"\n{os.path.basename(path)}: {len(loaded)} 件")
+        spawns.extend(loaded)
+    if not spawns:
+        print("\nエラー: スポーンがありません")
+        raise SystemExit(1)
+
+    start = time.perf_counter()
+    points = spawn_points(spawns)
+    index = SpawnIndex(points)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"\nKD 木: {len(index)} 点（{build_ms:.1f} ms）")
+
+    if args.check:
+        mismatches = verify_spawn_index(index, args.check)
+        print(f"総当たりとの一致確認: {'OK' if not mismatches else f'NG（{mismatches} 件）'}")
+        if mismatches:
+            raise SystemExit(1)
+
+    failed = False
+
+    print("\n【間隔】")
+    spacing = check_spacing(index, args.min_spacing)
+    print(f"  最も近いスポーンまで: 最小 {spacing['min']:.2f} m / 中央値 {spacing['median']:.2f} m / 平均 {spacing['mean']:.2f} m")
+    print(f"  {args.min_spacing:g} m 未満の組: {len(spacing['pairs'])}")
+    for dist, i, j in spacing["pairs"][:args.show]:
+        print(f"    {dist:6.2f} m  {spawn_label(spawns[i])} / {spawn_label(spawns[j])}")
+    failed = failed or bool(spacing["pairs"])
+
+    print("\n【建物】")
+    if os.path.exists(args.collision):
+        collision = load_collision_index(args.collision)
+        inside = check_buildings(index, collision.boxes, [spawn.get("groundY") for spawn in spawns])
+        print(f"  建物の AABB（{collision.num_boxes} 個）の中のスポーン: {len({i for i, _ in inside})}")
+        for i, b in inside[:args.show]:
+            top = collision.boxes[b * 6 + 4]
+            print(f"    {spawn_label(spawns[i])} ({spawns[i]['gameX']}, {spawns[i]['gameZ']}) 高さ {top:.1f} m の AABB #{b}")
+        failed = failed or bool(inside)
+    else:
+        print(f"  スキップ: {args.collision} が見つかりません（build_collision_index.py で作成）")
+
+    print("\n【分布】")
+    coverage = check_coverage(points, args.district_size)
+    counts = sorted(coverage.values())
+    empty = sum(1 for c in counts if c == 0)
+    print(f"  {args.district_size:g} m 四方の区画: {len(counts)} / 空の区画: {empty}")
+    print(f"  区画あたり: 中央値 {counts[len(counts) // 2]} / 最大 {counts[-1]}")
+    busiest = sorted(coverage.items(), key=lambda item: (-item[1], item[0]))[:min(args.show, 5)]
+    for (i, j), count in busiest:
+        print(f"    区画 ({i}, {j}): {count} 件")
+
+    if args.strict and failed:
+        raise SystemExit(1)
@@ -0,0 +1,311 @@
+"""
+スポーンデータのバイナリ形式（food_spawns.bin / equipment_spawns.bin）
+
+food_spawns.json / equipment_spawns.json と同じ内容を列指向で詰めて保存する。
+キー名の繰り返しや transform の reference_points を持たないので、サイズと読み込み時間が件数に比例する。
+
+レイアウト（リトルエンディアン、各列は 8 バイト境界に揃える）:
+  ヘッダ      magic "GSPN", version u16, kind u8 (1=食べ物, 2=装備), 列数 u8,
+              件数 u32, 文字列数 u32, 説明文の文字列番号 u32
+  transform   scale_x, scale_z, offset_x, offset_z (float64 ×4)
+  文字列表    オフセット u32[文字列数 + 1]、続けて UTF-8 本体（重複なし）
+  列          スキーマの順に1列ずつ
+                osm_id: uint64            （id は "food_" / "equip_" + osm_id で復元）
+                f32 / f64: float32 / float64
+                str: uint32（文字列表の番号）
+                enum: 辞書の長さ u8 ＋ 辞書 u32[長さ]（文字列表の番号）＋ 値 uint8[件数]
+"""
+
+import json
+import struct
+import sys
+from array import array
+from typing import Dict, Any, List, Tuple
+
+MAGIC = b"GSPN"
+FORMAT_VERSION = 1
+
+KIND_FOOD = 1
+KIND_EQUIPMENT = 2
+
+_HEADER = struct.Struct("<4sHBBIII")
+_TRANSFORM = struct.Struct("<4d")
+TRANSFORM_KEYS = ("scale_x", "scale_z", "offset_x", "offset_z")
+
+# (フィールド名, 列の型, 読み込み時に丸める桁数)
+SCHEMAS: Dict[int, List[Tuple[str, str, int]]] = {
+    KIND_FOOD: [
+        ("id", "osm_id", 0),
+        ("name", "str", 0),
+        ("nameJa", "str", 0),
+        ("category", "enum", 0),
+        ("cuisine", "str", 0),
+        ("foodTypeId", "enum", 0),
+        ("gameX", "f32", 2),
+        ("gameZ", "f32", 2),
+        ("realLat", "f64", 0),
+        ("realLng", "f64", 0),
+    ],
+    KIND_EQUIPMENT: [
+        ("id", "osm_id", 0),
+        ("shopName", "str", 0),
+        ("shopNameJa", "str", 0),
+        ("shopCategory", "enum", 0),
+        ("itemCategory", "enum", 0),
+        ("typeId", "enum", 0),
+        ("name", "enum", 0),
+        ("nameJa", "enum", 0),
+        ("effect", "enum", 0),
+        ("value", "f32", 4),
+        ("color", "enum", 0),
+        ("icon", "enum", 0),
+        ("gameX", "f32", 2),
+        ("gameZ", "f32", 2),
+        ("realLat", "f64", 0),
+        ("realLng", "f64", 0),
+    ],
+}
+
+ID_PREFIXES = {KIND_FOOD: "food_", KIND_EQUIPMENT: "equip_"}
+
+_TYPECODES = {"osm_id": "Q", "f32": "f", "f64": "d", "str": "I"}
+
+
+def _to_le(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data: memoryview) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _pad(out: bytearray, align: int = 8):
+    out.extend(b"\0" * (-len(out) % align))
+
+
+class _StringTable:
+    """重複を除いた文字列表"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+
+def pack_spawns(
+    kind: int,
+    spawns: List[Dict[str, Any]],
+    transform_params: Dict[str, Any],
+    description: str = ""
+) -> bytes:
+    """スポーン（JSONと同じ辞書のリスト）をバイナリに詰める"""
+    schema = SCHEMAS[kind]
+    prefix = ID_PREFIXES[kind]
+    strings = _StringTable()
+    description_index = strings.add(description)
+
+    columns = []
+    for field, col_type, _ in schema:
+        values = [spawn[field] for spawn in spawns]
+        if col_type == "osm_id":
+            ids = array("Q")
+            for v in values:
+                if not v.startswith(prefix):
+                    raise ValueError(f"id の形式が不正です: {v}")
+                ids.append(int(v[len(prefix):]))
+            columns.append((col_type, ids, None))
+        elif col_type == "str":
+            columns.append((col_type, array("I", [strings.add(v) for v in values]), None))
+        elif col_type == "enum":
+            dictionary: Dict[str, int] = {}
+            codes = array("B")
+            for v in values:
+                code = dictionary.setdefault(v, len(dictionary))
+                # 辞書の長さを1バイトで書くので、種類は255まで
+                if len(dictionary) > 255:
+                    raise ValueError(f"{field} の種類が多すぎます（255種類まで）")
+                codes.append(code)
+            entries = array("I", [strings.add(v) for v in dictionary])
+            columns.append((col_type, codes, entries))
+        else:
+            columns.append((col_type, array(_TYPECODES[col_type], values), None))
+
+    out = bytearray(_HEADER.pack(
+        MAGIC, FORMAT_VERSION, kind, len(schema), len(spawns), len(strings.strings), description_index
+    ))
+    out.extend(_TRANSFORM.pack(*(float(transform_params[k]) for k in TRANSFORM_KEYS)))
+
+    encoded = [s.encode("utf-8") for s in strings.strings]
+    offsets = array("I", [0])
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    out.extend(_to_le(offsets))
+    out.extend(b"".join(encoded))
+
+    for col_type, values, entries in columns:
+        _pad(out)
+        if col_type == "enum":
+            out.append(len(entries))
+            _pad(out, 4)
+            out.extend(_to_le(entries))
+        out.extend(_to_le(values))
+    return bytes(out)
+
+
+def unpack_spawns(data: bytes) -> Dict[str, Any]:
+    """バイナリを読み込み、JSONと同じ形（version, description, transform, count, spawns）で返す"""
+    view = memoryview(data)
+    magic, version, kind, num_columns, count, num_strings, description_index = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("スポーンデータのバイナリ形式ではありません")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"未対応のバージョンです: {version}")
+    schema = SCHEMAS[kind]
+    if num_columns != len(schema):
+        raise ValueError("列数がスキーマと一致しません")
+    pos = _HEADER.size
+    transform = dict(zip(TRANSFORM_KEYS, _TRANSFORM.unpack_from(view, pos)))
+    pos += _TRANSFORM.size
+
+    offsets = _from_le("I", view[pos:pos + 4 * (num_strings + 1)])
+    pos += 4 * (num_strings + 1)
+    blob = bytes(view[pos:pos + offsets[-1]])
+    strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(num_strings)]
+    pos += offsets[-1]
+
+    prefix = ID_PREFIXES[kind]
+    spawns: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for field, col_type, decimals in schema:
+        pos += -pos % 8
+        if col_type == "enum":
+            dict_len = view[pos]
+            pos += 1
+            pos += -pos % 4
+            entries = _from_le("I", view[pos:pos + 4 * dict_len])
+            pos += 4 * dict_len
+            dictionary = [strings[i] for i in entries]
+            values = [dictionary[code] for code in view[pos:pos + count]]
+            pos += count
+        else:
+            typecode = _TYPECODES[col_type]
+            size = array(typecode).itemsize * count
+            raw = _from_le(typecode, view[pos:pos + size])
+            pos += size
+            if col_type == "osm_id":
+                values = [f"{prefix}{v}" for v in raw]
+            elif col_type == "str":
+                values = [strings[i] for i in raw]
+            elif decimals:
+                values = [round(v, decimals) for v in raw]
+            else:
+                values = raw.tolist()
+        for spawn, value in zip(spawns, values):
+            spawn[field] = value
+
+    return {
+        "version": "1.0",
+        "description": strings[description_index],
+        "transform": transform,
+        "count": count,
+        "spawns": spawns,
+    }
+
+
+def write_spawn_pack(
+    path: str,
+    kind: int,
+    spawns: List[Dict[str, Any]],
+    transform_params: Dict[str, Any],
+    description: str = ""
+):
+    """スポーンをバイナリ形式で保存"""
+    data = pack_spawns(kind, spawns, transform_params, description)
+    with open(path, 'wb') as f:
+        f.write(data)
+    print(f"保存完了: {path} ({len(spawns)} 件, {len(data):,} bytes)")
+
+
+def read_spawn_pack(path: str) -> Dict[str, Any]:
+    """バイナリ形式のスポーンを読み込み"""
+    with open(path, 'rb') as f:
+        return unpack_spawns(f.read())
+
+
+# ============================================================
+# 使用例・テスト（JSON → バイナリ → 復元 の往復確認）
+# ============================================================
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), "data")
+
+    print("=" * 50)
+    print("スポーンデータ バイナリ形式の往復テスト")
+    print("=" * 50)
+
+    ok = True
+    for filename, kind in (("food_spawns.json", KIND_FOOD), ("equipment_spawns.json", KIND_EQUIPMENT)):
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            print(f"\nスキップ: {path} が見つかりません")
+            continue
+        with open(path, 'rb') as f:
+            json_bytes = f.read()
+
+        start = time.perf_counter()
+        data = json.loads(json_bytes.decode("utf-8"))
+        json_ms = (time.perf_counter() - start) * 1000
+
+        packed = pack_spawns(kind, data["spawns"], data["transform"], data.get("description", ""))
+
+        start = time.perf_counter()
+        restored = unpack_spawns(packed)
+        pack_ms = (time.perf_counter() - start) * 1000
+
+        # groundY（bake_heightfield.py が書き込む）などスキーマにないキーはバイナリに含まれない
+        fields = [field for field, _, _ in SCHEMAS[kind]]
+        expected = [{k: spawn[k] for k in fields} for spawn in data["spawns"]]
+        same = restored["spawns"] == expected and all(
+            restored["transform"][k] == data["transform"][k] for k in TRANSFORM_KEYS
+        )
+        ok = ok and same
+        print(f"\n{filename}: {len(data['spawns'])} 件")
+        print(f"  サイズ: JSON {len(json_bytes):,} bytes → バイナリ {len(packed):,} bytes")
+        print(f"  読み込み: JSON {json_ms:.2f} ms / バイナリ {pack_ms:.2f} ms")
+        print(f"  往復一致: {'OK' if same else 'NG'}")
+
+    # 辞書の長さ（1バイト）の境界: 255種類は往復でき、256種類はエラーになる
+    print("\nenum 列の種類数の境界:")
+    for n, should_pack in ((255, True), (256, False)):
+        spawns = [
+            {"id": f"food_{i + 1}", "name": f"店{i}", "nameJa": "", "category": f"cat{i}", "cuisine": "",
+             "foodTypeId": "speedUp", "gameX": 0.0, "gameZ": 0.0, "realLat": 35.0, "realLng": 139.0}
+            for i in range(n)
+        ]
+        transform = dict.fromkeys(TRANSFORM_KEYS, 1.0)
+        try:
+            same = unpack_spawns(pack_spawns(KIND_FOOD, spawns, transform))["spawns"] == spawns
+        except ValueError:
+            same = False
+        passed = same == should_pack
+        ok = ok and passed
+        print(f"  {n} 種類: {'往復一致' if same else 'エラー'} → {'OK' if passed else 'NG'}")
+
+    if not ok:
+        raise SystemExit(1)
@@ -0,0 +1,496 @@
+"""
+GLB のブロック分割（Blender 不要・マルチコア）
+
+blender_scripts/split_city_blocks.py と同じ規則で city.glb の面をブロックに振り分け、
+ブロックごとのノード（Block_ix_iy）を持つ GLB を書き出す。--per-block ならブロックごとに1ファイル。
+データ更新のたびにバッチで分割し直せるよう、ブロックの切り出しは空間的にまとまった範囲ごとにプロセスプールで並列に行う。
+
+規則（split_mesh_into_blocks と同じ）:
+  Blender（Z-up）の X・Y でグリッドを作る。glTF（Y-up）では Blender の Y = -Z。
+  原点はノード（Blender のオブジェクト）ごとの全頂点の AABB の最小（Blender の X・Y）、
+  面の中心（頂点の平均）が入るセルに面を割り当てる。別のノードの同じ (ix, iy) は1つのブロックにまとめる。
+  ※ GLB の面は三角形なので、Blender 上で四角形だった面は中心の位置がわずかに異なる場合がある
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # 分割には NumPy が必要（実行時にエラーにする）
+    np = None
+
+from glb_reader import GlbFile, load_glb, iter_mesh_nodes, primitive_triangles, write_glb
+
+DEFAULT_BLOCK_SIZE = 50.0
+# 1ワーカーあたりのタスク数（ブロックの大きさの偏りをならすため、ワーカー数より多めに分ける）
+TASKS_PER_WORKER = 4
+# 1ワーカーあたりの送り済み・未完了のタスク数の上限（範囲の切り出しを先に作りすぎないため）
+PENDING_PER_WORKER = 2
+
+COMPONENT_FLOAT = 5126
+COMPONENT_UINT16 = 5123
+COMPONENT_UINT32 = 5125
+TARGET_ARRAY_BUFFER = 34962
+TARGET_ELEMENT_ARRAY_BUFFER = 34963
+
+
+@dataclass
+class SceneTriangles:
+    """シーン内の全三角形をワールド座標にまとめたもの"""
+    positions: "np.ndarray"   # (頂点数, 3) float32
+    normals: "np.ndarray"     # (頂点数, 3) float32（法線のないプリミティブは 0）
+    uvs: "np.ndarray"         # (頂点数, 2) float32（UV のないプリミティブは 0）
+    triangles: "np.ndarray"   # (三角形数, 3) int64
+    tri_group: "np.ndarray"   # (三角形数,) 三角形の属するグループ
+    groups: List[Tuple[Optional[int], bool, bool]]  # グループ = (マテリアル, 法線あり, UV あり)
+    vertex_node: "np.ndarray"  # (頂点数,) 頂点の属するノード（シーン内のメッシュノードの順番）
+
+
+def load_scene(glb) -> SceneTriangles:
+    """GLB のシーンを1つの三角形の集合にまとめる（頂点はワールド座標、法線も回転済み）"""
+    meshes = glb.gltf.get("meshes", [])
+    positions, normals, uvs, triangles, tri_group, vertex_node = [], [], [], [], [], []
+    groups: Dict[Tuple[Optional[int], bool, bool], int] = {}
+    base = 0
+    for node, (_, mesh_index, world) in enumerate(iter_mesh_nodes(glb)):
+        normal_matrix = np.linalg.inv(world[:3, :3]).T
+        for primitive in meshes[mesh_index].get("primitives", []):
+            attributes = primitive.get("attributes", {})
+            if "POSITION" not in attributes:
+                continue
+            tris = primitive_triangles(glb, primitive)
+            if not len(tris):
+                continue
+            pos = glb.accessor_float(attributes["POSITION"])
+            count = len(pos)
+            positions.append((pos @ world[:3, :3].T + world[:3, 3]).astype(np.float32))
+
+            has_normal = "NORMAL" in attributes
+            if has_normal:
+                n = glb.accessor_float(attributes["NORMAL"]) @ normal_matrix.T
+                length = np.linalg.norm(n, axis=1, keepdims=True)
+                normals.append((n / np.where(length > 0, length, 1.0)).astype(np.float32))
+            else:
+                normals.append(np.zeros((count, 3), dtype=np.float32))
+            has_uv = "TEXCOORD_0" in attributes
+            if has_uv:
+                uvs.append(glb.accessor_float(attributes["TEXCOORD_0"]).astype(np.float32))
+            else:
+                uvs.append(np.zeros((count, 2), dtype=np.float32))
+
+            group = groups.setdefault((primitive.get("material"), has_normal, has_uv), len(groups))
+            triangles.append(tris + base)
+            tri_group.append(np.full(len(tris), group, dtype=np.int32))
+            vertex_node.append(np.full(count, node, dtype=np.int32))
+            base += count
+
+    if not triangles:
+        raise ValueError("GLB に三角形がありません")
+    return SceneTriangles(
+        np.concatenate(positions),
+        np.concatenate(normals),
+        np.concatenate(uvs),
+        np.concatenate(triangles),
+        np.concatenate(tri_group),
+        list(groups),
+        np.concatenate(vertex_node),
+    )
+
+
+def assign_blocks(scene: SceneTriangles, block_size_x: float, block_size_y: float) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    三角形ごとのブロック番号 (ix, iy) を split_mesh_into_blocks と同じ規則で求める。
+    split_mesh_into_blocks はオブジェクトごとに呼ばれ、原点はそのオブジェクトの全頂点の AABB の最小なので、
+    ここでも原点はノードごとに求める（glTF のノード = 書き出し前の Blender のオブジェクト）。
+    """
+    nodes = int(scene.vertex_node.max()) + 1
+    min_x = np.full(nodes, np.inf)
+    max_z = np.full(nodes, -np.inf)
+    np.minimum.at(min_x, scene.vertex_node, scene.positions[:, 0])
+    np.maximum.at(max_z, scene.vertex_node, scene.positions[:, 2])
+    tri_node = scene.vertex_node[scene.triangles[:, 0]]
+    centers = scene.positions[scene.triangles].astype(np.float64).mean(axis=1)
+    # Blender の X = glTF の X、Blender の Y = -glTF の Z
+    ix = ((centers[:, 0] - min_x[tri_node]) // block_size_x).astype(np.int64)
+    iy = ((max_z[tri_node] - centers[:, 2]) // block_size_y).astype(np.int64)
+    return ix, iy
+
+
+def group_blocks(ix: "np.ndarray", iy: "np.ndarray") -> Dict[Tuple[int, int], "np.ndarray"]:
+    """dict[(ix, iy)] -> 三角形インデックス（昇順）"""
+    keys = ix * (int(iy.max()) + 1) + iy
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    blocks = {}
+    for tri_indices in np.split(order, starts[1:]):
+        t = tri_indices[0]
+        blocks[(int(ix[t]), int(iy[t]))] = tri_indices
+    return blocks
+
+
+def split_regions(blocks: Dict[Tuple[int, int], "np.ndarray"], num_tasks: int) -> List[List[Tuple[int, int]]]:
+    """
+    ブロックを (ix, iy) 順に並べ、三角形数がほぼ均等になるよう連続した範囲に分ける。
+    ix 順なので、1つのタスクは X 方向に隣り合った列の帯（空間的にまとまった範囲）になる。
+    """
+    keys = sorted(blocks)
+    total = sum(len(blocks[k]) for k in keys)
+    target = max(1, total // max(1, num_tasks))
+    regions, current, size = [], [], 0
+    for key in keys:
+        current.append(key)
+        size += len(blocks[key])
+        if size >= target:
+            regions.append(current)
+            current, size = [], 0
+    if current:
+        regions.append(current)
+    return regions
+
+
+def block_name(key: Tuple[int, int]) -> str:
+    return "Block_" + "_".join(str(k) for k in key)
+
+
+def region_scene(scene: SceneTriangles, tri_indices: "np.ndarray") -> SceneTriangles:
+    """
+    三角形の一部だけを持つシーン（ワーカーに渡す範囲の切り出し）。
+    頂点は使われているものだけを元の順のまま残すので、extract_block の結果は元のシーンで切り出したものと同じ。
+    """
+    verts, local = np.unique(scene.triangles[tri_indices], return_inverse=True)
+    return SceneTriangles(
+        scene.positions[verts],
+        scene.normals[verts],
+        scene.uvs[verts],
+        local.reshape(-1, 3),
+        scene.tri_group[tri_indices],
+        scene.groups,
+        scene.vertex_node[verts],
+    )
+
+
+def region_task(scene: SceneTriangles, blocks: Dict[Tuple[int, int], "np.ndarray"], region: List[Tuple[int, int]]):
+    """範囲のタスク: (範囲のシーン, [((ix, iy), 範囲のシーンでの三角形インデックス), ...])"""
+    parts = [blocks[key] for key in region]
+    sub = region_scene(scene, np.concatenate(parts))
+    ends = np.cumsum([len(p) for p in parts])
+    return sub, [(key, np.arange(end - len(p), end)) for key, p, end in zip(region, parts, ends)]
+
+
+def material_source(glb: GlbFile) -> GlbFile:
+    """
+    GlbBuilder がマテリアルとテクスチャをコピーするのに必要な部分だけの GLB（頂点・インデックスのバッファは持たない）。
+    --per-block のワーカーに渡す（プロセスに渡せるよう bin は bytes にする）。
+    """
+    gltf = {k: json_copy(glb.gltf[k]) for k in ("materials", "textures", "images", "samplers", "extensionsUsed") if k in glb.gltf}
+    views = glb.gltf.get("bufferViews", [])
+    data = bytearray()
+    new_views = []
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            view = views[image["bufferView"]]
+            start = view.get("byteOffset", 0)
+            new_views.append({"buffer": 0, "byteOffset": len(data), "byteLength": view["byteLength"]})
+            data.extend(glb.bin[start:start + view["byteLength"]])
+            image["bufferView"] = len(new_views) - 1
+    gltf["bufferViews"] = new_views
+    return GlbFile(gltf, bytes(data))
+
+
+# ============================================================
+# ブロックの切り出し（ワーカー）
+# ============================================================
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(source: Optional[GlbFile], out_dir: Optional[str]):
+    """
+    ワーカーの設定。シーンは読まない（範囲ごとの頂点・三角形はタスクで受け取る）。
+    source はブロックごとの GLB に写すマテリアルとテクスチャ（material_source。out_dir がなければ不要）。
+    """
+    _worker.update(source=source, out_dir=out_dir)
+
+
+def extract_block(scene: SceneTriangles, tri_indices: "np.ndarray") -> List[Dict[str, Any]]:
+    """
+    ブロックの三角形をグループ（マテリアル・属性の組み合わせ）ごとのプリミティブに切り出す。
+    頂点は使われているものだけを残して番号を振り直す。
+    """
+    primitives = []
+    groups = scene.tri_group[tri_indices]
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    for part in np.split(tri_indices[order], starts[1:]):
+        material, has_normal, has_uv = scene.groups[int(scene.tri_group[part[0]])]
+        verts, local = np.unique(scene.triangles[part], return_inverse=True)
+        index_dtype = np.uint16 if len(verts) < 65536 else np.uint32
+        primitives.append({
+            "material": material,
+            "positions": scene.positions[verts],
+            "normals": scene.normals[verts] if has_normal else None,
+            "uvs": scene.uvs[verts] if has_uv else None,
+            "indices": local.reshape(-1).astype(index_dtype),
+        })
+    return primitives
+
+
+def _extract_region(task: Tuple[SceneTriangles, List[Tuple[Tuple[int, int], "np.ndarray"]]]):
+    """
+    範囲のタスク（region_task）のブロックを切り出す。out_dir があればブロックごとの GLB をワーカーで書き出して面数だけ返し、
+    なければ切り出した配列を返す（1ファイルにまとめるのは親プロセス）。
+    """
+    scene, region = task
+    results = []
+    for key, tri_indices in region:
+        primitives = extract_block(scene, tri_indices)
+        faces = sum(len(p["indices"]) // 3 for p in primitives)
+        if _worker["out_dir"]:
+            builder = GlbBuilder(_worker["source"])
+            builder.add_block(block_name(key), primitives)
+            write_glb(os.path.join(_worker["out_dir"], f"{block_name(key)}.glb"), *builder.build())
+            results.append((key, faces, None))
+        else:
+            results.append((key, faces, primitives))
+    return results
+
+
+# ============================================================
+# GLB の組み立て
+# ============================================================
+
+def texture_refs(value, found):
+    """マテリアルの中の "xxxTexture": {"index": n} をすべて集める"""
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if k.endswith("Texture") and isinstance(v, dict) and "index" in v:
+                found.append(v)
+            texture_refs(v, found)
+    elif isinstance(value, list):
+        for v in value:
+            texture_refs(v, found)
+
+
+class GlbBuilder:
+    """ブロックのノードを持つ GLB を組み立てる。マテリアルとテクスチャは使われているものだけ元の GLB からコピーする"""
+
+    def __init__(self, source):
+        self.source = source
+        self.bin = bytearray()
+        self.gltf: Dict[str, Any] = {
+            "asset": {"version": "2.0", "generator": "split_glb_blocks.py"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "accessors": [],
+            "bufferViews": [],
+        }
+        self._materials: Dict[int, int] = {}
+        self._textures: Dict[int, int] = {}
+        self._images: Dict[int, int] = {}
+        self._samplers: Dict[int, int] = {}
+
+    def _view(self, data: bytes, target: Optional[int] = None, stride: Optional[int] = None) -> int:
+        self.bin.extend(b"\0" * (-len(self.bin) % 4))
+        view = {"buffer": 0, "byteOffset": len(self.bin), "byteLength": len(data)}
+        if stride is not None:
+            view["byteStride"] = stride
+        if target is not None:
+            view["target"] = target
+        self.bin.extend(data)
+        self.gltf["bufferViews"].append(view)
+        return len(self.gltf["bufferViews"]) - 1
+
+    def _accessor(self, values: "np.ndarray", component: int, type_: str, target: int, bounds: bool = False) -> int:
+        accessor = {
+            "bufferView": self._view(np.ascontiguousarray(values).astype(values.dtype.newbyteorder("<")).tobytes(), target),
+            "componentType": component,
+            "count": len(values),
+            "type": type_,
+        }
+        if bounds:
+            accessor["min"] = values.min(axis=0).tolist()
+            accessor["max"] = values.max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def _copy(self, kind: str, index: int, table: Dict[int, int], convert) -> int:
+        if index not in table:
+            item = json_copy(self.source.gltf[kind][index])
+            convert(item)
+            self.gltf.setdefault(kind, []).append(item)
+            table[index] = len(self.gltf[kind]) - 1
+        return table[index]
+
+    def _image(self, index: int) -> int:
+        def convert(image):
+            if "bufferView" in image:
+                view = self.source.gltf["bufferViews"][image["bufferView"]]
+                start = view.get("byteOffset", 0)
+                image["bufferView"] = self._view(bytes(self.source.bin[start:start + view["byteLength"]]))
+        return self._copy("images", index, self._images, convert)
+
+    def _texture(self, index: int) -> int:
+        def convert(texture):
+            if "source" in texture:
+                texture["source"] = self._image(texture["source"])
+            if "sampler" in texture:
+                texture["sampler"] = self._copy("samplers", texture["sampler"], self._samplers, lambda s: None)
+        return self._copy("textures", index, self._textures, convert)
+
+    def _material(self, index: int) -> int:
+        def convert(material):
+            refs = []
+            texture_refs(material, refs)
+            for ref in refs:
+                ref["index"] = self._texture(ref["index"])
+        return self._copy("materials", index, self._materials, convert)
+
+    def add_block(self, name: str, primitives: List[Dict[str, Any]]):
+        """ブロックを1つのノード（メッシュ）として追加する"""
+        mesh_primitives = []
+        for p in primitives:
+            attributes = {"POSITION": self._accessor(p["positions"], COMPONENT_FLOAT, "VEC3", TARGET_ARRAY_BUFFER, True)}
+            if p["normals"] is not None:
+                attributes["NORMAL"] = self._accessor(p["normals"], COMPONENT_FLOAT, "VEC3", TARGET_ARRAY_BUFFER)
+            if p["uvs"] is not None:
+                attributes["TEXCOORD_0"] = self._accessor(p["uvs"], COMPONENT_FLOAT, "VEC2", TARGET_ARRAY_BUFFER)
+            component = COMPONENT_UINT16 if p["indices"].dtype == np.uint16 else COMPONENT_UINT32
+            primitive = {
+                "attributes": attributes,
+                "indices": self._accessor(p["indices"], component, "SCALAR", TARGET_ELEMENT_ARRAY_BUFFER),
+            }
+            if p["material"] is not None:
+                primitive["material"] = self._material(p["material"])
+            mesh_primitives.append(primitive)
+        self.gltf["meshes"].append({"name": name, "primitives": mesh_primitives})
+        self.gltf["nodes"].append({"name": name, "mesh": len(self.gltf["meshes"]) - 1})
+        self.gltf["scenes"][0]["nodes"].append(len(self.gltf["nodes"]) - 1)
+
+    def build(self) -> Tuple[Dict[str, Any], bytes]:
+        used = self.source.gltf.get("extensionsUsed")
+        if used and "materials" in self.gltf:
+            self.gltf["extensionsUsed"] = list(used)
+        return self.gltf, bytes(self.bin)
+
+
+def json_copy(value):
+    """JSON の値の深いコピー（マテリアルの中の参照を書き換えるため）"""
+    if isinstance(value, dict):
+        return {k: json_copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [json_copy(v) for v in value]
+    return value
+
+
+# ============================================================
+# 分割
+# ============================================================
+
+def _map_bounded(executor: ProcessPoolExecutor, fn, tasks: Iterator[Any], limit: int) -> List[Any]:
+    """
+    executor.map と同じく結果をタスクの順に返す。ただし未完了のタスクは limit 個までしか送らない
+    （executor.map はすべてのタスクを先に作って抱えるため、範囲の切り出しがシーン全体の分だけ溜まる）。
+    """
+    results: Dict[int, Any] = {}
+    pending = {}
+    for number, task in enumerate(tasks):
+        if len(pending) >= limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        pending[executor.submit(fn, task)] = number
+    for future in pending:
+        results[pending[future]] = future.result()
+    return [results[number] for number in range(len(results))]
+
+
+def split_glb(
+    glb_path: str,
+    out_path: str,
+    block_size_x: float = DEFAULT_BLOCK_SIZE,
+    block_size_y: float = DEFAULT_BLOCK_SIZE,
+    workers: int = 0,
+    per_block: bool = False
+) -> Dict[str, Any]:
+    """
+    GLB をブロックに分割して書き出す。per_block なら out_path はフォルダ（Block_ix_iy.glb を並べる）。
+    workers > 0 ならブロックの切り出しをプロセスプールで並列に行う（出力の中身は workers によらず同じ）。
+    GLB を読むのは親プロセスだけ。各ワーカーには範囲ごとの頂点・三角形（region_task）を渡すので、
+    ワーカーが持つのは処理中の範囲の分だけ（シーン全体を並列数だけ持たない）。
+    返り値: 統計（ブロック数・面数・ファイルサイズ）
+    """
+    if np is None:
+        raise RuntimeError("GLB の分割には NumPy が必要です（pip install numpy）")
+    out_dir = out_path if per_block else None
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    glb = load_glb(glb_path)
+    scene = load_scene(glb)
+    blocks = group_blocks(*assign_blocks(scene, block_size_x, block_size_y))
+    regions = split_regions(blocks, max(1, workers) * TASKS_PER_WORKER)
+    tasks = (region_task(scene, blocks, region) for region in regions)
+
+    initargs = (material_source(glb) if out_dir else None, out_dir)
+    if workers <= 0:
+        _init_worker(*initargs)
+        results = [r for task in tasks for r in _extract_region(task)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            parts = _map_bounded(executor, _extract_region, tasks, workers * PENDING_PER_WORKER)
+        results = [r for part in parts for r in part]
+
+    stats = {"blocks": len(results), "faces": sum(faces for _, faces, _ in results), "regions": len(regions)}
+    if per_block:
+        stats["bytes"] = sum(os.path.getsize(os.path.join(out_dir, f"{block_name(key)}.glb")) for key, _, _ in results)
+    else:
+        builder = GlbBuilder(glb)
+        for key, _, primitives in sorted(results, key=lambda r: r[0]):
+            builder.add_block(block_name(key), primitives)
+        stats["bytes"] = write_glb(out_path, *builder.build())
+    return stats
+
+
+# ============================================================
+# メイン処理
+# ============================================================
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(script_dir)
+    gltf_dir = os.path.join(project_dir, "gltf")
+
+    parser = argparse.ArgumentParser(description="city.glb を Blender なしでブロック分割する")
+    parser.add_argument("--glb", default=os.path.join(gltf_dir, "city.glb"), help="入力の GLB")
+    parser.add_argument("--out", default=None, help="出力先（省略時は city_blocks.glb、--per-block なら blocks フォルダ）")
+    parser.add_argument("--block-size", type=float, nargs=2, metavar=("X", "Y"),
+                        default=(DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE), help="ブロック幅（Blender の X・Y、メートル）")
+    parser.add_argument("--per-block", action="store_true", help="ブロックごとに1ファイルずつ書き出す")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並列数（0 で並列化しない）")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.join(os.path.dirname(args.glb), "blocks" if args.per_block else "city_blocks.glb")
+
+    print("=" * 50)
+    print("GLB のブロック分割")
+    print("=" * 50)
+
+    if not os.path.exists(args.glb):
+        print(f"\nエラー: {args.glb} が見つかりません")
+        raise SystemExit(1)
+
+    start = time.perf_counter()
+    stats = split_glb(args.glb, out_path, *args.block_size, workers=args.workers, per_block=args.per_block)
+    elapsed = time.perf_counter() - start
+    print(f"\n{stats['blocks']} ブロック / {stats['faces']:,} 面（{stats['regions']} 範囲に分けて処理）")
+    print(f"保存完了: {out_path} ({stats['bytes']:,} bytes, {elapsed:.2f} 秒)")